@@ -1,19 +1,30 @@
 from flask import Flask, request, jsonify
 from twilio.rest import Client as TwilioClient
+from twilio.http.http_client import TwilioHttpClient
 from dotenv import load_dotenv
 import os
-import sqlite3
 import logging
-from datetime import datetime, timedelta
+from datetime import date, datetime, timedelta
 import time
+from concurrent.futures import ThreadPoolExecutor
 
 # Imports des modules
+import http_client
+from llm_client import llm_client
+from food_parse_cache import food_parse_cache
+from food_store import food_store
+from image_preprocessing import get_image_stats
+from image_cache import image_cache
+from media_resolver import media_resolver
 from database import (
-    init_db, get_user_data, update_user_data, delete_user_data,
-    increment_message_count, is_user_premium, get_user_message_count, set_test_message_count
+    init_db, get_connection, update_user_data, get_user_message_count, set_test_message_count,
+    get_activity_by_day, count_active_users, get_user_counts
 )
-from nutrition_improved import analyze_food_request
-from utils import send_whatsapp_reply, get_help_message
+from message_context import MessageContext, get_message_db_stats
+from message_workers import WorkerPool, KeyedLocks, update_job_payload
+from message_dedup import MessageDeduplicator
+from nutrition_improved import analyze_food_request, text_parse_stats
+from utils import send_whatsapp_reply, get_help_message, reply_journal
 from config import current_config, get_environment_info, get_detection_info
 from nutrition_chat_improved import (
     is_conversation_message, 
@@ -44,7 +55,9 @@ def setup_logging():
 def setup_twilio():
     """Initialise le client Twilio"""
     try:
-        client = TwilioClient(current_config.TWILIO_ACCOUNT_SID, current_config.TWILIO_AUTH_TOKEN)
+        # Session HTTP keep-alive réutilisée entre les envois, avec timeout
+        http = TwilioHttpClient(pool_connections=True, timeout=http_client.HTTP_READ_TIMEOUT)
+        client = TwilioClient(current_config.TWILIO_ACCOUNT_SID, current_config.TWILIO_AUTH_TOKEN, http_client=http)
         logger.info("✅ Client Twilio initialisé")
         return client
     except Exception as e:
@@ -90,8 +103,10 @@ def is_rate_limited(phone_number):
     return False
 
 # ===== HANDLERS DE MESSAGES =====
-def handle_special_commands(text_content, from_number, user_data):
+def handle_special_commands(text_content, ctx):
     """Gère les commandes spéciales"""
+    from_number = ctx.phone_number
+    user_data = ctx.user_data
     text_lower = text_content.lower()
     
     if text_lower in ['/aide', '/help', '/?']:
@@ -104,7 +119,7 @@ def handle_special_commands(text_content, from_number, user_data):
         return True
     
     if text_lower == '/first_try':
-        restart_onboarding(from_number)
+        restart_onboarding(ctx)
         return True
     
     if text_lower == '/tim':
@@ -146,24 +161,13 @@ def reset_daily_data(from_number, user_data):
     })
     update_user_data(from_number, user_data)
 
-def restart_onboarding(from_number):
+def restart_onboarding(ctx):
     """Redémarre l'onboarding complet"""
-    delete_user_data(from_number)
-    
-    new_user_data = {
-        'onboarding_complete': False,
-        'onboarding_step': 'start',
-        'daily_calories': 0,
-        'daily_proteins': 0,
-        'daily_fats': 0,
-        'daily_carbs': 0,
-        'meals': []
-    }
-    update_user_data(from_number, new_user_data)
+    new_user_data = ctx.start_onboarding(reset=True)
     
     from simple_onboarding import handle_simple_onboarding
-    onboarding_message = handle_simple_onboarding(from_number, '/first_try', new_user_data)
-    send_whatsapp_reply(from_number, onboarding_message, twilio_client, current_config.TWILIO_PHONE_NUMBER)
+    onboarding_message = handle_simple_onboarding(ctx.phone_number, '/first_try', new_user_data)
+    send_whatsapp_reply(ctx.phone_number, onboarding_message, twilio_client, current_config.TWILIO_PHONE_NUMBER)
 
 def handle_onboarding(from_number, text_content, user_data):
     """Gère l'onboarding si pas terminé"""
@@ -180,64 +184,79 @@ def handle_onboarding(from_number, text_content, user_data):
         send_whatsapp_reply(from_number, f"Erreur onboarding: {e}", twilio_client, current_config.TWILIO_PHONE_NUMBER)
         return True
 
-def send_premium_reminder_if_needed(from_number, user_data):
+def send_premium_reminder_if_needed(ctx):
     """Envoie le message premium optimisé si l'utilisateur a dépassé 30 messages"""
+    user_data = ctx.user_data
+    
     # Ne pas envoyer pendant l'onboarding
     if not user_data.get('onboarding_complete', True):
         return False
     
     # Ne pas envoyer si l'utilisateur est premium
-    if is_user_premium(from_number):
+    if ctx.is_premium:
         return False
     
     # Vérifier si l'utilisateur a dépassé 30 messages
-    message_count = get_user_message_count(from_number)
-    if message_count > 30:
+    if ctx.message_count > 30:
         user_name = user_data.get('name', 'Utilisateur')
         premium_reminder = get_premium_reminder_before_response(user_name)
-        send_whatsapp_reply(from_number, premium_reminder, twilio_client, current_config.TWILIO_PHONE_NUMBER)
+        send_whatsapp_reply(ctx.phone_number, premium_reminder, twilio_client, current_config.TWILIO_PHONE_NUMBER)
         return True
     
     return False
 
-def handle_conversation(text_content, from_number, user_data):
+def handle_conversation(text_content, ctx):
     """Gère les messages de conversation"""
+    from_number = ctx.phone_number
+    
     if is_conversation_message(text_content):
         # Envoyer le rappel premium AVANT la réponse si nécessaire
-        send_premium_reminder_if_needed(from_number, user_data)
+        send_premium_reminder_if_needed(ctx)
         
-        response = chat_with_lea_natural(text_content, user_data)
+        response = chat_with_lea_natural(text_content, ctx.user_data)
         send_whatsapp_reply(from_number, response, twilio_client, current_config.TWILIO_PHONE_NUMBER)
         return True
     
     if is_nutrition_question(text_content):
         # Envoyer le rappel premium AVANT la réponse si nécessaire
-        send_premium_reminder_if_needed(from_number, user_data)
+        send_premium_reminder_if_needed(ctx)
         
-        response = chat_with_nutrition_expert(text_content, user_data)
+        response = chat_with_nutrition_expert(text_content, ctx.user_data)
         send_whatsapp_reply(from_number, response, twilio_client, current_config.TWILIO_PHONE_NUMBER)
         return True
     
     return False
 
-def handle_food_tracking(text_content, media_url, from_number):
+def handle_food_tracking(text_content, media_url, ctx):
     """Gère le tracking d'aliments avec message fusionné"""
-    food_data = analyze_food_request(text_content, media_url, lambda msg: logger.debug(msg))
+    from_number = ctx.phone_number
+    try:
+        food_data = analyze_food_request(text_content, media_url, lambda msg: logger.debug(msg))
+    except http_client.MediaRejectedError as e:
+        # Photo trop lourde ou pas une image (Twilio comme WhatsApp Business)
+        logger.warning(f"⚠️ Média refusé pour {from_number}: {e}")
+        send_premium_reminder_if_needed(ctx)
+        send_whatsapp_reply(
+            from_number, 
+            f"📸 Cette photo est trop lourde ou dans un format non supporté. Envoie une photo JPEG ou PNG de moins de {http_client.MEDIA_MAX_BYTES // (1024 * 1024)} Mo 🙏", 
+            twilio_client, 
+            current_config.TWILIO_PHONE_NUMBER
+        )
+        return
     
     if food_data:
-        update_user_nutrition(from_number, food_data)
-        user_data = get_user_data(from_number)
+        # Totaux du jour mis à jour en mémoire, écrits en fin de message
+        update_user_nutrition(ctx, food_data)
         
         # Envoyer le rappel premium AVANT la réponse si nécessaire
-        send_premium_reminder_if_needed(from_number, user_data)
+        send_premium_reminder_if_needed(ctx)
         
         # Message fusionné : Analyse + Bilan du jour
-        unified_message = format_unified_food_message(food_data, user_data)
+        unified_message = format_unified_food_message(food_data, ctx.user_data)
         send_whatsapp_reply(from_number, unified_message, twilio_client, current_config.TWILIO_PHONE_NUMBER)
     else:
         # Envoyer le rappel premium AVANT la réponse d'erreur si nécessaire
-        user_data = get_user_data(from_number)
-        send_premium_reminder_if_needed(from_number, user_data)
+        send_premium_reminder_if_needed(ctx)
         
         send_whatsapp_reply(
             from_number, 
@@ -246,17 +265,8 @@ def handle_food_tracking(text_content, media_url, from_number):
             current_config.TWILIO_PHONE_NUMBER
         )
 
-def update_user_nutrition(from_number, food_data):
-    """Met à jour les données nutritionnelles de l'utilisateur"""
-    current_data = get_user_data(from_number)
-    
-    # Calculer les nouvelles valeurs
-    new_calories = current_data.get('daily_calories', 0) + food_data['calories']
-    new_proteins = current_data.get('daily_proteins', 0) + food_data['proteines']
-    new_fats = current_data.get('daily_fats', 0) + food_data['lipides']
-    new_carbs = current_data.get('daily_carbs', 0) + food_data['glucides']
-    
-    # Créer l'objet repas
+def update_user_nutrition(ctx, food_data):
+    """Enregistre le repas et ajoute ses valeurs aux totaux du jour"""
     new_meal = {
         'name': food_data['name'],
         'time': food_data.get('time', ''),
@@ -266,18 +276,7 @@ def update_user_nutrition(from_number, food_data):
         'glucides': food_data['glucides']
     }
     
-    # Mettre à jour les données
-    current_meals = current_data.get('meals', [])
-    updated_data = current_data.copy()
-    updated_data.update({
-        'daily_calories': new_calories,
-        'daily_proteins': new_proteins,
-        'daily_fats': new_fats,
-        'daily_carbs': new_carbs,
-        'meals': current_meals + [new_meal]
-    })
-    
-    update_user_data(from_number, updated_data)
+    ctx.add_meal(new_meal)
 
 def format_response_message(food_data, user_data):
     """Formate le message de réponse"""
@@ -686,23 +685,9 @@ def format_unified_food_message(food_data, user_data):
 def init_sms_database():
     """Initialise la table pour stocker les SMS entrants"""
     try:
-        conn = sqlite3.connect(current_config.DATABASE_NAME)
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS incoming_sms (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                from_number TEXT NOT NULL,
-                to_number TEXT NOT NULL,
-                body TEXT,
-                timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
-                message_sid TEXT UNIQUE,
-                status TEXT DEFAULT 'received'
-            )
-        ''')
+        # La table incoming_sms et ses index font partie des migrations versionnées
+        init_db(current_config.DATABASE_NAME)
         
-        conn.commit()
-        conn.close()
         logger.info("✅ Table SMS initialisée")
     except Exception as e:
         logger.error(f"❌ Erreur init SMS DB: {e}")
@@ -710,17 +695,15 @@ def init_sms_database():
 def store_incoming_sms(from_number, to_number, body, message_sid):
     """Stocke un SMS entrant dans la base de données"""
     try:
-        conn = sqlite3.connect(current_config.DATABASE_NAME)
-        cursor = conn.cursor()
+        conn = get_connection(current_config.DATABASE_NAME)
         
-        cursor.execute('''
-            INSERT OR IGNORE INTO incoming_sms 
-            (from_number, to_number, body, message_sid)
-            VALUES (?, ?, ?, ?)
-        ''', (from_number, to_number, body, message_sid))
+        with conn:
+            conn.execute('''
+                INSERT OR IGNORE INTO incoming_sms 
+                (from_number, to_number, body, message_sid)
+                VALUES (?, ?, ?, ?)
+            ''', (from_number, to_number, body, message_sid))
         
-        conn.commit()
-        conn.close()
         logger.info(f"📨 SMS stocké: {from_number} -> {to_number}")
         return True
     except Exception as e:
@@ -730,7 +713,7 @@ def store_incoming_sms(from_number, to_number, body, message_sid):
 def get_recent_sms(limit=50):
     """Récupère les SMS récents"""
     try:
-        conn = sqlite3.connect(current_config.DATABASE_NAME)
+        conn = get_connection(current_config.DATABASE_NAME)
         cursor = conn.cursor()
         
         cursor.execute('''
@@ -751,7 +734,6 @@ def get_recent_sms(limit=50):
                 'status': row[5]
             })
         
-        conn.close()
         return sms_list
     except Exception as e:
         logger.error(f"❌ Erreur récupération SMS: {e}")
@@ -989,19 +971,19 @@ def sms_inbox():
     </html>
     '''
 
-def check_premium_limit(from_number, user_data):
+def check_premium_limit(ctx):
     """Vérifie si l'utilisateur a atteint la limite et gère le premium"""
     # Ne pas compter les messages d'onboarding
-    if not user_data.get('onboarding_complete', True):
+    if not ctx.user_data.get('onboarding_complete', True):
         return True  # Autoriser pendant l'onboarding
     
     # Vérifier si l'utilisateur est premium
-    if is_user_premium(from_number):
+    if ctx.is_premium:
         return True  # Utilisateur premium, pas de limite
     
-    # Incrémenter le compteur de messages
-    message_count = increment_message_count(from_number)
-    logger.info(f"💬 Message #{message_count} pour {from_number}")
+    # Incrémenter le compteur de messages (écrit en fin de message)
+    message_count = ctx.increment_message_count()
+    logger.info(f"💬 Message #{message_count} pour {ctx.phone_number}")
     
     # TOUJOURS autoriser le message, ne jamais bloquer
     return True
@@ -1029,41 +1011,52 @@ def whatsapp_business_webhook():
         if not payload:
             return "No payload", 400
         
-        # Parser le message Meta
-        from whatsapp_business_api import parse_whatsapp_business_webhook
-        message_data = parse_whatsapp_business_webhook(payload)
+        # Parser tous les messages du lot (Meta regroupe les messages sous forte charge)
+        from whatsapp_business_api import iter_whatsapp_business_messages
         
-        if not message_data:
-            return "No message data", 200
-        
-        # Extraire les informations
-        from_number = message_data.get("from_number")
-        text_content = message_data.get("text", "")
-        message_id = message_data.get("message_id")
-        media_url = message_data.get("media_url")
-        
-        if not from_number:
-            return "No sender", 400
-        
-        # Ajouter le préfixe whatsapp: pour compatibilité avec le code existant
-        from_number_formatted = f"whatsapp:+{from_number}"
-        
-        logger.info(f"📱 Message WhatsApp Business de {from_number}: '{text_content}'")
+        jobs = []
+        for message_data in iter_whatsapp_business_messages(payload):
+            # Extraire les informations
+            from_number = message_data.get("from_number")
+            text_content = message_data.get("text", "")
+            
+            if not from_number:
+                logger.warning(f"⚠️ Message WhatsApp Business sans expéditeur ignoré: {message_data.get('message_id')}")
+                continue
+            
+            logger.info(f"📱 Message WhatsApp Business de {from_number}: '{text_content}'")
+            
+            # Photo : téléchargement lancé tout de suite, en parallèle du chargement
+            # utilisateur et de la classification ; l'analyse reprendra le résultat
+            if message_data.get("type") == "image" and message_data.get("media_id"):
+                media_resolver.prefetch(message_data["media_id"])
+            
+            jobs.append({
+                # Ajouter le préfixe whatsapp: pour compatibilité avec le code existant
+                'from_number': f"whatsapp:+{from_number}",
+                'text': text_content,
+                'media_url': message_data.get("media_url"),
+                'media_type': message_data.get("mime_type"),
+                'message_id': message_data.get("message_id")
+            })
         
-        # Marquer le message comme lu
-        if message_id:
-            from whatsapp_business_api import whatsapp_business_client
-            whatsapp_business_client.mark_message_as_read(message_id)
+        if not jobs:
+            return "No message data", 200
         
-        # Traitement identique au webhook Twilio
-        return process_whatsapp_message(from_number_formatted, text_content, media_url)
+        # Traitement identique au webhook Twilio, pour chaque message du lot
+        dispatch_inbound_batch(jobs)
+        return '<Response/>', 200
         
     except Exception as e:
         logger.error(f"❌ Erreur webhook WhatsApp Business: {e}")
         return "Error", 500
 
-def process_whatsapp_message(from_number, text_content, media_url):
-    """Fonction commune pour traiter les messages WhatsApp (Twilio et Business API)"""
+def process_whatsapp_message(from_number, text_content, media_url, media_type=None, raise_errors=False):
+    """
+    Fonction commune pour traiter les messages WhatsApp (Twilio et Business API).
+    Avec raise_errors, une erreur est propagée sans réponse d'erreur ni écriture partielle,
+    pour que la file de jobs puisse rejouer le message.
+    """
     # Vérifications préliminaires
     if is_rate_limited(from_number):
         send_whatsapp_reply(
@@ -1074,78 +1067,19 @@ def process_whatsapp_message(from_number, text_content, media_url):
         )
         return '<Response/>', 429
     
+    ctx = None
     try:
-        # Récupérer/créer utilisateur
-        user_data = get_user_data(from_number)
-        is_new_user = False
-        
-        if not user_data:
-            # Nouvel utilisateur - créer avec onboarding non terminé
-            user_data = {
-                'onboarding_complete': False,
-                'onboarding_step': 'start',
-                'daily_calories': 0,
-                'daily_proteins': 0,
-                'daily_fats': 0,
-                'daily_carbs': 0,
-                'meals': []
-            }
-            update_user_data(from_number, user_data)
-            is_new_user = True
-        
-        # Si c'est un nouvel utilisateur OU si le message contient "join live-cold", démarrer l'onboarding
-        if is_new_user or (text_content and 'join live-cold' in text_content.lower()):
-            if not is_new_user:
-                # Si c'est "join live-cold", redémarrer complètement l'onboarding
-                delete_user_data(from_number)
-                user_data = {
-                    'onboarding_complete': False,
-                    'onboarding_step': 'start',
-                    'daily_calories': 0,
-                    'daily_proteins': 0,
-                    'daily_fats': 0,
-                    'daily_carbs': 0,
-                    'meals': []
-                }
-                update_user_data(from_number, user_data)
-            
-            from simple_onboarding import handle_simple_onboarding
-            onboarding_message = handle_simple_onboarding(from_number, 'start', user_data)
-            send_whatsapp_reply(from_number, onboarding_message, twilio_client, current_config.TWILIO_PHONE_NUMBER)
-            return '<Response/>', 200
-        
-        # Traitement par priorité
-        if handle_onboarding(from_number, text_content, user_data):
-            return '<Response/>', 200
-        
-        if handle_special_commands(text_content, from_number, user_data):
-            return '<Response/>', 200
-        
-        # Vérifier la limite premium AVANT de traiter le message
-        if not check_premium_limit(from_number, user_data):
-            return '<Response/>', 200  # Message bloqué, rappel premium envoyé
-        
-        # Messages vocaux (désactivés)
-        if not text_content and media_url and 'audio' in str(media_url):
-            send_whatsapp_reply(
-                from_number, 
-                "🎤 Messages vocaux bientôt disponibles ! Utilisez du texte ou une photo 📷", 
-                twilio_client, 
-                current_config.TWILIO_PHONE_NUMBER
-            )
-            return '<Response/>', 200
-        
-        # Classification et traitement
-        if text_content:
-            if handle_conversation(text_content, from_number, user_data):
-                return '<Response/>', 200
-        
-        # Tracking d'aliments par défaut
-        handle_food_tracking(text_content, media_url, from_number)
-        return '<Response/>', 200
+        # Charger tout l'état utilisateur en une requête
+        ctx = MessageContext(from_number)
+        return handle_message(ctx, text_content, media_url, media_type)
         
     except Exception as e:
         logger.error(f"❌ Erreur traitement message: {e}")
+        if raise_errors:
+            if ctx:
+                ctx.discard()
+            raise
+        
         send_whatsapp_reply(
             from_number, 
             "😓 Erreur technique. Réessayez ou tapez /aide.", 
@@ -1153,6 +1087,69 @@ def process_whatsapp_message(from_number, text_content, media_url):
             current_config.TWILIO_PHONE_NUMBER
         )
         return '<Response/>', 200
+    
+    finally:
+        # Écrire en une transaction les repas et le compteur accumulés
+        if ctx:
+            try:
+                ctx.close()
+            except Exception as e:
+                logger.error(f"❌ Erreur sauvegarde message: {e}")
+                if raise_errors:
+                    raise
+
+def handle_message(ctx, text_content, media_url, media_type=None):
+    """Traite un message avec le contexte utilisateur déjà chargé"""
+    from_number = ctx.phone_number
+    
+    # Récupérer/créer utilisateur
+    is_new_user = not ctx.exists
+    if is_new_user:
+        # Nouvel utilisateur - créer avec onboarding non terminé
+        ctx.start_onboarding()
+    
+    # Si c'est un nouvel utilisateur OU si le message contient "join live-cold", démarrer l'onboarding
+    if is_new_user or (text_content and 'join live-cold' in text_content.lower()):
+        if not is_new_user:
+            # Si c'est "join live-cold", redémarrer complètement l'onboarding
+            ctx.start_onboarding(reset=True)
+        
+        from simple_onboarding import handle_simple_onboarding
+        onboarding_message = handle_simple_onboarding(from_number, 'start', ctx.user_data)
+        send_whatsapp_reply(from_number, onboarding_message, twilio_client, current_config.TWILIO_PHONE_NUMBER)
+        return '<Response/>', 200
+    
+    user_data = ctx.user_data
+    
+    # Traitement par priorité
+    if handle_onboarding(from_number, text_content, user_data):
+        return '<Response/>', 200
+    
+    if handle_special_commands(text_content, ctx):
+        return '<Response/>', 200
+    
+    # Vérifier la limite premium AVANT de traiter le message
+    if not check_premium_limit(ctx):
+        return '<Response/>', 200  # Message bloqué, rappel premium envoyé
+    
+    # Messages vocaux (désactivés)
+    if not text_content and media_url and 'audio' in (media_type or str(media_url)):
+        send_whatsapp_reply(
+            from_number, 
+            "🎤 Messages vocaux bientôt disponibles ! Utilisez du texte ou une photo 📷", 
+            twilio_client, 
+            current_config.TWILIO_PHONE_NUMBER
+        )
+        return '<Response/>', 200
+    
+    # Classification et traitement
+    if text_content:
+        if handle_conversation(text_content, ctx):
+            return '<Response/>', 200
+    
+    # Tracking d'aliments par défaut
+    handle_food_tracking(text_content, media_url, ctx)
+    return '<Response/>', 200
 
 @app.route('/whatsapp', methods=['POST', 'GET'])
 def whatsapp_webhook():
@@ -1163,128 +1160,155 @@ def whatsapp_webhook():
     from_number = request.form.get('From')
     text_content = request.form.get('Body', '').strip()
     media_url = request.form.get('MediaUrl0')
+    media_type = request.form.get('MediaContentType0', '')
+    message_sid = request.form.get('MessageSid')
     
     logger.info(f"📱 Message Twilio de {from_number}: '{text_content}'")
     
-    # Vérifications préliminaires
-    if is_rate_limited(from_number):
-        send_whatsapp_reply(
-            from_number, 
-            "⏰ Trop de messages ! Attendez une minute.", 
-            twilio_client, 
-            current_config.TWILIO_PHONE_NUMBER
-        )
-        return '<Response/>', 429
-    
     if not twilio_client:
         logger.error("❌ Client Twilio non initialisé")
         return '<Response/>', 500
     
-    try:
-        # Récupérer/créer utilisateur
-        user_data = get_user_data(from_number)
-        is_new_user = False
-        
-        if not user_data:
-            # Nouvel utilisateur - créer avec onboarding non terminé
-            user_data = {
-                'onboarding_complete': False,
-                'onboarding_step': 'start',
-                'daily_calories': 0,
-                'daily_proteins': 0,
-                'daily_fats': 0,
-                'daily_carbs': 0,
-                'meals': []
-            }
-            update_user_data(from_number, user_data)
-            is_new_user = True
-        
-        # Si c'est un nouvel utilisateur OU si le message contient "join live-cold", démarrer l'onboarding
-        if is_new_user or (text_content and 'join live-cold' in text_content.lower()):
-            if not is_new_user:
-                # Si c'est "join live-cold", redémarrer complètement l'onboarding
-                delete_user_data(from_number)
-                user_data = {
-                    'onboarding_complete': False,
-                    'onboarding_step': 'start',
-                    'daily_calories': 0,
-                    'daily_proteins': 0,
-                    'daily_fats': 0,
-                    'daily_carbs': 0,
-                    'meals': []
-                }
-                update_user_data(from_number, user_data)
-            
-            from simple_onboarding import handle_simple_onboarding
-            onboarding_message = handle_simple_onboarding(from_number, 'start', user_data)
-            send_whatsapp_reply(from_number, onboarding_message, twilio_client, current_config.TWILIO_PHONE_NUMBER)
-            return '<Response/>', 200
-        
-        # Traitement par priorité
-        if handle_onboarding(from_number, text_content, user_data):
-            return '<Response/>', 200
-        
-        if handle_special_commands(text_content, from_number, user_data):
-            return '<Response/>', 200
-        
-        # Vérifier la limite premium AVANT de traiter le message
-        if not check_premium_limit(from_number, user_data):
-            return '<Response/>', 200  # Message bloqué, rappel premium envoyé
-        
-        # Messages vocaux (désactivés)
-        if not text_content and media_url and 'audio' in request.form.get('MediaContentType0', ''):
-            send_whatsapp_reply(
-                from_number, 
-                "🎤 Messages vocaux bientôt disponibles ! Utilisez du texte ou une photo 📷", 
-                twilio_client, 
-                current_config.TWILIO_PHONE_NUMBER
-            )
-            return '<Response/>', 200
-        
-        # Classification et traitement
-        if text_content:
-            if handle_conversation(text_content, from_number, user_data):
-                return '<Response/>', 200
-        
-        # Tracking d'aliments par défaut
-        handle_food_tracking(text_content, media_url, from_number)
+    # Traitement identique au webhook WhatsApp Business
+    return dispatch_inbound_message({
+        'from_number': from_number,
+        'text': text_content,
+        'media_url': media_url,
+        'media_type': media_type,
+        'message_sid': message_sid
+    })
+
+# ===== TRAITEMENT EN ARRIÈRE-PLAN =====
+def run_inbound_message(job, raise_errors=False):
+    """Traite un message reçu par un webhook (dans la requête ou dans un worker)"""
+    # Marquer le message comme lu (WhatsApp Business uniquement), une seule fois par job
+    if job.get('message_id') and not job.get('read_receipt_sent'):
+        from whatsapp_business_api import whatsapp_business_client
+        whatsapp_business_client.mark_message_as_read(job['message_id'])
+        if job.get('job_id'):
+            update_job_payload(job['job_id'], {'read_receipt_sent': True})
+    
+    return process_whatsapp_message(
+        job['from_number'], 
+        job.get('text', ''), 
+        job.get('media_url'), 
+        job.get('media_type'),
+        raise_errors=raise_errors
+    )
+
+def run_queued_message(job):
+    """
+    Traitement depuis la file persistante : les erreurs remontent pour déclencher un nouvel essai.
+    Les réponses déjà envoyées par une tentative précédente (même contenu) ne sont pas renvoyées.
+    """
+    def record_replies(keys):
+        update_job_payload(job['job_id'], {'replies_sent': keys})
+    
+    with reply_journal(job.get('replies_sent') or (), record_replies):
+        return run_inbound_message(job, raise_errors=True)
+
+def give_up_queued_message(job, error):
+    """Prévient l'utilisateur quand son message n'a pas pu être traité après toutes les tentatives"""
+    send_whatsapp_reply(
+        job['from_number'], 
+        "😓 Erreur technique. Réessayez ou tapez /aide.", 
+        twilio_client, 
+        current_config.TWILIO_PHONE_NUMBER
+    )
+
+def dispatch_inbound_message(job):
+    """Met le message en file si le traitement asynchrone est activé, sinon le traite directement"""
+    # Rejeu d'un message déjà reçu (Meta / Twilio) : acquitter sans rien refaire
+    message_id = job.get('message_id') or job.get('message_sid')
+    if not message_deduplicator.first_seen(message_id):
+        logger.info(f"🔁 Message {message_id} déjà reçu, ignoré")
         return '<Response/>', 200
-        
-    except Exception as e:
-        logger.error(f"❌ Erreur webhook: {e}")
-        send_whatsapp_reply(
-            from_number, 
-            "😓 Erreur technique. Réessayez ou tapez /aide.", 
-            twilio_client, 
-            current_config.TWILIO_PHONE_NUMBER
-        )
+    
+    if worker_pool:
+        try:
+            worker_pool.submit(job)
+        except Exception:
+            # Pas mis en file : accepter le prochain rejeu
+            message_deduplicator.forget(message_id)
+            raise
         return '<Response/>', 200
+    
+    # Mode synchrone : les messages d'un même numéro ne s'exécutent jamais en parallèle
+    with user_message_locks.hold(job['from_number']):
+        return run_inbound_message(job)
+
+def dispatch_inbound_batch(jobs):
+    """
+    Dispatch d'un lot de messages : ordre conservé pour chaque numéro,
+    numéros différents traités en parallèle.
+    """
+    def dispatch_sequence(sequence):
+        for job in sequence:
+            try:
+                dispatch_inbound_message(job)
+            except Exception as e:
+                logger.error(f"❌ Erreur dispatch message {job.get('message_id')}: {e}")
+    
+    # La file persistante garantit déjà l'ordre par numéro
+    if worker_pool:
+        dispatch_sequence(jobs)
+        return
+    
+    jobs_by_phone = {}
+    for job in jobs:
+        jobs_by_phone.setdefault(job['from_number'], []).append(job)
+    
+    if len(jobs_by_phone) == 1:
+        dispatch_sequence(jobs)
+        return
+    
+    list(batch_executor.map(dispatch_sequence, jobs_by_phone.values()))
+
+def setup_worker_pool():
+    """Démarre le pool de workers si ASYNC_WEBHOOK_PROCESSING est activé"""
+    if not current_config.ASYNC_WEBHOOK_PROCESSING:
+        return None
+    
+    pool = WorkerPool(
+        run_queued_message, 
+        size=current_config.WORKER_POOL_SIZE,
+        on_give_up=give_up_queued_message,
+        max_attempts=current_config.INBOUND_JOB_MAX_ATTEMPTS,
+        lease_seconds=current_config.INBOUND_JOB_LEASE_SECONDS,
+        retry_delay=current_config.INBOUND_JOB_RETRY_DELAY
+    )
+    pool.start()
+    return pool
+
+user_message_locks = KeyedLocks()
+message_deduplicator = MessageDeduplicator(
+    cache_size=current_config.DEDUP_CACHE_SIZE,
+    ttl_seconds=current_config.DEDUP_TTL_SECONDS
+)
+worker_pool = setup_worker_pool()
+# Mode synchrone : threads partagés pour les lots multi-numéros (pas de pool créé par requête)
+batch_executor = None if worker_pool else ThreadPoolExecutor(
+    max_workers=current_config.WORKER_POOL_SIZE, 
+    thread_name_prefix='lea-batch'
+)
 
 # ===== DASHBOARD KPI =====
 def get_stats():
     """Récupère les statistiques"""
     try:
-        conn = sqlite3.connect(current_config.DATABASE_NAME)
-        cursor = conn.cursor()
+        today = date.today()
         
-        # Requêtes optimisées
-        stats_queries = {
-            'new_users_today': "SELECT COUNT(*) FROM users WHERE DATE(created_at) = DATE('now')",
-            'messages_today': "SELECT COUNT(*) FROM meals WHERE DATE(date) = DATE('now')",
-            'dau': "SELECT COUNT(DISTINCT phone_number) FROM meals WHERE DATE(date) = DATE('now')",
-            'wau': "SELECT COUNT(DISTINCT phone_number) FROM meals WHERE DATE(date) >= DATE('now', '-7 days')",
-            'total_users': "SELECT COUNT(*) FROM users"
-        }
+        # Agrégats journaliers maintenus à l'écriture des repas (pas de scan de meals)
+        activity_today = get_activity_by_day(today, today).get(today.isoformat(), {})
         
-        stats = {}
-        for key, query in stats_queries.items():
-            cursor.execute(query)
-            stats[key] = cursor.fetchone()[0]
+        stats = get_user_counts()
+        stats['messages_today'] = activity_today.get('meals', 0)
+        stats['dau'] = activity_today.get('dau', 0)
+        stats['wau'] = count_active_users(today - timedelta(days=7), today)
         
         stats['messages_per_user'] = round(stats['messages_today'] / max(stats['dau'], 1), 1)
         stats['date'] = datetime.now().strftime('%Y-%m-%d %H:%M')
         
-        conn.close()
         return stats
         
     except Exception as e:
@@ -1294,23 +1318,18 @@ def get_stats():
 def get_dau_history():
     """Récupère l'historique DAU 14 jours"""
     try:
-        conn = sqlite3.connect(current_config.DATABASE_NAME)
-        cursor = conn.cursor()
+        today = date.today()
+        activity = get_activity_by_day(today - timedelta(days=13), today)
         
         history = []
         previous_dau = 0
         
         for i in range(13, -1, -1):
-            cursor.execute("""
-                SELECT COUNT(DISTINCT phone_number) FROM meals 
-                WHERE DATE(date) = DATE('now', '-{} days')
-            """.format(i))
-            
-            dau_count = cursor.fetchone()[0]
-            date_obj = datetime.now() - timedelta(days=i)
+            day = today - timedelta(days=i)
+            dau_count = activity.get(day.isoformat(), {}).get('dau', 0)
             
             history.append({
-                'date': date_obj.strftime('%d/%m'),
+                'date': day.strftime('%d/%m'),
                 'dau': dau_count,
                 'is_today': i == 0,
                 'is_growth': dau_count > previous_dau if i < 13 else dau_count > 0
@@ -1318,7 +1337,6 @@ def get_dau_history():
             
             previous_dau = dau_count
         
-        conn.close()
         return history
         
     except Exception as e:
@@ -1633,7 +1651,23 @@ def payment_cancel():
 
 @app.route('/api/stats')
 def api_stats():
-    return jsonify(get_stats())
+    stats = get_stats()
+    stats['db'] = get_message_db_stats()
+    stats['dedup'] = message_deduplicator.stats()
+    stats['http'] = http_client.get_pool_stats()
+    stats['llm'] = llm_client.stats()
+    stats['food_parse_cache'] = food_parse_cache.stats()
+    stats['text_parsing'] = dict(text_parse_stats)
+    stats['food_store'] = food_store.stats()
+    stats['images'] = get_image_stats()
+    stats['image_cache'] = image_cache.stats()
+    stats['media'] = media_resolver.stats()
+    if worker_pool:
+        stats['workers'] = worker_pool.stats()
+    else:
+        waiting = user_message_locks.waiting()
+        stats['inflight'] = {'active_keys': len(waiting), 'max_depth_per_key': max(waiting.values(), default=0)}
+    return jsonify(stats)
 
 @app.route('/privacy-policy')
 def privacy_policy():
@@ -121,6 +121,19 @@ class BaseConfig:
     RATE_LIMIT_WINDOW = 60  # 1 minute
     RATE_LIMIT_MAX_REQUESTS = 10  # Max 10 messages par minute
     
+    # Traitement des webhooks en arrière-plan (réponse 200 immédiate)
+    ASYNC_WEBHOOK_PROCESSING = os.getenv('ASYNC_WEBHOOK_PROCESSING', 'false').lower() == 'true'
+    WORKER_POOL_SIZE = int(os.getenv('WORKER_POOL_SIZE', 4))
+    
+    # File persistante des messages : tentatives max, durée du bail d'un worker et délai de base entre essais (s)
+    INBOUND_JOB_MAX_ATTEMPTS = int(os.getenv('INBOUND_JOB_MAX_ATTEMPTS', 5))
+    INBOUND_JOB_LEASE_SECONDS = int(os.getenv('INBOUND_JOB_LEASE_SECONDS', 300))
+    INBOUND_JOB_RETRY_DELAY = int(os.getenv('INBOUND_JOB_RETRY_DELAY', 5))
+    
+    # Déduplication des webhooks : identifiants gardés en mémoire et durée de rétention en base (s)
+    DEDUP_CACHE_SIZE = int(os.getenv('DEDUP_CACHE_SIZE', 10000))
+    DEDUP_TTL_SECONDS = int(os.getenv('DEDUP_TTL_SECONDS', 7 * 24 * 3600))
+    
     # Port
     PORT = int(os.getenv('PORT', 3000))
 
@@ -1,19 +1,118 @@
+import os
+import json
 import sqlite3
+import threading
+import weakref
+from datetime import date, datetime
 from flask import g
 
 DATABASE = 'lea_nutrition.db'
 
+# Réglages SQLite appliqués à chaque connexion (surchargeables par variables d'environnement)
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv('SQLITE_BUSY_TIMEOUT_MS', 5000))
+SQLITE_MMAP_SIZE = int(os.getenv('SQLITE_MMAP_SIZE', 64 * 1024 * 1024))
+SQLITE_CACHED_STATEMENTS = int(os.getenv('SQLITE_CACHED_STATEMENTS', 256))
+
+# Une connexion longue durée par thread et par fichier de base
+_local = threading.local()
+# Connexions de chaque thread vivant (références faibles : rien n'est gardé après la fin d'un thread)
+_thread_connections = weakref.WeakSet()
+_connections_lock = threading.Lock()
+
+# Compteur de requêtes SQL exécutées par thread (mesure des appels DB par message)
+_query_counter = threading.local()
+
+def _count_statement(statement):
+    _query_counter.count = getattr(_query_counter, 'count', 0) + 1
+
+def get_db_call_count():
+    """Nombre de requêtes SQL exécutées par le thread courant (BEGIN/COMMIT inclus)"""
+    return getattr(_query_counter, 'count', 0)
+
+def _open_connection(db_path):
+    """Ouvre une connexion SQLite configurée (WAL, busy_timeout, mmap)"""
+    conn = sqlite3.connect(
+        db_path,
+        timeout=SQLITE_BUSY_TIMEOUT_MS / 1000,
+        cached_statements=SQLITE_CACHED_STATEMENTS,
+        check_same_thread=False
+    )
+    conn.row_factory = sqlite3.Row
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute(f'PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}')
+    conn.execute('PRAGMA synchronous=NORMAL')
+    conn.execute(f'PRAGMA mmap_size={SQLITE_MMAP_SIZE}')
+    conn.execute('PRAGMA temp_store=MEMORY')
+    conn.set_trace_callback(_count_statement)
+    return conn
+
+class _ThreadConnections:
+    """
+    Connexions d'un thread (db_path -> connexion), gardées dans son thread-local.
+    Le thread-local est libéré à la fin du thread (ex. un thread par requête avec
+    app.run(threaded=True)) : les connexions sont alors fermées tout de suite.
+    """
+
+    def __init__(self):
+        self.pid = os.getpid()
+        self.connections = {}
+
+    def get(self, db_path):
+        conn = self.connections.get(db_path)
+        if conn is None:
+            conn = self.connections[db_path] = _open_connection(db_path)
+        return conn
+
+    def close_all(self):
+        connections, self.connections = self.connections, {}
+        for conn in connections.values():
+            try:
+                conn.close()
+            except sqlite3.Error:
+                pass
+
+    def __del__(self):
+        self.close_all()
+
+def get_connection(db_path=DATABASE):
+    """
+    Retourne la connexion du thread courant pour db_path (ouverte une seule fois).
+    Les requêtes préparées sont gardées en cache par la connexion.
+    """
+    thread_connections = getattr(_local, 'connections', None)
+    # Après un fork (gunicorn), ne jamais réutiliser les connexions du parent
+    if thread_connections is None or thread_connections.pid != os.getpid():
+        thread_connections = _local.connections = _ThreadConnections()
+        with _connections_lock:
+            _thread_connections.add(thread_connections)
+    return thread_connections.get(db_path)
+
+def open_connection_count():
+    """Nombre de connexions ouvertes par les threads encore vivants (ce processus)"""
+    with _connections_lock:
+        holders = list(_thread_connections)
+    return sum(len(holder.connections) for holder in holders if holder.pid == os.getpid())
+
+def close_connections():
+    """Ferme toutes les connexions ouvertes (arrêt du serveur, tests)"""
+    with _connections_lock:
+        holders = list(_thread_connections)
+    for holder in holders:
+        holder.close_all()
+
 def get_db():
+    """Connexion pour le contexte Flask courant (réutilise la connexion du thread)"""
     db = getattr(g, '_database', None)
     if db is None:
-        db = g._database = sqlite3.connect(DATABASE)
-        db.row_factory = sqlite3.Row
+        db = g._database = get_connection()
     return db
 
-def init_db():
-    """Initialise la base de données"""
-    conn = sqlite3.connect(DATABASE)
-    
+# ===== MIGRATIONS =====
+# Chaque migration est appliquée une seule fois, dans l'ordre, et enregistrée dans schema_version.
+# Ne jamais modifier une migration déjà déployée : en ajouter une nouvelle à la fin de la liste.
+
+def _migration_1_base_schema(conn):
+    """Schéma initial (tables créées seulement si absentes, aucune donnée supprimée)"""
     conn.execute('''
         CREATE TABLE IF NOT EXISTS users (
             phone_number TEXT PRIMARY KEY,
@@ -39,12 +138,8 @@ def init_db():
         )
     ''')
     
-    # Supprimer l'ancienne table daily_intake si elle existe
-    conn.execute('DROP TABLE IF EXISTS daily_intake')
-    
-    # Créer la nouvelle table avec contrainte unique
     conn.execute('''
-        CREATE TABLE daily_intake (
+        CREATE TABLE IF NOT EXISTS daily_intake (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             phone_number TEXT,
             date DATE,
@@ -72,33 +167,190 @@ def init_db():
         )
     ''')
     
-    conn.commit()
-    conn.close()
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS conversation_history (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            phone_number TEXT,
+            date DATE,
+            timestamp DATETIME,
+            question TEXT,
+            answer TEXT
+        )
+    ''')
+    
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS incoming_sms (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            from_number TEXT NOT NULL,
+            to_number TEXT NOT NULL,
+            body TEXT,
+            timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
+            message_sid TEXT UNIQUE,
+            status TEXT DEFAULT 'received'
+        )
+    ''')
 
-def increment_message_count(phone_number):
-    """Incrémente le compteur de messages pour un utilisateur"""
-    conn = sqlite3.connect(DATABASE)
+def _migration_2_hot_query_indexes(conn):
+    """Index pour les requêtes fréquentes (repas du jour, historique, SMS, onboarding)"""
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_meals_phone_date_time ON meals(phone_number, date, time)')
+    conn.execute(
+        'CREATE INDEX IF NOT EXISTS idx_conversation_history_phone_date_ts '
+        'ON conversation_history(phone_number, date, timestamp)'
+    )
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_incoming_sms_to_ts ON incoming_sms(to_number, timestamp)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_users_onboarding_step ON users(onboarding_step)')
+
+def _migration_3_daily_activity(conn):
+    """Table d'agrégats journaliers pour le dashboard (une ligne par utilisateur actif et par jour)"""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS daily_activity (
+            date DATE NOT NULL,
+            phone_number TEXT NOT NULL,
+            meal_count INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (date, phone_number)
+        ) WITHOUT ROWID
+    ''')
     
+    # Reprise de l'historique existant
     conn.execute('''
-        UPDATE users 
-        SET message_count = message_count + 1, last_interaction = CURRENT_TIMESTAMP
-        WHERE phone_number = ?
-    ''', (phone_number,))
+        INSERT OR IGNORE INTO daily_activity (date, phone_number, meal_count)
+        SELECT DATE(date), phone_number, COUNT(*) FROM meals
+        WHERE date IS NOT NULL AND phone_number IS NOT NULL
+        GROUP BY DATE(date), phone_number
+    ''')
     
-    # Récupérer le nouveau compteur
-    result = conn.execute(
-        'SELECT message_count FROM users WHERE phone_number = ?',
-        (phone_number,)
-    ).fetchone()
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_users_created_at ON users(created_at)')
+
+def _migration_4_inbound_jobs(conn):
+    """File persistante des messages entrants (traitement en arrière-plan, reprise après crash)"""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS inbound_jobs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            phone_number TEXT NOT NULL,
+            payload TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'pending',
+            attempts INTEGER NOT NULL DEFAULT 0,
+            next_run_at REAL NOT NULL,
+            lease_expires_at REAL,
+            last_error TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_inbound_jobs_status_next ON inbound_jobs(status, next_run_at)')
+
+def _migration_5_inbound_jobs_per_phone(conn):
+    """Index pour l'ordre par utilisateur dans la file (job précédent du même numéro)"""
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_inbound_jobs_phone_status ON inbound_jobs(phone_number, status, id)')
+
+def _migration_6_processed_messages(conn):
+    """Identifiants des messages déjà reçus (déduplication des webhooks rejoués)"""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS processed_messages (
+            message_id TEXT PRIMARY KEY,
+            seen_at REAL NOT NULL
+        ) WITHOUT ROWID
+    ''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_processed_messages_seen_at ON processed_messages(seen_at)')
+
+def _migration_7_food_parse_cache(conn):
+    """Cache persistant des résultats de parsing GPT (texte normalisé + version du prompt)"""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS food_parse_cache (
+            cache_key TEXT PRIMARY KEY,
+            result TEXT NOT NULL,
+            created_at REAL NOT NULL,
+            last_hit_at REAL NOT NULL,
+            hits INTEGER NOT NULL DEFAULT 0
+        ) WITHOUT ROWID
+    ''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_food_parse_cache_last_hit ON food_parse_cache(last_hit_at)')
+
+def _migration_8_image_analysis_cache(conn):
+    """Cache des analyses de photos (hash perceptuel 64 bits -> aliments détectés)"""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS image_analysis_cache (
+            image_hash INTEGER PRIMARY KEY,
+            aliments TEXT NOT NULL,
+            created_at REAL NOT NULL,
+            last_hit_at REAL NOT NULL,
+            hits INTEGER NOT NULL DEFAULT 0
+        )
+    ''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_image_analysis_cache_last_hit ON image_analysis_cache(last_hit_at)')
+
+MIGRATIONS = [
+    (1, 'base_schema', _migration_1_base_schema),
+    (2, 'hot_query_indexes', _migration_2_hot_query_indexes),
+    (3, 'daily_activity', _migration_3_daily_activity),
+    (4, 'inbound_jobs', _migration_4_inbound_jobs),
+    (5, 'inbound_jobs_per_phone', _migration_5_inbound_jobs_per_phone),
+    (6, 'processed_messages', _migration_6_processed_messages),
+    (7, 'food_parse_cache', _migration_7_food_parse_cache),
+    (8, 'image_analysis_cache', _migration_8_image_analysis_cache),
+]
+
+def get_schema_version(conn):
+    """Version de schéma appliquée (0 si aucune migration)"""
+    row = conn.execute('SELECT MAX(version) FROM schema_version').fetchone()
+    return row[0] or 0
+
+def init_db(db_path=DATABASE):
+    """Initialise la base de données en appliquant uniquement les migrations en attente"""
+    conn = get_connection(db_path)
     
-    conn.commit()
-    conn.close()
+    with conn:
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS schema_version (
+                version INTEGER PRIMARY KEY,
+                name TEXT NOT NULL,
+                applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+    
+    applied = []
+    for version, name, migrate in MIGRATIONS:
+        # BEGIN IMMEDIATE : un seul processus applique une migration donnée
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            if conn.execute('SELECT 1 FROM schema_version WHERE version = ?', (version,)).fetchone():
+                conn.rollback()
+                continue
+            
+            migrate(conn)
+            conn.execute('INSERT INTO schema_version (version, name) VALUES (?, ?)', (version, name))
+            conn.commit()
+            applied.append(version)
+        except Exception:
+            conn.rollback()
+            raise
+    
+    if applied:
+        print(f"🗃️ Migrations appliquées sur {db_path}: {applied}")
+    
+    return get_schema_version(conn)
+
+def increment_message_count(phone_number):
+    """Incrémente le compteur de messages pour un utilisateur"""
+    conn = get_connection()
+    
+    with conn:
+        conn.execute('''
+            UPDATE users 
+            SET message_count = message_count + 1, last_interaction = CURRENT_TIMESTAMP
+            WHERE phone_number = ?
+        ''', (phone_number,))
+        
+        # Récupérer le nouveau compteur
+        result = conn.execute(
+            'SELECT message_count FROM users WHERE phone_number = ?',
+            (phone_number,)
+        ).fetchone()
     
     return result[0] if result else 0
 
 def is_user_premium(phone_number):
     """Vérifie si un utilisateur est premium et si son abonnement est valide"""
-    conn = sqlite3.connect(DATABASE)
+    conn = get_connection()
     
     result = conn.execute('''
         SELECT is_premium, premium_expires_at 
@@ -106,18 +358,19 @@ def is_user_premium(phone_number):
         WHERE phone_number = ?
     ''', (phone_number,)).fetchone()
     
-    conn.close()
-    
     if not result:
         return False
     
     is_premium, expires_at = result
     
+    return is_premium_active(is_premium, expires_at)
+
+def is_premium_active(is_premium, expires_at):
+    """Vrai si le statut premium est actif et non expiré"""
     if not is_premium:
         return False
     
     if expires_at:
-        from datetime import datetime
         expiry_date = datetime.fromisoformat(expires_at)
         return datetime.now() < expiry_date
     
@@ -125,110 +378,173 @@ def is_user_premium(phone_number):
 
 def set_user_premium(phone_number, stripe_customer_id, expires_at):
     """Active le statut premium pour un utilisateur"""
-    conn = sqlite3.connect(DATABASE)
-    
-    conn.execute('''
-        UPDATE users 
-        SET is_premium = 1, 
-            premium_expires_at = ?, 
-            stripe_customer_id = ?
-        WHERE phone_number = ?
-    ''', (expires_at, stripe_customer_id, phone_number))
+    conn = get_connection()
     
-    conn.commit()
-    conn.close()
+    with conn:
+        conn.execute('''
+            UPDATE users 
+            SET is_premium = 1, 
+                premium_expires_at = ?, 
+                stripe_customer_id = ?
+            WHERE phone_number = ?
+        ''', (expires_at, stripe_customer_id, phone_number))
 
 def get_user_message_count(phone_number):
     """Récupère le nombre de messages d'un utilisateur"""
-    conn = sqlite3.connect(DATABASE)
+    conn = get_connection()
     
     result = conn.execute(
         'SELECT message_count FROM users WHERE phone_number = ?',
         (phone_number,)
     ).fetchone()
     
-    conn.close()
-    
     return result[0] if result else 0
 
 def set_test_message_count(phone_number, count):
     """Définit le compteur de messages pour les tests (commandes /on30 et /off30)"""
-    conn = sqlite3.connect(DATABASE)
+    conn = get_connection()
     
-    # S'assurer que l'utilisateur existe
-    conn.execute('''
-        INSERT OR IGNORE INTO users (phone_number, onboarding_step, message_count)
-        VALUES (?, 'complete', 0)
-    ''', (phone_number,))
-    
-    # Mettre à jour le compteur
-    conn.execute('''
-        UPDATE users 
-        SET message_count = ?, last_interaction = CURRENT_TIMESTAMP
-        WHERE phone_number = ?
-    ''', (count, phone_number))
-    
-    conn.commit()
-    conn.close()
+    with conn:
+        # S'assurer que l'utilisateur existe
+        conn.execute('''
+            INSERT OR IGNORE INTO users (phone_number, onboarding_step, message_count)
+            VALUES (?, 'complete', 0)
+        ''', (phone_number,))
+        
+        # Mettre à jour le compteur
+        conn.execute('''
+            UPDATE users 
+            SET message_count = ?, last_interaction = CURRENT_TIMESTAMP
+            WHERE phone_number = ?
+        ''', (count, phone_number))
     
     return count
 
 def delete_user_data(phone_number):
     """Supprime complètement un utilisateur de la base de données"""
-    conn = sqlite3.connect(DATABASE)
-    
-    # Supprimer toutes les données de l'utilisateur
-    conn.execute('DELETE FROM meals WHERE phone_number = ?', (phone_number,))
-    conn.execute('DELETE FROM daily_intake WHERE phone_number = ?', (phone_number,))
-    conn.execute('DELETE FROM users WHERE phone_number = ?', (phone_number,))
-    
-    conn.commit()
-    conn.close()
+    conn = get_connection()
+    
+    with conn:
+        # Supprimer toutes les données de l'utilisateur
+        conn.execute('DELETE FROM meals WHERE phone_number = ?', (phone_number,))
+        conn.execute('DELETE FROM daily_intake WHERE phone_number = ?', (phone_number,))
+        conn.execute('DELETE FROM daily_activity WHERE phone_number = ?', (phone_number,))
+        conn.execute('DELETE FROM users WHERE phone_number = ?', (phone_number,))
 
 def get_all_users():
     """Récupère tous les utilisateurs actifs"""
-    conn = sqlite3.connect(DATABASE)
-    conn.row_factory = sqlite3.Row
+    conn = get_connection()
     
     users = conn.execute(
         'SELECT * FROM users WHERE onboarding_step = "complete"'
     ).fetchall()
     
-    conn.close()
-    
     return [dict(user) for user in users]
 
-def get_user_data(phone_number):
-    """Récupère les données utilisateur"""
-    conn = sqlite3.connect(DATABASE)
-    conn.row_factory = sqlite3.Row
-    
-    # Récupérer les données utilisateur
-    user = conn.execute(
-        'SELECT * FROM users WHERE phone_number = ?', 
-        (phone_number,)
-    ).fetchone()
-    
-    if not user:
-        return None
-    
-    # Récupérer les données nutritionnelles du jour
-    from datetime import date
-    today = date.today().isoformat()
-    
-    daily = conn.execute(
-        'SELECT * FROM daily_intake WHERE phone_number = ? AND date = ?',
-        (phone_number, today)
-    ).fetchone()
-    
-    # Récupérer les repas du jour
-    meals = conn.execute(
-        'SELECT * FROM meals WHERE phone_number = ? AND date = ? ORDER BY time',
-        (phone_number, today)
-    ).fetchall()
-    
-    conn.close()
-    
+# Projections disponibles pour get_user_snapshot
+PROJECTION_PROFILE = 'profile'  # Ligne users uniquement (objectifs, premium, compteur)
+PROJECTION_TOTALS = 'totals'    # Profil + totaux nutritionnels du jour
+PROJECTION_FULL = 'full'        # Profil + totaux + repas du jour
+
+_SNAPSHOT_DAILY_COLUMNS = '''
+    d.calories AS daily_calories,
+    d.proteins AS daily_proteins,
+    d.fats AS daily_fats,
+    d.carbs AS daily_carbs
+'''
+
+_SNAPSHOT_MEALS_COLUMN = '''
+    (SELECT json_group_array(json_object(
+        'id', m.id, 'phone_number', m.phone_number, 'date', m.date, 'time', m.time,
+        'meal_name', m.meal_name, 'calories', m.calories, 'proteins', m.proteins,
+        'fats', m.fats, 'carbs', m.carbs))
+     FROM (SELECT * FROM meals
+           WHERE phone_number = u.phone_number AND date = :today
+           ORDER BY time) m) AS meals_json
+'''
+
+_SNAPSHOT_DAILY_JOIN = 'LEFT JOIN daily_intake d ON d.phone_number = u.phone_number AND d.date = :today'
+
+# Une seule requête par projection (texte constant pour profiter du cache de requêtes préparées)
+_SNAPSHOT_QUERIES = {
+    PROJECTION_PROFILE: 'SELECT u.* FROM users u WHERE u.phone_number = :phone',
+    PROJECTION_TOTALS: f'''
+        SELECT u.*, {_SNAPSHOT_DAILY_COLUMNS}
+        FROM users u {_SNAPSHOT_DAILY_JOIN}
+        WHERE u.phone_number = :phone
+    ''',
+    PROJECTION_FULL: f'''
+        SELECT u.*, {_SNAPSHOT_DAILY_COLUMNS}, {_SNAPSHOT_MEALS_COLUMN}
+        FROM users u {_SNAPSHOT_DAILY_JOIN}
+        WHERE u.phone_number = :phone
+    ''',
+}
+
+# Champs du dict utilisateur -> colonnes de la table users
+_USER_FIELD_COLUMNS = {
+    'name': 'name',
+    'age': 'age',
+    'sex': 'sex',
+    'gender': 'sex',
+    'objective': 'objective',
+    'goal': 'objective',
+    'weight': 'weight',
+    'height': 'height',
+    'activity_level': 'activity_level',
+    'activity_text': 'activity_text',
+    'target_calories': 'target_calories',
+    'target_proteins': 'target_proteins',
+    'target_fats': 'target_fats',
+    'target_carbs': 'target_carbs',
+    'onboarding_step': 'onboarding_step'
+}
+
+_DAILY_FIELDS = frozenset({'daily_calories', 'daily_proteins', 'daily_fats', 'daily_carbs'})
+
+class UserData(dict):
+    """Dict utilisateur qui mémorise les champs modifiés depuis son chargement"""
+    
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._dirty = set()
+    
+    def __setitem__(self, key, value):
+        if key not in self or self[key] != value:
+            self._dirty.add(key)
+        super().__setitem__(key, value)
+    
+    def __delitem__(self, key):
+        self._dirty.add(key)
+        super().__delitem__(key)
+    
+    def update(self, *args, **kwargs):
+        for key, value in dict(*args, **kwargs).items():
+            self[key] = value
+    
+    def setdefault(self, key, default=None):
+        if key not in self:
+            self[key] = default
+        return self[key]
+    
+    def pop(self, key, *default):
+        if key in self:
+            self._dirty.add(key)
+        return super().pop(key, *default)
+    
+    @property
+    def dirty_fields(self):
+        """Champs modifiés depuis le chargement ou la dernière sauvegarde"""
+        return set(self._dirty)
+    
+    def mark_clean(self, *fields):
+        """Oublie les modifications (toutes, ou seulement fields) après une sauvegarde"""
+        if fields:
+            self._dirty.difference_update(fields)
+        else:
+            self._dirty.clear()
+
+def _build_user_dict(user, projection):
+    """Construit l'objet utilisateur à partir d'une ligne de snapshot"""
     # Construire l'objet utilisateur avec tous les champs onboarding
     user_data = {
         'phone_number': user['phone_number'],
@@ -251,79 +567,231 @@ def get_user_data(phone_number):
         'message_count': user['message_count'] or 0,
         'is_premium': bool(user['is_premium']),
         'premium_expires_at': user['premium_expires_at'],
-        'stripe_customer_id': user['stripe_customer_id'],
-        'daily_calories': daily['calories'] if daily else 0,
-        'daily_proteins': daily['proteins'] if daily else 0,
-        'daily_fats': daily['fats'] if daily else 0,
-        'daily_carbs': daily['carbs'] if daily else 0,
-        'meals': [dict(meal) for meal in meals] if meals else []
+        'stripe_customer_id': user['stripe_customer_id']
     }
     
-    return user_data
+    if projection in (PROJECTION_TOTALS, PROJECTION_FULL):
+        user_data.update({
+            'daily_calories': user['daily_calories'] or 0,
+            'daily_proteins': user['daily_proteins'] or 0,
+            'daily_fats': user['daily_fats'] or 0,
+            'daily_carbs': user['daily_carbs'] or 0
+        })
+    
+    if projection == PROJECTION_FULL:
+        user_data['meals'] = json.loads(user['meals_json']) if user['meals_json'] else []
+    
+    return UserData(user_data)
 
-def update_user_data(phone_number, user_data):
-    """Met à jour les données utilisateur"""
-    conn = sqlite3.connect(DATABASE)
+def get_user_snapshot(phone_number, projection=PROJECTION_FULL):
+    """
+    Récupère profil, totaux du jour et repas du jour en une seule requête.
+    projection limite ce qui est chargé (PROJECTION_PROFILE, PROJECTION_TOTALS, PROJECTION_FULL).
+    """
+    if projection not in _SNAPSHOT_QUERIES:
+        raise ValueError(f"Projection inconnue: {projection}")
     
-    # Mettre à jour les données utilisateur avec mapping des champs
-    conn.execute('''
-        INSERT OR REPLACE INTO users 
-        (phone_number, name, age, sex, objective, weight, height, activity_level, activity_text, 
-         target_calories, target_proteins, target_fats, target_carbs, onboarding_step, last_interaction)
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
-    ''', (
+    conn = get_connection()
+    
+    user = conn.execute(
+        _SNAPSHOT_QUERIES[projection],
+        {'phone': phone_number, 'today': date.today().isoformat()}
+    ).fetchone()
+    
+    if not user:
+        return None
+    
+    return _build_user_dict(user, projection)
+
+def get_user_data(phone_number):
+    """Récupère les données utilisateur"""
+    return get_user_snapshot(phone_number, PROJECTION_FULL)
+
+_INSERT_MEAL_SQL = '''
+    INSERT INTO meals 
+    (phone_number, date, time, meal_name, calories, proteins, fats, carbs)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+'''
+
+# Ajout atomique aux totaux du jour : pas de lecture préalable, pas de mise à jour perdue
+_UPSERT_DAILY_TOTALS_SQL = '''
+    INSERT INTO daily_intake (phone_number, date, calories, proteins, fats, carbs)
+    VALUES (?, ?, ?, ?, ?, ?)
+    ON CONFLICT(phone_number, date) DO UPDATE SET
+        calories = calories + excluded.calories,
+        proteins = proteins + excluded.proteins,
+        fats = fats + excluded.fats,
+        carbs = carbs + excluded.carbs
+'''
+
+_UPSERT_DAILY_ACTIVITY_SQL = '''
+    INSERT INTO daily_activity (date, phone_number, meal_count)
+    VALUES (?, ?, ?)
+    ON CONFLICT(date, phone_number) DO UPDATE SET
+        meal_count = meal_count + excluded.meal_count
+'''
+
+def _meal_row(phone_number, meal_date, meal):
+    """Paramètres d'insertion d'un repas (support des noms FR et EN)"""
+    return (
         phone_number,
-        user_data.get('name'),
-        user_data.get('age'),
-        user_data.get('sex') or user_data.get('gender'),  # Support des deux noms
-        user_data.get('objective') or user_data.get('goal'),  # Support des deux noms
-        user_data.get('weight'),
-        user_data.get('height', 170),  # Valeur par défaut
-        user_data.get('activity_level'),
-        user_data.get('activity_text'),
-        user_data.get('target_calories'),
-        user_data.get('target_proteins'),
-        user_data.get('target_fats'),
-        user_data.get('target_carbs'),
-        user_data.get('onboarding_step', 'complete')
-    ))
-    
-    # Mettre à jour les données nutritionnelles du jour
-    from datetime import date
+        meal_date,
+        meal.get('time', ''),
+        meal.get('name', meal.get('meal_name', '')),
+        meal.get('calories', 0),
+        meal.get('proteines', meal.get('proteins', 0)),  # Support des deux noms
+        meal.get('lipides', meal.get('fats', 0)),        # Support des deux noms
+        meal.get('glucides', meal.get('carbs', 0))       # Support des deux noms
+    )
+
+def add_meal(phone_number, meal):
+    """
+    Ajoute un repas du jour et incrémente les totaux dans une seule transaction.
+    Le coût est constant quel que soit le nombre de repas déjà enregistrés.
+    """
+    apply_user_writes(phone_number, meals=[meal])
+
+def apply_user_writes(phone_number, message_count_increment=0, meals=()):
+    """
+    Applique en une transaction les écritures accumulées pendant un message :
+    repas ajoutés (insertion + totaux atomiques) et incrément du compteur de messages.
+    """
+    if not message_count_increment and not meals:
+        return
+    
+    conn = get_connection()
     today = date.today().isoformat()
     
-    # Maintenant INSERT OR REPLACE fonctionnera grâce à la contrainte UNIQUE
-    conn.execute('''
-        INSERT OR REPLACE INTO daily_intake 
-        (phone_number, date, calories, proteins, fats, carbs)
-        VALUES (?, ?, ?, ?, ?, ?)
-    ''', (
-        phone_number,
-        today,
-        user_data.get('daily_calories', 0),
-        user_data.get('daily_proteins', 0),
-        user_data.get('daily_fats', 0),
-        user_data.get('daily_carbs', 0)
-    ))
+    with conn:
+        for meal in meals:
+            row = _meal_row(phone_number, today, meal)
+            conn.execute(_INSERT_MEAL_SQL, row)
+            conn.execute(_UPSERT_DAILY_TOTALS_SQL, (phone_number, today) + row[4:])
+        
+        if meals:
+            conn.execute(_UPSERT_DAILY_ACTIVITY_SQL, (today, phone_number, len(meals)))
+        
+        conn.execute('''
+            UPDATE users 
+            SET message_count = message_count + ?, last_interaction = CURRENT_TIMESTAMP
+            WHERE phone_number = ?
+        ''', (message_count_increment, phone_number))
+
+def update_user_data(phone_number, user_data):
+    """
+    Met à jour les données utilisateur.
+    Seuls les champs modifiés sont écrits : pour un UserData chargé depuis la base,
+    ceux changés depuis le chargement ; pour un dict simple, toutes les clés présentes.
+    """
+    if isinstance(user_data, UserData):
+        changed = user_data.dirty_fields
+    else:
+        changed = set(user_data)
+    
+    # Colonnes users modifiées (mapping des champs, support des deux noms)
+    columns = {}
+    for field in changed:
+        column = _USER_FIELD_COLUMNS.get(field)
+        if column == 'sex':
+            columns[column] = user_data.get('sex') or user_data.get('gender')
+        elif column == 'objective':
+            columns[column] = user_data.get('objective') or user_data.get('goal')
+        elif column:
+            columns[column] = user_data.get(field)
+    
+    names = sorted(columns)
+    assignments = ''.join(f'{name} = excluded.{name}, ' for name in names)
+    
+    conn = get_connection()
+    
+    with conn:
+        # UPSERT ciblé : les autres colonnes (premium, compteur, created_at) ne sont jamais touchées
+        conn.execute(f'''
+            INSERT INTO users (phone_number, {''.join(name + ', ' for name in names)}last_interaction)
+            VALUES (?, {'?, ' * len(names)}CURRENT_TIMESTAMP)
+            ON CONFLICT(phone_number) DO UPDATE SET {assignments}last_interaction = CURRENT_TIMESTAMP
+        ''', [phone_number] + [columns[name] for name in names])
+        
+        # Mettre à jour les données nutritionnelles du jour
+        today = date.today().isoformat()
+        
+        if changed & _DAILY_FIELDS:
+            conn.execute('''
+                INSERT INTO daily_intake 
+                (phone_number, date, calories, proteins, fats, carbs)
+                VALUES (?, ?, ?, ?, ?, ?)
+                ON CONFLICT(phone_number, date) DO UPDATE SET
+                    calories = excluded.calories,
+                    proteins = excluded.proteins,
+                    fats = excluded.fats,
+                    carbs = excluded.carbs
+            ''', (
+                phone_number,
+                today,
+                user_data.get('daily_calories', 0),
+                user_data.get('daily_proteins', 0),
+                user_data.get('daily_fats', 0),
+                user_data.get('daily_carbs', 0)
+            ))
+        
+        if 'meals' in changed:
+            # Remplacer les repas du jour (reset, restauration)
+            conn.execute('DELETE FROM meals WHERE phone_number = ? AND date = ?', (phone_number, today))
+            
+            meals = user_data.get('meals', [])
+            for meal in meals:
+                conn.execute(_INSERT_MEAL_SQL, _meal_row(phone_number, today, meal))
+            
+            # Garder l'agrégat du dashboard aligné sur les repas réécrits
+            if meals:
+                conn.execute('''
+                    INSERT INTO daily_activity (date, phone_number, meal_count) VALUES (?, ?, ?)
+                    ON CONFLICT(date, phone_number) DO UPDATE SET meal_count = excluded.meal_count
+                ''', (today, phone_number, len(meals)))
+            else:
+                conn.execute(
+                    'DELETE FROM daily_activity WHERE date = ? AND phone_number = ?',
+                    (today, phone_number)
+                )
+    
+    if isinstance(user_data, UserData):
+        user_data.mark_clean()
+
+# ===== DASHBOARD =====
+
+def get_activity_by_day(start_date, end_date, db_path=DATABASE):
+    """
+    Utilisateurs actifs et repas par jour sur une période (bornes incluses),
+    en une requête groupée sur daily_activity. Retourne {date_iso: {'dau', 'meals'}}.
+    """
+    conn = get_connection(db_path)
+    
+    rows = conn.execute('''
+        SELECT date, COUNT(*) AS dau, SUM(meal_count) AS meals
+        FROM daily_activity
+        WHERE date BETWEEN ? AND ?
+        GROUP BY date
+    ''', (start_date.isoformat(), end_date.isoformat())).fetchall()
+    
+    return {row['date']: {'dau': row['dau'], 'meals': row['meals']} for row in rows}
+
+def count_active_users(start_date, end_date, db_path=DATABASE):
+    """Nombre d'utilisateurs distincts actifs sur une période (bornes incluses)"""
+    conn = get_connection(db_path)
+    
+    return conn.execute('''
+        SELECT COUNT(DISTINCT phone_number) FROM daily_activity
+        WHERE date BETWEEN ? AND ?
+    ''', (start_date.isoformat(), end_date.isoformat())).fetchone()[0]
+
+def get_user_counts(db_path=DATABASE):
+    """Nombre total d'utilisateurs et d'inscrits du jour (UTC, comme created_at)"""
+    conn = get_connection(db_path)
     
-    # Supprimer les anciens repas du jour et ajouter les nouveaux
-    conn.execute('DELETE FROM meals WHERE phone_number = ? AND date = ?', (phone_number, today))
+    row = conn.execute('''
+        SELECT 
+            (SELECT COUNT(*) FROM users) AS total_users,
+            (SELECT COUNT(*) FROM users WHERE created_at >= DATE('now')) AS new_users_today
+    ''').fetchone()
     
-    for meal in user_data.get('meals', []):
-        conn.execute('''
-            INSERT INTO meals 
-            (phone_number, date, time, meal_name, calories, proteins, fats, carbs)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-        ''', (
-            phone_number,
-            today,
-            meal.get('time', ''),
-            meal.get('name', ''),
-            meal.get('calories', 0),
-            meal.get('proteines', meal.get('proteins', 0)),  # Support des deux noms
-            meal.get('lipides', meal.get('fats', 0)),        # Support des deux noms
-            meal.get('glucides', meal.get('carbs', 0))       # Support des deux noms
-        ))
-    
-    conn.commit()
-    conn.close()
+    return {'total_users': row['total_users'], 'new_users_today': row['new_users_today']}
@@ -0,0 +1,145 @@
+"""
+Appariement approximatif des noms d'aliments par similarité de trigrammes.
+Retourne le meilleur candidat et son score (Dice, 0..1) : "pommes de terre sautées"
+trouve "pommes de terre" et non "pomme", "carote" trouve "carotte".
+
+Index inversé (nombre de trigrammes, trigramme) -> entrées. Pour une requête, seules les
+tailles d'entrée compatibles avec le score minimal sont parcourues ; dans chaque taille,
+seuls les trigrammes les plus rares génèrent des candidats (une entrée assez proche en
+partage forcément un), vérifiés ensuite par intersection d'ensembles. Le coût dépend du
+nombre de candidats plausibles, pas de la taille de la table.
+"""
+
+import heapq
+import math
+
+# Mots sans valeur pour identifier un aliment (ignorés par words_covered)
+STOP_WORDS = frozenset({'de', 'du', 'des', 'd', 'la', 'le', 'les', 'l', 'un', 'une', 'au', 'aux',
+                        'a', 'et', 'avec', 'en', 'sans', 'the', 'of', 'and', 'with'})
+# Similarité minimale entre deux mots pour les considérer comme le même (pluriel, faute de frappe)
+WORD_MATCH_MIN_SCORE = 0.6
+
+def trigrams(text):
+    """Trigrammes d'un texte normalisé, chaque mot bordé d'espaces ("riz" -> "  r", " ri", "riz", "iz ")"""
+    grams = set()
+    for word in text.split():
+        padded = f"  {word} "
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return frozenset(grams)
+
+def dice(grams_a, grams_b):
+    """Similarité de Dice entre deux ensembles de trigrammes"""
+    if not grams_a or not grams_b:
+        return 0.0
+    return 2 * len(grams_a & grams_b) / (len(grams_a) + len(grams_b))
+
+def content_words(text):
+    """Mots significatifs d'un texte normalisé (sans mots vides ni apostrophes)"""
+    return [word for word in text.replace("'", ' ').split() if word not in STOP_WORDS]
+
+def words_covered(words, target):
+    """
+    (tous les mots retrouvés dans target, tous retrouvés à l'identique).
+    Un mot est retrouvé s'il figure dans target ou s'il est très proche d'un de ses mots
+    ("tomate" / "tomates", "carote" / "carotte"), mais pas "compote" / "comte".
+    """
+    target_words = set(content_words(target))
+    if not words or not target_words:
+        return False, False
+
+    exact = True
+    for word in words:
+        if word in target_words:
+            continue
+        exact = False
+        grams = trigrams(word)
+        if not any(dice(grams, trigrams(other)) >= WORD_MATCH_MIN_SCORE for other in target_words):
+            return False, False
+    return True, exact
+
+class FoodMatcher:
+    """Index de trigrammes sur des noms déjà normalisés (minuscules, sans accents)"""
+
+    def __init__(self, entries=(), min_score=0.5):
+        self.min_score = min_score
+        self._names = []
+        self._values = []
+        self._grams = []
+        # {taille: {trigramme: [ids]}}
+        self._postings = {}
+        for name, value in entries:
+            self.add(name, value)
+
+    def add(self, name, value):
+        """Ajoute un nom (normalisé) et la valeur retournée quand il est choisi"""
+        grams = trigrams(name)
+        if not grams:
+            return
+        entry_id = len(self._names)
+        self._names.append(name)
+        self._values.append(value)
+        self._grams.append(grams)
+        postings = self._postings.setdefault(len(grams), {})
+        for gram in grams:
+            postings.setdefault(gram, []).append(entry_id)
+
+    def __len__(self):
+        return len(self._names)
+
+    def best_matches(self, query, limit=5, min_score=None):
+        """[(valeur, score, nom)] triés par score décroissant, score >= min_score"""
+        min_score = self.min_score if min_score is None else min_score
+        query_grams = trigrams(query)
+        if not query_grams or min_score <= 0:
+            return []
+
+        size = len(query_grams)
+        # Dice = 2c / (|q| + |e|) >= s  =>  |e| dans [s|q| / (2 - s), (2 - s)|q| / s]
+        min_size = math.ceil(min_score * size / (2 - min_score))
+        max_size = math.floor((2 - min_score) * size / min_score)
+        sizes = sorted(range(min_size, max_size + 1), key=lambda entry_size: abs(entry_size - size))
+
+        # Top `limit` dans un tas ; dès qu'il est plein, le seuil monte au plus faible score retenu
+        top = []
+        threshold = min_score
+        for entry_size in sizes:
+            postings = self._postings.get(entry_size)
+            if not postings:
+                continue
+            if 2 * min(size, entry_size) / (size + entry_size) < threshold:
+                continue
+
+            # Chevauchement minimal pour cette taille ; les (size - overlap + 1) trigrammes
+            # les plus rares de la requête suffisent à trouver tous les candidats
+            min_overlap = math.ceil(threshold * (size + entry_size) / 2)
+            ordered = sorted(query_grams, key=lambda gram: len(postings.get(gram, ())))
+            candidates = set()
+            for gram in ordered[:size - min_overlap + 1]:
+                candidates.update(postings.get(gram, ()))
+
+            for entry_id in candidates:
+                overlap = len(query_grams & self._grams[entry_id])
+                if overlap < min_overlap:
+                    continue
+                # À score égal : taille la plus proche de la requête, puis première entrée ajoutée
+                item = (2 * overlap / (size + entry_size), -abs(entry_size - size), -entry_id)
+                if len(top) < limit:
+                    heapq.heappush(top, item)
+                elif item > top[0]:
+                    heapq.heapreplace(top, item)
+                else:
+                    continue
+                if len(top) == limit:
+                    threshold = max(threshold, top[0][0])
+                    min_overlap = math.ceil(threshold * (size + entry_size) / 2)
+
+        return [(self._values[-entry_id], round(score, 3), self._names[-entry_id])
+                for score, _, entry_id in sorted(top, reverse=True)]
+
+    def match(self, query, min_score=None):
+        """(valeur, score) du meilleur candidat, ou (None, 0.0) sous le score minimal"""
+        matches = self.best_matches(query, limit=1, min_score=min_score)
+        if not matches:
+            return None, 0.0
+        value, score, _ = matches[0]
+        return value, score
@@ -0,0 +1,163 @@
+"""
+Cache des résultats de parsing GPT des descriptions d'aliments.
+Les mêmes phrases reviennent sans cesse ("une pomme", "50g de poulet") et le prompt,
+fixe et à température basse, donne un résultat quasi déterministe : un hit évite
+complètement l'aller-retour OpenAI.
+
+Clé = version du prompt + texte normalisé (minuscules, sans accents, espaces réduits).
+Un LRU en mémoire sert les phrases chaudes ; la table food_parse_cache (SQLite) partage
+les résultats entre processus et redémarrages, avec TTL et éviction des moins utilisées.
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from database import get_connection, DATABASE
+from nutrition_database import normalize_food_name
+
+logger = logging.getLogger(__name__)
+
+# Configuration (surchargeable par variables d'environnement)
+FOOD_PARSE_CACHE_SIZE = int(os.getenv('FOOD_PARSE_CACHE_SIZE', 2000))
+FOOD_PARSE_CACHE_MAX_ROWS = int(os.getenv('FOOD_PARSE_CACHE_MAX_ROWS', 50000))
+FOOD_PARSE_CACHE_TTL_DAYS = float(os.getenv('FOOD_PARSE_CACHE_TTL_DAYS', 30))
+
+# Éviction en base au plus toutes les N écritures
+EVICTION_CHECK_INTERVAL = 500
+
+class FoodParseCache:
+    """LRU mémoire devant un stockage SQLite, avec TTL et compteurs"""
+
+    def __init__(self, memory_size=FOOD_PARSE_CACHE_SIZE, max_rows=FOOD_PARSE_CACHE_MAX_ROWS,
+                 ttl_seconds=FOOD_PARSE_CACHE_TTL_DAYS * 86400, db_path=DATABASE):
+        self.memory_size = memory_size
+        self.max_rows = max_rows
+        self.ttl_seconds = ttl_seconds
+        self.db_path = db_path
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._writes_since_eviction = 0
+        self._stats = {'memory_hits': 0, 'db_hits': 0, 'misses': 0, 'stores': 0, 'expired': 0, 'evicted': 0}
+
+    @staticmethod
+    def make_key(text, prompt_version):
+        return f"{prompt_version}:{normalize_food_name(text)}"
+
+    def get(self, text, prompt_version):
+        """Résultat en cache (copie) ou None"""
+        key = self.make_key(text, prompt_version)
+        now = time.time()
+
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                result, created_at = entry
+                if now - created_at < self.ttl_seconds:
+                    self._memory.move_to_end(key)
+                    self._stats['memory_hits'] += 1
+                    return json.loads(result)
+                del self._memory[key]
+
+        try:
+            conn = get_connection(self.db_path)
+            with conn:
+                row = conn.execute(
+                    'SELECT result, created_at FROM food_parse_cache WHERE cache_key = ?', (key,)
+                ).fetchone()
+
+                if row and now - row['created_at'] >= self.ttl_seconds:
+                    conn.execute('DELETE FROM food_parse_cache WHERE cache_key = ?', (key,))
+                    with self._lock:
+                        self._stats['expired'] += 1
+                    row = None
+
+                if row:
+                    conn.execute(
+                        'UPDATE food_parse_cache SET hits = hits + 1, last_hit_at = ? WHERE cache_key = ?',
+                        (now, key)
+                    )
+        except Exception as e:
+            logger.error(f"❌ Erreur lecture cache parsing: {e}")
+            row = None
+
+        with self._lock:
+            if not row:
+                self._stats['misses'] += 1
+                return None
+            self._stats['db_hits'] += 1
+            self._remember(key, row['result'], row['created_at'])
+
+        return json.loads(row['result'])
+
+    def set(self, text, prompt_version, result):
+        """Enregistre un résultat de parsing (mémoire + base)"""
+        key = self.make_key(text, prompt_version)
+        now = time.time()
+        serialized = json.dumps(result, ensure_ascii=False)
+
+        with self._lock:
+            self._remember(key, serialized, now)
+            self._stats['stores'] += 1
+            self._writes_since_eviction += 1
+            evict = self._writes_since_eviction >= EVICTION_CHECK_INTERVAL
+            if evict:
+                self._writes_since_eviction = 0
+
+        try:
+            conn = get_connection(self.db_path)
+            with conn:
+                conn.execute('''
+                    INSERT INTO food_parse_cache (cache_key, result, created_at, last_hit_at)
+                    VALUES (?, ?, ?, ?)
+                    ON CONFLICT(cache_key) DO UPDATE SET
+                        result = excluded.result,
+                        created_at = excluded.created_at,
+                        last_hit_at = excluded.last_hit_at
+                ''', (key, serialized, now, now))
+
+            if evict:
+                self.evict()
+        except Exception as e:
+            logger.error(f"❌ Erreur écriture cache parsing: {e}")
+
+    def evict(self):
+        """Supprime les entrées expirées, puis les moins récemment utilisées au-delà de max_rows"""
+        now = time.time()
+        conn = get_connection(self.db_path)
+
+        with conn:
+            expired = conn.execute(
+                'DELETE FROM food_parse_cache WHERE created_at < ?', (now - self.ttl_seconds,)
+            ).rowcount
+            evicted = conn.execute('''
+                DELETE FROM food_parse_cache WHERE cache_key IN (
+                    SELECT cache_key FROM food_parse_cache
+                    ORDER BY last_hit_at DESC
+                    LIMIT -1 OFFSET ?
+                )
+            ''', (self.max_rows,)).rowcount
+
+        with self._lock:
+            self._stats['expired'] += expired
+            self._stats['evicted'] += evicted
+
+    def _remember(self, key, result, created_at):
+        self._memory[key] = (result, created_at)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_size:
+            self._memory.popitem(last=False)
+
+    def stats(self):
+        """Hits (mémoire / base), misses, taux de hit et taille du LRU"""
+        with self._lock:
+            stats = dict(self._stats, memory_entries=len(self._memory))
+        lookups = stats['memory_hits'] + stats['db_hits'] + stats['misses']
+        stats['hit_rate'] = round((stats['memory_hits'] + stats['db_hits']) / lookups, 2) if lookups else 0
+        return stats
+
+# Instance globale pour utilisation dans l'app
+food_parse_cache = FoodParseCache()
@@ -0,0 +1,418 @@
+#!/usr/bin/env python3
+"""
+Table de composition nutritionnelle complète (CIQUAL, OpenFoodFacts) dans SQLite + FTS5.
+NUTRITION_DATABASE reste la source prioritaire (valeurs choisies à la main) ; ce store
+couvre tout le reste au lieu des valeurs par défaut.
+
+Import hors ligne, en flux : le fichier est lu ligne à ligne et inséré par lots, sans
+jamais charger le jeu de données en mémoire Python.
+    python food_store.py import Table_Ciqual.csv --source ciqual
+    python food_store.py import openfoodfacts-products.jsonl.gz --source off
+    python food_store.py search "salade de tomates"
+
+À l'exécution, lookup() interroge l'index FTS5, reclasse les candidats par similarité
+de trigrammes et garde les résultats chauds (et les absences) dans un LRU en mémoire.
+"""
+
+import argparse
+import csv
+import gzip
+import json
+import logging
+import os
+import re
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+from database import get_connection
+from food_matcher import STOP_WORDS, content_words, dice, trigrams, words_covered
+
+logger = logging.getLogger(__name__)
+
+# Configuration (surchargeable par variables d'environnement)
+FOOD_STORE_PATH = os.getenv('FOOD_STORE_PATH', 'food_store.db')
+FOOD_STORE_CACHE_SIZE = int(os.getenv('FOOD_STORE_CACHE_SIZE', 5000))
+FOOD_STORE_MIN_SCORE = float(os.getenv('FOOD_STORE_MIN_SCORE', 0.5))
+
+# Lignes insérées par transaction pendant l'import
+IMPORT_CHUNK_SIZE = 5000
+# Candidats FTS5 reclassés par similarité
+SEARCH_CANDIDATES = 20
+# Mots ignorés dans la requête FTS5
+FTS_STOP_WORDS = STOP_WORDS
+
+SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS foods (
+        id INTEGER PRIMARY KEY,
+        source TEXT NOT NULL,
+        source_id TEXT NOT NULL,
+        name TEXT NOT NULL,
+        name_norm TEXT NOT NULL,
+        cal REAL NOT NULL,
+        prot REAL NOT NULL,
+        fat REAL NOT NULL,
+        carb REAL NOT NULL,
+        UNIQUE (source, source_id)
+    );
+    CREATE INDEX IF NOT EXISTS idx_foods_name_norm ON foods(name_norm);
+    CREATE VIRTUAL TABLE IF NOT EXISTS foods_fts USING fts5(
+        name_norm,
+        content='foods',
+        content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2'
+    );
+'''
+
+# Sources prioritaires à nom égal (CIQUAL = référence ANSES)
+SOURCE_PRIORITY = {'ciqual': 0, 'off': 1}
+
+# Colonnes CIQUAL (préfixes des en-têtes normalisés)
+CIQUAL_COLUMNS = {
+    'source_id': ('alim_code',),
+    'name': ('alim_nom_fr',),
+    'cal': ('energie, reglement ue n 1169/2011 (kcal/100 g)', 'energie, reglement ue no 1169/2011 (kcal/100 g)', 'energie (kcal/100 g)'),
+    'prot': ('proteines, n x facteur de jones (g/100 g)', 'proteines, n x 6.25 (g/100 g)', 'proteines (g/100 g)'),
+    'fat': ('lipides (g/100 g)',),
+    'carb': ('glucides (g/100 g)',),
+}
+
+# Champs OpenFoodFacts (export CSV et JSONL)
+OFF_NAME_FIELDS = ('product_name_fr', 'product_name', 'generic_name_fr')
+OFF_NUTRIENTS = {
+    'cal': 'energy-kcal_100g',
+    'prot': 'proteins_100g',
+    'fat': 'fat_100g',
+    'carb': 'carbohydrates_100g',
+}
+
+def _normalize(text):
+    # Import tardif : nutrition_database importe ce module
+    from nutrition_database import normalize_food_name
+    return normalize_food_name(text)
+
+def _parse_value(value):
+    """'12,5' -> 12.5 ; '< 0,5' -> 0.5 ; 'traces' -> 0.0 ; '-' ou vide -> None"""
+    if value is None:
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    value = value.strip().lower()
+    if not value or value in ('-', 'nan'):
+        return None
+    if value == 'traces':
+        return 0.0
+    value = value.lstrip('<> ').replace(',', '.')
+    try:
+        return float(value)
+    except ValueError:
+        return None
+
+def _open_text(path):
+    if path.endswith('.gz'):
+        return gzip.open(path, 'rt', encoding='utf-8', newline='')
+    return open(path, 'r', encoding='utf-8-sig', newline='')
+
+# ===== LECTURE DES SOURCES (GÉNÉRATEURS) =====
+
+def _csv_rows(path):
+    """Lignes d'un CSV (séparateur détecté : ';', tabulation ou ',')"""
+    # Les exports OpenFoodFacts ont des champs très longs (ingrédients, catégories)
+    csv.field_size_limit(10 * 1024 * 1024)
+    with _open_text(path) as f:
+        header = f.readline()
+        delimiter = max(';\t,', key=header.count)
+        fieldnames = next(csv.reader([header], delimiter=delimiter))
+        yield from csv.DictReader(f, fieldnames=fieldnames, delimiter=delimiter)
+
+def _ciqual_column_map(fieldnames):
+    """Champ interne -> en-tête CIQUAL correspondant"""
+    normalized = {re.sub(r'[°º]', '', _normalize(name)).replace('  ', ' '): name for name in fieldnames}
+    mapping = {}
+    for field, candidates in CIQUAL_COLUMNS.items():
+        for candidate in candidates:
+            match = next((original for norm, original in normalized.items() if norm.startswith(candidate)), None)
+            if match:
+                mapping[field] = match
+                break
+    missing = set(CIQUAL_COLUMNS) - set(mapping)
+    if missing:
+        raise ValueError(f"Colonnes CIQUAL introuvables: {', '.join(sorted(missing))}")
+    return mapping
+
+def read_ciqual(path):
+    """Aliments CIQUAL : (source_id, nom, cal, prot, fat, carb) pour 100g"""
+    mapping = None
+    for row in _csv_rows(path):
+        if mapping is None:
+            mapping = _ciqual_column_map(row.keys())
+        name = (row.get(mapping['name']) or '').strip()
+        cal = _parse_value(row.get(mapping['cal']))
+        if not name or cal is None:
+            continue
+        yield (
+            row[mapping['source_id']].strip(),
+            name,
+            cal,
+            _parse_value(row.get(mapping['prot'])) or 0.0,
+            _parse_value(row.get(mapping['fat'])) or 0.0,
+            _parse_value(row.get(mapping['carb'])) or 0.0
+        )
+
+def _off_record(code, name_source, nutriments):
+    name = next((name_source.get(field) for field in OFF_NAME_FIELDS if name_source.get(field)), None)
+    if not code or not name:
+        return None
+
+    cal = _parse_value(nutriments.get(OFF_NUTRIENTS['cal']))
+    if cal is None:
+        # Certains produits n'ont que l'énergie en kJ
+        energy_kj = _parse_value(nutriments.get('energy_100g'))
+        cal = round(energy_kj / 4.184, 1) if energy_kj is not None else None
+    if cal is None:
+        return None
+
+    return (
+        str(code),
+        name.strip(),
+        cal,
+        _parse_value(nutriments.get(OFF_NUTRIENTS['prot'])) or 0.0,
+        _parse_value(nutriments.get(OFF_NUTRIENTS['fat'])) or 0.0,
+        _parse_value(nutriments.get(OFF_NUTRIENTS['carb'])) or 0.0
+    )
+
+def read_openfoodfacts(path):
+    """Produits OpenFoodFacts (export JSONL ou CSV, éventuellement .gz)"""
+    if '.jsonl' in path or '.json' in path:
+        with _open_text(path) as f:
+            for line in f:
+                try:
+                    product = json.loads(line)
+                except ValueError:
+                    continue
+                record = _off_record(product.get('code'), product, product.get('nutriments') or {})
+                if record:
+                    yield record
+    else:
+        for row in _csv_rows(path):
+            record = _off_record(row.get('code'), row, row)
+            if record:
+                yield record
+
+READERS = {
+    'ciqual': read_ciqual,
+    'off': read_openfoodfacts,
+}
+
+# ===== IMPORT =====
+
+def init_food_store(db_path=FOOD_STORE_PATH):
+    """Crée les tables du store si absentes"""
+    conn = get_connection(db_path)
+    conn.executescript(SCHEMA)
+    return conn
+
+def import_foods(path, source, db_path=FOOD_STORE_PATH, chunk_size=IMPORT_CHUNK_SIZE):
+    """
+    Importe un fichier source par lots de chunk_size lignes (une transaction par lot).
+    Réimporter une source met à jour les lignes existantes (clé source + source_id).
+    Retourne le nombre de lignes importées.
+    """
+    reader = READERS[source]
+    conn = init_food_store(db_path)
+    start = time.time()
+    imported = 0
+    chunk = []
+
+    def flush():
+        with conn:
+            conn.executemany('''
+                INSERT INTO foods (source, source_id, name, name_norm, cal, prot, fat, carb)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT(source, source_id) DO UPDATE SET
+                    name = excluded.name,
+                    name_norm = excluded.name_norm,
+                    cal = excluded.cal,
+                    prot = excluded.prot,
+                    fat = excluded.fat,
+                    carb = excluded.carb
+            ''', chunk)
+        chunk.clear()
+
+    for source_id, name, cal, prot, fat, carb in reader(path):
+        chunk.append((source, source_id, name, _normalize(name), cal, prot, fat, carb))
+        if len(chunk) >= chunk_size:
+            imported += len(chunk)
+            flush()
+            print(f"   … {imported} lignes", flush=True)
+
+    if chunk:
+        imported += len(chunk)
+        flush()
+
+    # Index FTS5 reconstruit une seule fois, après l'import
+    with conn:
+        conn.execute("INSERT INTO foods_fts(foods_fts) VALUES('rebuild')")
+        conn.execute("INSERT INTO foods_fts(foods_fts) VALUES('optimize')")
+
+    logger.info(f"✅ {imported} aliments importés depuis {path} ({source}) en {time.time() - start:.1f}s")
+    return imported
+
+# ===== RECHERCHE =====
+
+class FoodStore:
+    """Recherche dans le store SQLite, avec LRU des résultats chauds (absences comprises)"""
+
+    def __init__(self, db_path=FOOD_STORE_PATH, cache_size=FOOD_STORE_CACHE_SIZE, min_score=FOOD_STORE_MIN_SCORE):
+        self.db_path = db_path
+        self.cache_size = cache_size
+        self.min_score = min_score
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self._available = None
+        self._stats = {'cache_hits': 0, 'queries': 0, 'found': 0, 'not_found': 0, 'errors': 0}
+
+    def available(self):
+        """Vrai si le fichier du store existe (vérifié une fois ; sinon lookup() retourne None)"""
+        if self._available is None:
+            self._available = os.path.exists(self.db_path)
+        return self._available
+
+    def lookup(self, food_name):
+        """
+        Meilleur aliment pour ce nom : {'name', 'source', 'cal', 'prot', 'fat', 'carb', 'score'}
+        (valeurs pour 100g) ou None. Score 1.0 pour un nom identique, sinon similarité.
+        """
+        if not self.available():
+            return None
+
+        query = _normalize(food_name)
+        if not query:
+            return None
+
+        with self._lock:
+            if query in self._cache:
+                self._cache.move_to_end(query)
+                self._stats['cache_hits'] += 1
+                result = self._cache[query]
+                return dict(result) if result else None
+
+        try:
+            result = self._search(query)
+        except Exception as e:
+            logger.error(f"❌ Erreur recherche food store: {e}")
+            with self._lock:
+                self._stats['errors'] += 1
+            return None
+
+        with self._lock:
+            self._stats['queries'] += 1
+            self._stats['found' if result else 'not_found'] += 1
+            self._cache[query] = result
+            self._cache.move_to_end(query)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+        return dict(result) if result else None
+
+    def _search(self, query):
+        conn = get_connection(self.db_path)
+        columns = 'name, source, cal, prot, fat, carb'
+
+        rows = conn.execute(
+            f'SELECT {columns} FROM foods WHERE name_norm = ?', (query,)
+        ).fetchall()
+        if rows:
+            row = min(rows, key=lambda r: SOURCE_PRIORITY.get(r['source'], 9))
+            return dict(row, score=1.0)
+
+        # Tous les mots de la requête (préfixes), classés par BM25
+        words = [word for word in re.findall(r'\w+', query) if len(word) > 1 and word not in FTS_STOP_WORDS]
+        if not words:
+            return None
+        match = ' '.join(f'"{word}"*' for word in words)
+        rows = conn.execute(f'''
+            SELECT {columns}, foods.name_norm AS name_norm FROM foods_fts
+            JOIN foods ON foods.id = foods_fts.rowid
+            WHERE foods_fts MATCH ?
+            ORDER BY bm25(foods_fts)
+            LIMIT ?
+        ''', (match, SEARCH_CANDIDATES)).fetchall()
+
+        # Sans résultat avec tous les mots : n'importe lequel
+        if not rows and len(words) > 1:
+            rows = conn.execute(f'''
+                SELECT {columns}, foods.name_norm AS name_norm FROM foods_fts
+                JOIN foods ON foods.id = foods_fts.rowid
+                WHERE foods_fts MATCH ?
+                ORDER BY bm25(foods_fts)
+                LIMIT ?
+            ''', (' OR '.join(f'"{word}"*' for word in words), SEARCH_CANDIDATES)).fetchall()
+
+        if not rows:
+            return None
+
+        # Reclassement par similarité de trigrammes (Dice) sur le nom complet ou sa partie
+        # principale ("salade de tomates, sans assaisonnement"), puis source prioritaire
+        query_grams = trigrams(query)
+        query_words = content_words(query)
+        best, best_key = None, None
+        for row in rows:
+            # Chaque mot cherché doit figurer dans le nom : "compote" ne donne pas "comté"
+            if not words_covered(query_words, row['name_norm'])[0]:
+                continue
+            score = max(dice(query_grams, trigrams(name)) for name in {row['name_norm'], row['name_norm'].split(',')[0]})
+            key = (score, -SOURCE_PRIORITY.get(row['source'], 9))
+            if best_key is None or key > best_key:
+                best, best_key = row, key
+
+        if best is None or best_key[0] < self.min_score:
+            return None
+
+        result = {k: best[k] for k in ('name', 'source', 'cal', 'prot', 'fat', 'carb')}
+        result['score'] = round(best_key[0], 3)
+        return result
+
+    def count(self):
+        """Nombre d'aliments dans le store"""
+        if not self.available():
+            return 0
+        return get_connection(self.db_path).execute('SELECT COUNT(*) FROM foods').fetchone()[0]
+
+    def stats(self):
+        """Requêtes, hits du LRU, résultats trouvés / absents"""
+        with self._lock:
+            return dict(self._stats, available=self.available(), cached=len(self._cache))
+
+# Instance globale pour utilisation dans l'app
+food_store = FoodStore()
+
+def main():
+    parser = argparse.ArgumentParser(description="Store nutritionnel SQLite (CIQUAL / OpenFoodFacts)")
+    parser.add_argument('--db', default=FOOD_STORE_PATH, help=f"fichier SQLite (défaut: {FOOD_STORE_PATH})")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    import_parser = commands.add_parser('import', help="importer un fichier CIQUAL ou OpenFoodFacts")
+    import_parser.add_argument('path')
+    import_parser.add_argument('--source', choices=sorted(READERS), required=True)
+    import_parser.add_argument('--chunk-size', type=int, default=IMPORT_CHUNK_SIZE)
+
+    search_parser = commands.add_parser('search', help="tester une recherche")
+    search_parser.add_argument('name')
+
+    args = parser.parse_args()
+
+    if args.command == 'import':
+        print(f"📥 Import {args.source}: {args.path} -> {args.db}")
+        count = import_foods(args.path, args.source, db_path=args.db, chunk_size=args.chunk_size)
+        print(f"✅ {count} aliments importés")
+    else:
+        store = FoodStore(db_path=args.db)
+        result = store.lookup(args.name)
+        print(json.dumps(result, ensure_ascii=False, indent=2) if result else "❌ Aucun aliment trouvé")
+        if result is None and not store.available():
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,187 @@
+"""
+Parser local des descriptions de repas ("2 œufs et 150g de riz", "un bol de muesli").
+Déterministe et sans appel réseau : la plupart des messages sont de simples
+« quantité + aliment ». Chaque aliment reçoit un score de confiance ; au-dessus
+du seuil, analyze_text_improved saute l'appel GPT.
+
+Le résultat a le même format que le parsing GPT :
+{'aliments': [{'aliment', 'quantite', 'unite', 'poids_estime'}], 'confidence': 0..1}
+"""
+
+import os
+import re
+
+from nutrition_database import PIECE_WEIGHTS, is_known_food, normalize_food_name
+
+# Seuil de confiance pour se passer de GPT
+LOCAL_PARSE_MIN_CONFIDENCE = float(os.getenv('LOCAL_PARSE_MIN_CONFIDENCE', 0.85))
+
+NUMBER_WORDS = {
+    'un': 1, 'une': 1, 'deux': 2, 'trois': 3, 'quatre': 4, 'cinq': 5,
+    'six': 6, 'sept': 7, 'huit': 8, 'neuf': 9, 'dix': 10, 'onze': 11,
+    'douze': 12, 'quinze': 15, 'vingt': 20, 'trente': 30,
+    'demi': 0.5, 'demie': 0.5,
+}
+
+# Fractions exprimées en mots ("un demi", "une moitié de", "un quart de")
+FRACTION_WORDS = {
+    'un demi': 0.5, 'une demi': 0.5, 'une demie': 0.5, 'une moitie': 0.5,
+    'la moitie': 0.5, 'un quart': 0.25, 'trois quarts': 0.75,
+}
+
+# (regex, libellé, grammes par unité ou None si poids par aliment, confiance)
+UNITS = [
+    (r'kg|kilos?|kilogrammes?', 'kg', 1000, 0.95),
+    (r'g|gr|grs|grammes?', 'g', 1, 0.95),
+    (r'ml|millilitres?', 'ml', 1, 0.95),
+    (r'cl|centilitres?', 'cl', 10, 0.95),
+    (r'l|litres?', 'l', 1000, 0.95),
+    (r'cuilleres? a soupe|c\. ?a ?s\.?|cas|cs', 'c. à soupe', 15, 0.85),
+    (r'cuilleres? a cafe|c\. ?a ?c\.?|cac|cc', 'c. à café', 5, 0.85),
+    (r'cuilleres?', 'cuillère', 15, 0.75),
+    (r'tranches?', 'tranche', None, 0.85),
+    (r'bols?', 'bol', 250, 0.7),
+    (r'verres?', 'verre', 200, 0.85),
+    (r'tasses?', 'tasse', 200, 0.8),
+]
+
+_NUMBER = r'\d+(?:[.,]\d+)?(?:\s*/\s*\d+)?'
+_NUMBER_WORD = '|'.join(sorted(NUMBER_WORDS, key=len, reverse=True))
+_FRACTION_WORD = '|'.join(sorted(FRACTION_WORDS, key=len, reverse=True))
+
+# Les chiffres peuvent être collés à l'unité ("100g"), pas les nombres en lettres
+_QUANTITY_RE = re.compile(rf'^(?:(?P<number>{_NUMBER})|(?:(?P<fraction>{_FRACTION_WORD})|(?P<word>{_NUMBER_WORD}))(?![\w]))\s*')
+_UNIT_RES = [(re.compile(rf'^(?:{pattern})(?![\w])\.?\s*'), label, grams, confidence)
+             for pattern, label, grams, confidence in UNITS]
+_CONNECTOR_RE = re.compile(r"^(?:de la |de l'|du |des |de |d')\s*")
+# Virgule séparatrice, sauf virgule décimale ("1,5 kg")
+_SPLIT_RE = re.compile(r"\s*(?:(?<!\d),|,(?!\d)|;|\+|\bet\b|\bavec\b|\bplus\b)\s*")
+
+def _parse_number(value):
+    value = value.replace(' ', '').replace(',', '.')
+    if '/' in value:
+        numerator, denominator = value.split('/', 1)
+        return float(numerator) / float(denominator) if float(denominator) else None
+    return float(value)
+
+def _singular(name):
+    return ' '.join(word[:-1] if len(word) > 3 and word[-1] in 'sx' else word for word in name.split())
+
+def _known_food(name):
+    """Nom de l'aliment tel que connu de la base (forme donnée, sans accents ou au singulier)"""
+    for candidate in (name, normalize_food_name(name), _singular(name), _singular(normalize_food_name(name))):
+        if is_known_food(candidate):
+            return candidate
+    return None
+
+_FOLDED_PIECE_WEIGHTS = {normalize_food_name(key): weight for key, weight in PIECE_WEIGHTS.items()}
+
+def _piece_weight(name):
+    """Poids d'une pièce si connu (sans accents, forme donnée ou au singulier)"""
+    folded = normalize_food_name(name)
+    return _FOLDED_PIECE_WEIGHTS.get(folded) or _FOLDED_PIECE_WEIGHTS.get(_singular(folded))
+
+def _clean_number(value):
+    return int(value) if float(value).is_integer() else round(value, 2)
+
+def parse_food_segment(segment):
+    """Parse « quantité [unité] [de] aliment » ; retourne (aliment, confiance) ou None"""
+    original = re.sub(r'\s+', ' ', segment.lower().replace('’', "'").replace('œ', 'oe')).strip(" .!?")
+    folded = normalize_food_name(original)
+    if not folded:
+        return None
+
+    # Les regex travaillent sur le texte sans accents ; le nom d'aliment est repris du texte d'origine
+    offset = 0
+    quantity = None
+    match = _QUANTITY_RE.match(folded)
+    if match:
+        if match.group('fraction'):
+            quantity = FRACTION_WORDS[match.group('fraction')]
+        elif match.group('number'):
+            quantity = _parse_number(match.group('number'))
+        else:
+            quantity = NUMBER_WORDS[match.group('word')]
+        offset = match.end()
+
+    unit = None
+    if quantity is not None:
+        for unit_re, label, grams, confidence in _UNIT_RES:
+            unit_match = unit_re.match(folded[offset:])
+            if unit_match:
+                unit = (label, grams, confidence)
+                offset += unit_match.end()
+                break
+
+    connector = _CONNECTOR_RE.match(folded[offset:])
+    if connector:
+        offset += connector.end()
+
+    # Même longueur = seuls des accents ont été retirés : on garde l'orthographe d'origine
+    food = (original if len(original) == len(folded) else folded)[offset:].strip(" .!?")
+    if not food:
+        return None
+
+    known = _known_food(food)
+
+    if quantity is None:
+        # Pas de quantité : portion de 100g, GPT estimera mieux
+        aliment = {'aliment': food, 'quantite': 100, 'unite': 'g', 'poids_estime': 100}
+        confidence = 0.4
+    elif unit and unit[1] is not None:
+        label, grams, confidence = unit
+        aliment = {
+            'aliment': food,
+            'quantite': _clean_number(quantity),
+            'unite': label,
+            'poids_estime': _clean_number(quantity * grams)
+        }
+    elif unit:
+        # Tranche : poids selon l'aliment ("tranche de jambon"), sinon tranche de pain
+        label, _, confidence = unit
+        weight = _piece_weight(f"tranche de {food}") or PIECE_WEIGHTS['tranche']
+        aliment = {
+            'aliment': food,
+            'quantite': _clean_number(quantity),
+            'unite': label + ('s' if quantity > 1 else ''),
+            'poids_estime': _clean_number(quantity * weight)
+        }
+    else:
+        # Pièces : poids moyen d'une unité
+        weight = _piece_weight(food)
+        confidence = 0.9 if weight else 0.5
+        aliment = {
+            'aliment': food,
+            'quantite': _clean_number(quantity),
+            'unite': 'pieces',
+            'poids_estime': _clean_number(quantity * (weight or 100))
+        }
+
+    if not known:
+        confidence *= 0.3
+
+    return aliment, round(confidence, 2)
+
+def parse_food_text(text):
+    """
+    Parse une description de repas complète (aliments séparés par virgules, "et", "avec"...).
+    Retourne {'aliments': [...], 'confidence': min des confiances} ou None.
+    """
+    if not text or not text.strip():
+        return None
+
+    aliments = []
+    confidences = []
+    for segment in _SPLIT_RE.split(text.lower()):
+        if not segment.strip():
+            continue
+        parsed = parse_food_segment(segment)
+        if parsed:
+            aliment, confidence = parsed
+            aliments.append(aliment)
+            confidences.append(confidence)
+
+    if not aliments:
+        return None
+
+    return {'aliments': aliments, 'confidence': min(confidences)}
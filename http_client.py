@@ -0,0 +1,140 @@
+"""
+Client HTTP partagé pour les appels sortants (OpenAI, Graph API Meta, médias Twilio).
+Une seule session requests, avec un pool de connexions keep-alive réglé par hôte :
+les appels suivants réutilisent la connexion TCP/TLS au lieu de la rétablir à chaque fois.
+"""
+
+import os
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# Configuration (surchargeable par variables d'environnement)
+HTTP_POOL_MAXSIZE = int(os.getenv('HTTP_POOL_MAXSIZE', 20))
+# Hôtes distincts gardés en pool par l'adapter générique (CDN Twilio, lookaside Meta...)
+HTTP_POOL_CONNECTIONS = int(os.getenv('HTTP_POOL_CONNECTIONS', 10))
+HTTP_CONNECT_TIMEOUT = float(os.getenv('HTTP_CONNECT_TIMEOUT', 5))
+HTTP_READ_TIMEOUT = float(os.getenv('HTTP_READ_TIMEOUT', 30))
+# Graph API Meta : réponses courtes, on échoue plus vite qu'ailleurs
+HTTP_GRAPH_READ_TIMEOUT = float(os.getenv('HTTP_GRAPH_READ_TIMEOUT', HTTP_READ_TIMEOUT / 2))
+# Taille max d'un média téléchargé (photo, audio)
+MEDIA_MAX_BYTES = int(os.getenv('MEDIA_MAX_BYTES', 10 * 1024 * 1024))
+
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+
+# Réglages par hôte : taille du pool et timeout de lecture par défaut
+HOST_SETTINGS = {
+    'api.openai.com': {'pool_maxsize': HTTP_POOL_MAXSIZE, 'read_timeout': HTTP_READ_TIMEOUT},
+    'graph.facebook.com': {'pool_maxsize': HTTP_POOL_MAXSIZE, 'read_timeout': HTTP_GRAPH_READ_TIMEOUT},
+    'api.twilio.com': {'pool_maxsize': max(4, HTTP_POOL_MAXSIZE // 2), 'read_timeout': HTTP_READ_TIMEOUT},
+}
+
+_session = None
+_session_lock = threading.Lock()
+
+def _make_adapter(pool_maxsize, pool_connections=1):
+    """
+    Adapter keep-alive ; nouvelle tentative uniquement si la connexion n'a pas pu s'établir.
+    pool_connections = nombre d'hôtes dont le pool est gardé (1 pour un adapter monté par hôte).
+    """
+    retries = Retry(total=2, connect=2, read=0, status=0, redirect=0, backoff_factor=0.2)
+    return HTTPAdapter(pool_connections=pool_connections, pool_maxsize=pool_maxsize, max_retries=retries)
+
+def get_session():
+    """Session partagée (créée au premier appel, thread-safe)"""
+    global _session
+
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                session = requests.Session()
+                session.mount('https://', _make_adapter(HTTP_POOL_MAXSIZE, HTTP_POOL_CONNECTIONS))
+                session.mount('http://', _make_adapter(HTTP_POOL_MAXSIZE, HTTP_POOL_CONNECTIONS))
+                for host, settings in HOST_SETTINGS.items():
+                    session.mount(f'https://{host}/', _make_adapter(settings['pool_maxsize']))
+                _session = session
+
+    return _session
+
+def _default_timeout(url):
+    """Timeout (connexion, lecture) par défaut selon l'hôte"""
+    host = requests.utils.urlparse(url).hostname or ''
+    read_timeout = HOST_SETTINGS.get(host, {}).get('read_timeout', HTTP_READ_TIMEOUT)
+    return (HTTP_CONNECT_TIMEOUT, read_timeout)
+
+def request(method, url, **kwargs):
+    """Requête via la session partagée ; timeout par hôte si non précisé"""
+    if kwargs.get('timeout') is None:
+        kwargs['timeout'] = _default_timeout(url)
+    elif not isinstance(kwargs['timeout'], tuple):
+        kwargs['timeout'] = (HTTP_CONNECT_TIMEOUT, kwargs['timeout'])
+
+    return get_session().request(method, url, **kwargs)
+
+def get(url, **kwargs):
+    return request('GET', url, **kwargs)
+
+def post(url, **kwargs):
+    return request('POST', url, **kwargs)
+
+class MediaDownloadError(Exception):
+    """Média refusé : statut HTTP, type de contenu ou taille"""
+
+class MediaRejectedError(MediaDownloadError):
+    """Média reçu mais refusé (trop gros ou mauvais type) : l'utilisateur doit en envoyer un autre"""
+
+def download(url, max_bytes=MEDIA_MAX_BYTES, content_types=('image/',), **kwargs):
+    """
+    Télécharge un média en flux, par blocs, sans dépasser max_bytes en mémoire.
+    Refuse (MediaDownloadError) un statut autre que 200 ; refuse (MediaRejectedError) un
+    Content-Type hors content_types ou un contenu trop gros, annoncé (Content-Length) ou
+    constaté en cours de lecture.
+    Retourne un bytearray.
+    """
+    with request('GET', url, stream=True, **kwargs) as response:
+        if response.status_code != 200:
+            raise MediaDownloadError(f"HTTP {response.status_code}")
+        
+        content_type = response.headers.get('Content-Type', '').split(';')[0].strip().lower()
+        if content_types and not content_type.startswith(tuple(content_types)):
+            raise MediaRejectedError(f"type de contenu refusé: {content_type or 'inconnu'}")
+        
+        declared = response.headers.get('Content-Length', '')
+        if declared.isdigit() and int(declared) > max_bytes:
+            raise MediaRejectedError(f"média trop gros: {declared} octets (max {max_bytes})")
+        
+        data = bytearray()
+        for chunk in response.iter_content(DOWNLOAD_CHUNK_SIZE):
+            data += chunk
+            if len(data) > max_bytes:
+                raise MediaRejectedError(f"média trop gros: plus de {max_bytes} octets")
+        
+        return data
+
+def get_pool_stats():
+    """
+    Réutilisation des connexions par hôte : connexions ouvertes vs requêtes envoyées.
+    reuse_ratio = part des requêtes servies par une connexion déjà ouverte.
+    """
+    if _session is None:
+        return {}
+
+    stats = {}
+    adapters = {id(adapter): adapter for adapter in _session.adapters.values()}
+    for adapter in adapters.values():
+        pools = adapter.poolmanager.pools
+        for key in pools.keys():
+            pool = pools.get(key)
+            if pool is None:
+                continue
+            host_stats = stats.setdefault(pool.host, {'connections': 0, 'requests': 0})
+            host_stats['connections'] += pool.num_connections
+            host_stats['requests'] += pool.num_requests
+
+    for host_stats in stats.values():
+        requests_count = host_stats['requests']
+        host_stats['reuse_ratio'] = round(1 - host_stats['connections'] / requests_count, 2) if requests_count else 0
+
+    return stats
@@ -0,0 +1,279 @@
+"""
+Cache des analyses de photos de repas, indexé par hash perceptuel (dHash 64 bits).
+Une photo renvoyée, réessayée après une erreur ou reprise quelques secondes plus tard
+donne un hash identique ou à quelques bits près : on réutilise la liste d'aliments
+déjà obtenue au lieu de repayer un appel GPT-4o Vision.
+
+Les hash sont rangés dans un BK-tree (distance de Hamming) : une recherche « à moins de
+N bits » ne visite qu'une petite partie de l'arbre. La table image_analysis_cache
+(SQLite) conserve les entrées entre redémarrages ; seuls les hash et les aliments sont
+stockés, jamais l'image.
+"""
+
+import io
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from PIL import Image, UnidentifiedImageError
+
+from database import get_connection, DATABASE
+
+logger = logging.getLogger(__name__)
+
+# Configuration (surchargeable par variables d'environnement)
+IMAGE_CACHE_MAX_DISTANCE = int(os.getenv('IMAGE_CACHE_MAX_DISTANCE', 4))
+IMAGE_CACHE_SIZE = int(os.getenv('IMAGE_CACHE_SIZE', 5000))
+IMAGE_CACHE_TTL_DAYS = float(os.getenv('IMAGE_CACHE_TTL_DAYS', 30))
+
+# Photo uniforme (sombre, surexposée, assiette vide, bruit) : écart de luminance minimal
+# sur la vignette 9x8, sinon pas de hash (toutes ces photos donneraient 0)
+DHASH_MIN_CONTRAST = 12
+# Hash avec trop peu (ou trop de) bits à 1 : jamais mis en cache ni cherché
+DHASH_MIN_BITS = 6
+# Hash peu informatif : seule une correspondance exacte est acceptée
+DHASH_EXACT_MATCH_BITS = 16
+
+def dhash(image_bytes, hash_size=8):
+    """Hash perceptuel 64 bits (différences horizontales de luminance), ou None si illisible ou uniforme"""
+    try:
+        image = Image.open(io.BytesIO(image_bytes))
+        image.draft('L', (hash_size * 8, hash_size * 8))
+        pixels = list(image.convert('L').resize((hash_size + 1, hash_size), Image.LANCZOS).getdata())
+    except (UnidentifiedImageError, OSError, ValueError, Image.DecompressionBombError):
+        return None
+
+    if max(pixels) - min(pixels) < DHASH_MIN_CONTRAST:
+        return None
+
+    value = 0
+    for row in range(hash_size):
+        offset = row * (hash_size + 1)
+        for col in range(hash_size):
+            value = (value << 1) | (pixels[offset + col] > pixels[offset + col + 1])
+    return value
+
+def hamming(a, b):
+    return (a ^ b).bit_count()
+
+def _bits_from_edges(image_hash):
+    """Distance au hash dégénéré le plus proche (tout à 0 ou tout à 1)"""
+    bits = image_hash.bit_count()
+    return min(bits, 64 - bits)
+
+def is_degenerate(image_hash):
+    """Hash qui ne distingue pas les photos entre elles (à ne pas mettre en cache)"""
+    return image_hash is None or _bits_from_edges(image_hash) < DHASH_MIN_BITS
+
+def _exact_match_only(image_hash):
+    return _bits_from_edges(image_hash) < DHASH_EXACT_MATCH_BITS
+
+def _to_signed(value):
+    """Hash 64 bits non signé -> INTEGER SQLite (signé)"""
+    return value - (1 << 64) if value >= 1 << 63 else value
+
+def _to_unsigned(value):
+    return value + (1 << 64) if value < 0 else value
+
+class BKTree:
+    """BK-tree sur la distance de Hamming ; suppression paresseuse (reconstruction si besoin)"""
+
+    def __init__(self):
+        self._root = None
+        self._size = 0
+        self._removed = set()
+
+    def __len__(self):
+        return self._size - len(self._removed)
+
+    def add(self, value):
+        if value in self._removed:
+            self._removed.discard(value)
+            return
+        if self._root is None:
+            self._root = (value, {})
+            self._size = 1
+            return
+
+        node = self._root
+        while True:
+            distance = hamming(value, node[0])
+            if distance == 0:
+                return
+            child = node[1].get(distance)
+            if child is None:
+                node[1][distance] = (value, {})
+                self._size += 1
+                return
+            node = child
+
+    def remove(self, value):
+        self._removed.add(value)
+        # Arbre reconstruit quand la moitié des nœuds sont supprimés
+        if len(self._removed) > self._size // 2:
+            values = [v for v in self._values() if v not in self._removed]
+            self._root, self._size, self._removed = None, 0, set()
+            for v in values:
+                self.add(v)
+
+    def _values(self):
+        stack = [self._root] if self._root else []
+        while stack:
+            value, children = stack.pop()
+            yield value
+            stack.extend(children.values())
+
+    def nearest(self, value, max_distance):
+        """(valeur, distance) la plus proche à max_distance au plus, ou (None, None)"""
+        best, best_distance = None, max_distance + 1
+        stack = [self._root] if self._root else []
+        while stack:
+            node_value, children = stack.pop()
+            distance = hamming(value, node_value)
+            if distance < best_distance and node_value not in self._removed:
+                best, best_distance = node_value, distance
+                if distance == 0:
+                    break
+            # Inégalité triangulaire : seuls les enfants à |d - k| <= rayon peuvent convenir
+            radius = min(best_distance - 1, max_distance)
+            for child_distance, child in children.items():
+                if distance - radius <= child_distance <= distance + radius:
+                    stack.append(child)
+        return (best, best_distance) if best is not None else (None, None)
+
+class ImageAnalysisCache:
+    """Hash perceptuel -> aliments détectés ; BK-tree + LRU en mémoire, SQLite en persistance"""
+
+    def __init__(self, max_distance=IMAGE_CACHE_MAX_DISTANCE, max_entries=IMAGE_CACHE_SIZE,
+                 ttl_seconds=IMAGE_CACHE_TTL_DAYS * 86400, db_path=DATABASE):
+        self.max_distance = max_distance
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.db_path = db_path
+        self._tree = BKTree()
+        # hash -> (aliments JSON, created_at), ordre = dernier accès
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._loaded = False
+        self._stats = {'hits': 0, 'near_hits': 0, 'misses': 0, 'stores': 0, 'evicted': 0, 'unhashable': 0}
+
+    def _load(self):
+        """Charge les entrées persistées (une fois, au premier usage)"""
+        if self._loaded:
+            return
+        self._loaded = True
+        try:
+            conn = get_connection(self.db_path)
+            rows = conn.execute('''
+                SELECT image_hash, aliments, created_at FROM image_analysis_cache
+                WHERE created_at >= ?
+                ORDER BY last_hit_at DESC
+                LIMIT ?
+            ''', (time.time() - self.ttl_seconds, self.max_entries)).fetchall()
+        except Exception as e:
+            logger.error(f"❌ Erreur chargement cache images: {e}")
+            return
+
+        for row in reversed(rows):
+            image_hash = _to_unsigned(row['image_hash'])
+            if is_degenerate(image_hash):
+                continue
+            self._entries[image_hash] = (row['aliments'], row['created_at'])
+            self._tree.add(image_hash)
+
+    def get(self, image_hash):
+        """Aliments en cache pour une image identique ou proche, ou None"""
+        if is_degenerate(image_hash):
+            with self._lock:
+                self._stats['unhashable'] += 1
+            return None
+
+        now = time.time()
+        # Hash peu informatif : deux repas différents pourraient tomber à quelques bits
+        max_distance = 0 if _exact_match_only(image_hash) else self.max_distance
+        with self._lock:
+            self._load()
+            match, distance = self._tree.nearest(image_hash, max_distance)
+            if match is not None and distance and _exact_match_only(match):
+                match = None
+            elif match is not None and now - self._entries[match][1] >= self.ttl_seconds:
+                self._forget(match)
+                match = None
+
+            if match is None:
+                self._stats['misses'] += 1
+                return None
+
+            self._entries.move_to_end(match)
+            self._stats['hits' if distance == 0 else 'near_hits'] += 1
+            aliments = self._entries[match][0]
+
+        try:
+            conn = get_connection(self.db_path)
+            with conn:
+                conn.execute(
+                    'UPDATE image_analysis_cache SET hits = hits + 1, last_hit_at = ? WHERE image_hash = ?',
+                    (now, _to_signed(match))
+                )
+        except Exception as e:
+            logger.error(f"❌ Erreur mise à jour cache images: {e}")
+
+        logger.info(f"📸 Photo déjà analysée (distance {distance} bits)")
+        return json.loads(aliments)
+
+    def set(self, image_hash, aliments):
+        """Enregistre la liste d'aliments détectés pour ce hash"""
+        if is_degenerate(image_hash) or not aliments:
+            return
+
+        now = time.time()
+        serialized = json.dumps(aliments, ensure_ascii=False)
+        evicted = []
+
+        with self._lock:
+            self._load()
+            self._entries[image_hash] = (serialized, now)
+            self._entries.move_to_end(image_hash)
+            self._tree.add(image_hash)
+            self._stats['stores'] += 1
+            while len(self._entries) > self.max_entries:
+                oldest = next(iter(self._entries))
+                self._forget(oldest)
+                evicted.append(_to_signed(oldest))
+
+        try:
+            conn = get_connection(self.db_path)
+            with conn:
+                conn.execute('''
+                    INSERT INTO image_analysis_cache (image_hash, aliments, created_at, last_hit_at)
+                    VALUES (?, ?, ?, ?)
+                    ON CONFLICT(image_hash) DO UPDATE SET
+                        aliments = excluded.aliments,
+                        created_at = excluded.created_at,
+                        last_hit_at = excluded.last_hit_at
+                ''', (_to_signed(image_hash), serialized, now, now))
+                if evicted:
+                    conn.executemany('DELETE FROM image_analysis_cache WHERE image_hash = ?', [(h,) for h in evicted])
+                conn.execute('DELETE FROM image_analysis_cache WHERE created_at < ?', (now - self.ttl_seconds,))
+        except Exception as e:
+            logger.error(f"❌ Erreur écriture cache images: {e}")
+
+    def _forget(self, image_hash):
+        # Appelé sous self._lock
+        del self._entries[image_hash]
+        self._tree.remove(image_hash)
+        self._stats['evicted'] += 1
+
+    def stats(self):
+        """Hits exacts / proches, misses, taux de hit et nombre d'entrées"""
+        with self._lock:
+            stats = dict(self._stats, entries=len(self._entries))
+        lookups = stats['hits'] + stats['near_hits'] + stats['misses']
+        stats['hit_rate'] = round((stats['hits'] + stats['near_hits']) / lookups, 2) if lookups else 0
+        return stats
+
+# Instance globale pour utilisation dans l'app
+image_cache = ImageAnalysisCache()
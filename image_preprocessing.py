@@ -0,0 +1,97 @@
+"""
+Préparation des photos de repas avant l'envoi à GPT-4o Vision.
+Une photo de téléphone fait souvent 3 à 5 Mo (6 Mo et plus une fois en base64 dans le
+JSON) alors que le modèle la redimensionne de toute façon. On décode, on applique puis
+retire l'EXIF (orientation, GPS), on réduit le grand côté à VISION_MAX_EDGE et on
+réencode en JPEG : upload plus rapide, moins de tokens, même qualité d'analyse.
+"""
+
+import io
+import logging
+import os
+import threading
+import time
+
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+logger = logging.getLogger(__name__)
+
+# Configuration (surchargeable par variables d'environnement)
+VISION_MAX_EDGE = int(os.getenv('VISION_MAX_EDGE', 1024))
+VISION_JPEG_QUALITY = int(os.getenv('VISION_JPEG_QUALITY', 80))
+# 'auto' : 'low' si l'image tient dans 512px (85 tokens fixes), sinon 'high' ; ou forcer 'low' / 'high'
+VISION_DETAIL = os.getenv('VISION_DETAIL', 'auto')
+
+# Taille d'une tuile en détail 'low' chez OpenAI
+LOW_DETAIL_EDGE = 512
+
+_stats_lock = threading.Lock()
+_stats = {'images': 0, 'failures': 0, 'bytes_in': 0, 'bytes_out': 0, 'total_ms': 0.0}
+
+def _pick_detail(width, height):
+    if VISION_DETAIL in ('low', 'high'):
+        return VISION_DETAIL
+    return 'low' if max(width, height) <= LOW_DETAIL_EDGE else 'high'
+
+def prepare_image(image_bytes, max_edge=None, quality=None):
+    """
+    Retourne {'data', 'mime', 'detail', 'width', 'height', 'original_bytes', 'bytes', 'elapsed_ms'}.
+    Si l'image ne peut pas être décodée (format non supporté), les octets d'origine sont
+    renvoyés tels quels avec detail 'auto'.
+    """
+    max_edge = max_edge or VISION_MAX_EDGE
+    quality = quality or VISION_JPEG_QUALITY
+    start = time.time()
+
+    try:
+        image = Image.open(io.BytesIO(image_bytes))
+        # JPEG : décodage directement à l'échelle réduite (bien plus rapide sur les grandes photos)
+        image.draft('RGB', (max_edge, max_edge))
+        image = ImageOps.exif_transpose(image)
+        if image.mode != 'RGB':
+            image = image.convert('RGB')
+        image.thumbnail((max_edge, max_edge), Image.LANCZOS)
+
+        output = io.BytesIO()
+        # Sans paramètre exif : les métadonnées (GPS, appareil) ne sont pas recopiées
+        image.save(output, format='JPEG', quality=quality, optimize=True)
+        data = output.getvalue()
+        width, height = image.size
+        result = {
+            'data': data,
+            'mime': 'image/jpeg',
+            'detail': _pick_detail(width, height),
+            'width': width,
+            'height': height
+        }
+    except (UnidentifiedImageError, OSError, ValueError, Image.DecompressionBombError) as e:
+        logger.warning(f"⚠️ Image non prétraitée ({e}), envoi de l'original")
+        with _stats_lock:
+            _stats['failures'] += 1
+        result = {'data': image_bytes, 'mime': 'image/jpeg', 'detail': 'auto', 'width': None, 'height': None}
+
+    elapsed_ms = (time.time() - start) * 1000
+    result.update(original_bytes=len(image_bytes), bytes=len(result['data']), elapsed_ms=round(elapsed_ms, 1))
+
+    with _stats_lock:
+        _stats['images'] += 1
+        _stats['bytes_in'] += len(image_bytes)
+        _stats['bytes_out'] += len(result['data'])
+        _stats['total_ms'] += elapsed_ms
+
+    logger.info(
+        f"🖼️ Image préparée: {len(image_bytes) // 1024} Ko -> {len(result['data']) // 1024} Ko "
+        f"({result['width']}x{result['height']}, detail={result['detail']}, {elapsed_ms:.0f} ms)"
+    )
+    return result
+
+def get_image_stats():
+    """Images traitées, échecs de décodage, octets économisés et latence moyenne"""
+    with _stats_lock:
+        stats = dict(_stats)
+    images = stats.pop('images')
+    total_ms = stats.pop('total_ms')
+    stats['images'] = images
+    stats['bytes_saved'] = stats['bytes_in'] - stats['bytes_out']
+    stats['avg_ms'] = round(total_ms / images, 1) if images else 0
+    return stats
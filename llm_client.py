@@ -0,0 +1,220 @@
+"""
+Client OpenAI asynchrone partagé (parsing d'aliments, vision, chat).
+Les requêtes tournent sur une boucle asyncio dédiée (un seul thread) avec un
+httpx.AsyncClient keep-alive : des centaines d'appels peuvent être en vol sans
+autant de threads. Un sémaphore global et un sémaphore par modèle plafonnent
+la concurrence ; les wrappers synchrones gardent l'usage actuel des appelants.
+"""
+
+import asyncio
+import base64
+import json
+import logging
+import os
+import threading
+import time
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+OPENAI_BASE_URL = os.getenv('OPENAI_BASE_URL', 'https://api.openai.com/v1')
+
+# Appels simultanés max : tous modèles confondus, puis par modèle
+LLM_MAX_CONCURRENCY = int(os.getenv('LLM_MAX_CONCURRENCY', 200))
+LLM_DEFAULT_MODEL_CONCURRENCY = int(os.getenv('LLM_DEFAULT_MODEL_CONCURRENCY', 50))
+
+def _parse_model_limits(value):
+    """'gpt-4o=20,gpt-4o-mini=100' -> {'gpt-4o': 20, 'gpt-4o-mini': 100}"""
+    limits = {}
+    for item in value.split(','):
+        if '=' in item:
+            model, limit = item.split('=', 1)
+            limits[model.strip()] = int(limit)
+    return limits
+
+LLM_MODEL_CONCURRENCY = _parse_model_limits(os.getenv('LLM_MODEL_CONCURRENCY', 'gpt-4o=20,gpt-4o-mini=100'))
+LLM_DEFAULT_TIMEOUT = float(os.getenv('LLM_DEFAULT_TIMEOUT', 30))
+
+# Marqueur remplacé par la pièce jointe encodée en base64 dans le corps de la requête
+ATTACHMENT_PLACEHOLDER = '__LEA_ATTACHMENT_BASE64__'
+# Blocs encodés un par un (multiple de 3 : pas de padding base64 au milieu du flux)
+ATTACHMENT_CHUNK_SIZE = 48 * 1024
+
+def attachment_body(payload, attachment):
+    """
+    Corps JSON en flux : (longueur, générateur async d'octets). La pièce jointe est encodée
+    en base64 bloc par bloc à l'endroit du marqueur, sans jamais construire la chaîne complète.
+    """
+    prefix, suffix = json.dumps(payload).encode('utf-8').split(ATTACHMENT_PLACEHOLDER.encode('ascii'), 1)
+    view = memoryview(attachment)
+    length = len(prefix) + 4 * ((len(view) + 2) // 3) + len(suffix)
+
+    async def chunks():
+        yield prefix
+        for start in range(0, len(view), ATTACHMENT_CHUNK_SIZE):
+            yield base64.b64encode(view[start:start + ATTACHMENT_CHUNK_SIZE])
+        yield suffix
+
+    return length, chunks()
+
+class AsyncLLMClient:
+    """Boucle asyncio en arrière-plan + client httpx + limites de concurrence"""
+
+    def __init__(self, base_url=OPENAI_BASE_URL, max_concurrency=LLM_MAX_CONCURRENCY,
+                 model_limits=None, default_model_limit=LLM_DEFAULT_MODEL_CONCURRENCY):
+        self.base_url = base_url
+        self.max_concurrency = max_concurrency
+        self.model_limits = LLM_MODEL_CONCURRENCY if model_limits is None else model_limits
+        self.default_model_limit = default_model_limit
+        self._loop = None
+        self._client = None
+        self._global_semaphore = None
+        self._model_semaphores = {}
+        self._start_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._stats = {'calls': 0, 'errors': 0, 'in_flight': 0, 'max_in_flight': 0, 'waiting': 0, 'total_seconds': 0.0}
+        self._in_flight_by_model = {}
+
+    # ===== BOUCLE ASYNCIO =====
+
+    def _ensure_started(self):
+        if self._loop is not None:
+            return self._loop
+
+        with self._start_lock:
+            if self._loop is None:
+                loop = asyncio.new_event_loop()
+                ready = threading.Event()
+
+                def run():
+                    asyncio.set_event_loop(loop)
+                    self._client = httpx.AsyncClient(
+                        base_url=self.base_url,
+                        timeout=LLM_DEFAULT_TIMEOUT,
+                        limits=httpx.Limits(
+                            max_connections=self.max_concurrency,
+                            max_keepalive_connections=min(self.max_concurrency, 50)
+                        )
+                    )
+                    self._global_semaphore = asyncio.Semaphore(self.max_concurrency)
+                    ready.set()
+                    loop.run_forever()
+
+                threading.Thread(target=run, name='lea-llm-loop', daemon=True).start()
+                ready.wait()
+                self._loop = loop
+
+        return self._loop
+
+    def _model_semaphore(self, model):
+        # Appelé uniquement depuis la boucle : pas de verrou nécessaire
+        semaphore = self._model_semaphores.get(model)
+        if semaphore is None:
+            semaphore = asyncio.Semaphore(self.model_limits.get(model, self.default_model_limit))
+            self._model_semaphores[model] = semaphore
+        return semaphore
+
+    def _track(self, model, delta, elapsed=None, error=False):
+        with self._stats_lock:
+            self._stats['in_flight'] += delta
+            self._stats['max_in_flight'] = max(self._stats['max_in_flight'], self._stats['in_flight'])
+            self._in_flight_by_model[model] = self._in_flight_by_model.get(model, 0) + delta
+            if elapsed is not None:
+                self._stats['calls'] += 1
+                self._stats['total_seconds'] += elapsed
+                if error:
+                    self._stats['errors'] += 1
+
+    # ===== API ASYNCHRONE =====
+
+    async def chat_completion_async(self, payload, api_key, timeout=None, attachment=None):
+        """
+        POST /chat/completions ; retourne la httpx.Response (status_code, json()).
+        attachment : octets insérés en base64 à la place de ATTACHMENT_PLACEHOLDER dans payload.
+        Utilisable depuis n'importe quelle boucle : le client httpx et les sémaphores
+        appartiennent à la boucle dédiée, l'appel y est donc transféré si besoin.
+        """
+        loop = self._ensure_started()
+        coroutine = self._chat_completion(payload, api_key, timeout, attachment)
+        if asyncio.get_running_loop() is loop:
+            return await coroutine
+        return await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(coroutine, loop))
+
+    async def _chat_completion(self, payload, api_key, timeout=None, attachment=None):
+        """Appel réel, exécuté sur la boucle dédiée"""
+        model = payload.get('model', '')
+        headers = {"Authorization": f"Bearer {api_key}"}
+        request_kwargs = {'json': payload}
+        if attachment is not None:
+            length, body = attachment_body(payload, attachment)
+            headers.update({"Content-Type": "application/json", "Content-Length": str(length)})
+            request_kwargs = {'content': body}
+
+        with self._stats_lock:
+            self._stats['waiting'] += 1
+        try:
+            await self._global_semaphore.acquire()
+        finally:
+            with self._stats_lock:
+                self._stats['waiting'] -= 1
+
+        try:
+            async with self._model_semaphore(model):
+                self._track(model, 1)
+                start = time.time()
+                error = True
+                try:
+                    response = await self._client.post(
+                        '/chat/completions',
+                        headers=headers,
+                        timeout=timeout or LLM_DEFAULT_TIMEOUT,
+                        **request_kwargs
+                    )
+                    error = response.status_code != 200
+                    return response
+                finally:
+                    self._track(model, -1, time.time() - start, error)
+        finally:
+            self._global_semaphore.release()
+
+    # ===== WRAPPERS SYNCHRONES =====
+
+    def submit_chat_completion(self, payload, api_key, timeout=None, attachment=None):
+        """Lance l'appel sans attendre ; retourne un concurrent.futures.Future"""
+        loop = self._ensure_started()
+        return asyncio.run_coroutine_threadsafe(
+            self._chat_completion(payload, api_key, timeout, attachment), loop
+        )
+
+    def chat_completion(self, payload, api_key, timeout=None, attachment=None):
+        """Appel bloquant pour les appelants existants (même interface qu'une réponse requests)"""
+        future = self.submit_chat_completion(payload, api_key, timeout, attachment)
+        # Marge pour l'attente des sémaphores au-delà du timeout HTTP
+        wait = (timeout or LLM_DEFAULT_TIMEOUT) * 2
+        try:
+            return future.result(wait)
+        except TimeoutError:
+            future.cancel()
+            raise
+
+    def stats(self):
+        """Appels terminés, erreurs, appels en vol (total et par modèle), en attente de sémaphore"""
+        with self._stats_lock:
+            calls = self._stats['calls']
+            return {
+                'calls': calls,
+                'errors': self._stats['errors'],
+                'in_flight': self._stats['in_flight'],
+                'max_in_flight': self._stats['max_in_flight'],
+                'waiting': self._stats['waiting'],
+                'in_flight_by_model': {model: n for model, n in self._in_flight_by_model.items() if n},
+                'avg_seconds': round(self._stats['total_seconds'] / calls, 2) if calls else 0
+            }
+
+# Instance globale pour utilisation dans l'app
+llm_client = AsyncLLMClient()
+
+def chat_completion(payload, api_key, timeout=None, attachment=None):
+    """Raccourci vers llm_client.chat_completion"""
+    return llm_client.chat_completion(payload, api_key, timeout, attachment)
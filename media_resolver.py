@@ -0,0 +1,269 @@
+"""
+Médias reçus par WhatsApp Business API (Meta).
+Le webhook Meta ne contient pas de lien mais un media_id : il faut demander l'URL à la
+Graph API (GET /{media_id}, URL valable quelques minutes), puis télécharger les octets
+sur cette URL avec le même token.
+
+Le téléchargement démarre dès le parsing du webhook (prefetch), dans un pool de threads,
+pendant que le message charge l'utilisateur et passe la classification ; l'analyse photo
+récupère ensuite le résultat déjà prêt (ou attend la fin du téléchargement en cours).
+Les médias sont gardés dans un cache disque LRU borné en taille (MEDIA_CACHE_MAX_BYTES) :
+un rejeu du webhook ou une nouvelle tentative de la file de jobs ne retélécharge rien.
+"""
+
+import hashlib
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+
+import http_client
+from config import current_config
+
+logger = logging.getLogger(__name__)
+
+# Configuration (surchargeable par variables d'environnement)
+GRAPH_API_BASE_URL = os.getenv('GRAPH_API_BASE_URL', 'https://graph.facebook.com/v18.0')
+MEDIA_CACHE_DIR = os.getenv('MEDIA_CACHE_DIR', 'media_cache')
+MEDIA_CACHE_MAX_BYTES = int(os.getenv('MEDIA_CACHE_MAX_BYTES', 200 * 1024 * 1024))
+MEDIA_PREFETCH_WORKERS = int(os.getenv('MEDIA_PREFETCH_WORKERS', 4))
+MEDIA_FETCH_TIMEOUT = float(os.getenv('MEDIA_FETCH_TIMEOUT', 30))
+
+# Types acceptés au téléchargement (photos et messages vocaux)
+MEDIA_CONTENT_TYPES = ('image/', 'audio/', 'application/ogg')
+
+# Préfixe des media_url construites à partir d'un media_id Meta
+MEDIA_REFERENCE_PREFIX = 'wa-media:'
+
+# Après dépassement de la taille max, on purge jusqu'à cette fraction (évite de repurger à chaque écriture)
+EVICTION_TARGET_RATIO = 0.9
+
+def media_reference(media_id):
+    """media_id Meta -> media_url transportée dans le job ('wa-media:<id>'), ou None"""
+    return f"{MEDIA_REFERENCE_PREFIX}{media_id}" if media_id else None
+
+def parse_media_reference(media_url):
+    """media_id d'une media_url 'wa-media:<id>', ou None (URL Twilio classique)"""
+    if media_url and str(media_url).startswith(MEDIA_REFERENCE_PREFIX):
+        return media_url[len(MEDIA_REFERENCE_PREFIX):] or None
+    return None
+
+class MediaResolver:
+    """media_id -> URL (Graph API) -> octets ; prefetch concurrent et cache disque LRU"""
+
+    def __init__(self, access_token=None, base_url=GRAPH_API_BASE_URL, cache_dir=MEDIA_CACHE_DIR,
+                 max_bytes=MEDIA_CACHE_MAX_BYTES, workers=MEDIA_PREFETCH_WORKERS, fetch_timeout=MEDIA_FETCH_TIMEOUT):
+        self.access_token = access_token
+        self.base_url = base_url.rstrip('/')
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.workers = workers
+        self.fetch_timeout = fetch_timeout
+        self._executor = None
+        # media_id -> Future du téléchargement en cours (un seul par média)
+        self._inflight = {}
+        self._lock = threading.Lock()
+        # Taille du cache disque, calculée au premier usage puis tenue à jour
+        self._cache_bytes = None
+        self._stats = {'prefetched': 0, 'hits': 0, 'misses': 0, 'joined': 0, 'errors': 0,
+                       'downloaded_bytes': 0, 'evicted': 0}
+
+    def _headers(self):
+        token = self.access_token or current_config.WHATSAPP_ACCESS_TOKEN
+        return {'Authorization': f"Bearer {token}"}
+
+    def _get_executor(self):
+        # Appelé sous self._lock
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='lea-media')
+        return self._executor
+
+    # ===== TÉLÉCHARGEMENT =====
+
+    def resolve_url(self, media_id):
+        """URL de téléchargement (temporaire) et type MIME d'un media_id"""
+        response = http_client.get(f"{self.base_url}/{media_id}", headers=self._headers(), timeout=self.fetch_timeout)
+        if response.status_code != 200:
+            raise http_client.MediaDownloadError(f"Graph API HTTP {response.status_code} pour le média {media_id}")
+
+        metadata = response.json()
+        if not metadata.get('url'):
+            raise http_client.MediaDownloadError(f"Graph API: pas d'URL pour le média {media_id}")
+        return metadata['url'], metadata.get('mime_type')
+
+    def _fetch(self, media_id):
+        """Octets du média : cache disque, sinon Graph API puis téléchargement (mis en cache)"""
+        data = self._read_cache(media_id)
+        if data is not None:
+            with self._lock:
+                self._stats['hits'] += 1
+            return data
+
+        with self._lock:
+            self._stats['misses'] += 1
+
+        start = time.time()
+        url, mime_type = self.resolve_url(media_id)
+        data = bytes(http_client.download(
+            url, content_types=MEDIA_CONTENT_TYPES, headers=self._headers(), timeout=self.fetch_timeout
+        ))
+        logger.info(f"📥 Média {media_id} téléchargé: {len(data) // 1024} Ko ({mime_type}, {(time.time() - start) * 1000:.0f} ms)")
+
+        with self._lock:
+            self._stats['downloaded_bytes'] += len(data)
+        self._write_cache(media_id, data)
+        return data
+
+    def prefetch(self, media_id):
+        """Démarre le téléchargement en arrière-plan (sans doublon) ; retourne le Future"""
+        return self._submit(media_id, counter='prefetched')
+
+    def _submit(self, media_id, counter):
+        """Future du téléchargement en cours pour ce média, ou d'un nouveau ; counter compté s'il est créé"""
+        with self._lock:
+            future = self._inflight.get(media_id)
+            if future is not None:
+                return future
+            future = self._get_executor().submit(self._fetch, media_id)
+            self._inflight[media_id] = future
+            if counter:
+                self._stats[counter] += 1
+
+        # Hors verrou : le callback s'exécute tout de suite si le Future est déjà terminé
+        future.add_done_callback(lambda f: self._release(media_id, f))
+        return future
+
+    def _release(self, media_id, future):
+        with self._lock:
+            if self._inflight.get(media_id) is future:
+                del self._inflight[media_id]
+
+    def fetch(self, media_id, timeout=None):
+        """
+        Octets du média ; rejoint le téléchargement déjà lancé par prefetch s'il y en a un.
+        Lève MediaDownloadError (MediaRejectedError si trop gros / mauvais type) ou l'erreur réseau.
+        """
+        with self._lock:
+            future = self._inflight.get(media_id)
+            if future is not None:
+                self._stats['joined'] += 1
+        if future is None:
+            future = self._submit(media_id, counter=None)
+
+        try:
+            return future.result(timeout=timeout or self.fetch_timeout)
+        except Exception:
+            with self._lock:
+                self._stats['errors'] += 1
+            raise
+
+    def get(self, media_id, timeout=None):
+        """Octets du média, ou None en cas d'échec (erreurs loguées)"""
+        if not media_id:
+            return None
+
+        try:
+            return self.fetch(media_id, timeout)
+        except FutureTimeoutError:
+            logger.error(f"❌ Média {media_id}: délai de téléchargement dépassé")
+        except http_client.MediaDownloadError as e:
+            logger.warning(f"⚠️ Média {media_id} refusé: {e}")
+        except Exception as e:
+            logger.error(f"❌ Erreur téléchargement média {media_id}: {e}")
+        return None
+
+    # ===== CACHE DISQUE =====
+
+    def _cache_path(self, media_id):
+        return os.path.join(self.cache_dir, hashlib.sha1(str(media_id).encode('utf-8')).hexdigest())
+
+    def _read_cache(self, media_id):
+        path = self._cache_path(media_id)
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+            # mtime = dernier accès : c'est l'ordre LRU de l'éviction
+            os.utime(path)
+            return data
+        except FileNotFoundError:
+            return None
+        except OSError as e:
+            logger.error(f"❌ Erreur lecture cache média: {e}")
+            return None
+
+    def _write_cache(self, media_id, data):
+        if len(data) > self.max_bytes:
+            return
+        path = self._cache_path(media_id)
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_path, 'wb') as f:
+                f.write(data)
+            # Remplacement atomique : un lecteur ne voit jamais un fichier à moitié écrit
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.error(f"❌ Erreur écriture cache média: {e}")
+            return
+
+        with self._lock:
+            if self._cache_bytes is None:
+                self._cache_bytes = self._scan()[1]
+            else:
+                self._cache_bytes += len(data)
+            if self._cache_bytes > self.max_bytes:
+                self._evict()
+
+    def _scan(self):
+        """(fichiers [(mtime, taille, chemin)] du plus ancien au plus récent, taille totale)"""
+        files = []
+        try:
+            with os.scandir(self.cache_dir) as entries:
+                for entry in entries:
+                    if entry.is_file() and not entry.name.endswith('.tmp'):
+                        stat = entry.stat()
+                        files.append((stat.st_mtime, stat.st_size, entry.path))
+        except FileNotFoundError:
+            pass
+        files.sort()
+        return files, sum(size for _, size, _ in files)
+
+    def _evict(self):
+        """Supprime les médias les moins récemment utilisés (appelé sous self._lock)"""
+        # Relecture du répertoire : il peut être partagé entre plusieurs workers gunicorn
+        files, total = self._scan()
+        target = self.max_bytes * EVICTION_TARGET_RATIO
+        for _, size, path in files:
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                logger.error(f"❌ Erreur éviction cache média: {e}")
+                continue
+            total -= size
+            self._stats['evicted'] += 1
+        self._cache_bytes = total
+
+    def stats(self):
+        """Prefetch lancés, hits / misses du cache disque, erreurs et taille du cache"""
+        with self._lock:
+            stats = dict(self._stats, inflight=len(self._inflight))
+            if self._cache_bytes is None:
+                self._cache_bytes = self._scan()[1]
+            stats['cache_bytes'] = self._cache_bytes
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_rate'] = round(stats['hits'] / lookups, 2) if lookups else 0
+        return stats
+
+    def shutdown(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor:
+            executor.shutdown(wait=True)
+
+# Instance globale pour utilisation dans l'app
+media_resolver = MediaResolver()
@@ -0,0 +1,139 @@
+"""
+Contexte par message entrant : l'état utilisateur est chargé une seule fois
+(profil, premium, compteur, totaux et repas du jour) puis partagé par les handlers.
+Les écritures (repas, compteur de messages) sont regroupées et appliquées en fin de traitement.
+"""
+
+import logging
+import threading
+
+from database import (
+    get_user_snapshot, update_user_data, delete_user_data, apply_user_writes,
+    is_premium_active, get_db_call_count, UserData, PROJECTION_FULL
+)
+
+logger = logging.getLogger(__name__)
+
+# Statistiques globales : nombre de messages traités et requêtes DB cumulées
+_stats = {'messages': 0, 'db_calls': 0, 'max_db_calls': 0}
+_stats_lock = threading.Lock()
+
+def get_message_db_stats():
+    """Moyenne et maximum de requêtes DB par message depuis le démarrage"""
+    with _stats_lock:
+        messages = _stats['messages']
+        return {
+            'messages': messages,
+            'avg_db_calls_per_message': round(_stats['db_calls'] / messages, 1) if messages else 0,
+            'max_db_calls_per_message': _stats['max_db_calls']
+        }
+
+def new_user_defaults():
+    """Données d'un utilisateur qui démarre l'onboarding"""
+    return {
+        'onboarding_complete': False,
+        'onboarding_step': 'start',
+        'daily_calories': 0,
+        'daily_proteins': 0,
+        'daily_fats': 0,
+        'daily_carbs': 0,
+        'meals': []
+    }
+
+class MessageContext:
+    """État utilisateur d'un message, chargé en une requête et sauvegardé en une transaction"""
+
+    def __init__(self, phone_number):
+        self.phone_number = phone_number
+        self._db_calls_start = get_db_call_count()
+        self._pending_meals = []
+        self._pending_message_count = 0
+        self.user_data = get_user_snapshot(phone_number, PROJECTION_FULL)
+
+    @property
+    def exists(self):
+        """Vrai si l'utilisateur existe déjà en base"""
+        return self.user_data is not None
+
+    @property
+    def is_premium(self):
+        """Statut premium valide (non expiré)"""
+        if not self.user_data:
+            return False
+        return is_premium_active(self.user_data.get('is_premium'), self.user_data.get('premium_expires_at'))
+
+    @property
+    def message_count(self):
+        """Compteur de messages, incréments en attente compris"""
+        return (self.user_data or {}).get('message_count', 0)
+
+    @property
+    def db_calls(self):
+        """Requêtes SQL exécutées depuis la création du contexte"""
+        return get_db_call_count() - self._db_calls_start
+
+    def start_onboarding(self, reset=False):
+        """Crée (ou recrée si reset) l'utilisateur avec un onboarding non terminé"""
+        if reset:
+            delete_user_data(self.phone_number)
+            self._pending_meals = []
+            self._pending_message_count = 0
+
+        user_data = new_user_defaults()
+        update_user_data(self.phone_number, user_data)
+
+        self.user_data = UserData(user_data)
+        self.user_data['phone_number'] = self.phone_number
+        self.user_data.mark_clean()
+        return self.user_data
+
+    def increment_message_count(self):
+        """Incrémente le compteur (écrit au flush) et retourne la nouvelle valeur"""
+        self._pending_message_count += 1
+        self.user_data['message_count'] = self.message_count + 1
+        self.user_data.mark_clean('message_count')
+        return self.user_data['message_count']
+
+    def add_meal(self, meal):
+        """Ajoute un repas (écrit au flush) et met à jour les totaux du jour en mémoire"""
+        self._pending_meals.append(meal)
+
+        self.user_data.update({
+            'daily_calories': self.user_data.get('daily_calories', 0) + meal.get('calories', 0),
+            'daily_proteins': self.user_data.get('daily_proteins', 0) + meal.get('proteines', 0),
+            'daily_fats': self.user_data.get('daily_fats', 0) + meal.get('lipides', 0),
+            'daily_carbs': self.user_data.get('daily_carbs', 0) + meal.get('glucides', 0),
+            'meals': self.user_data.get('meals', []) + [meal]
+        })
+        # Ces valeurs sont déjà couvertes par les écritures en attente
+        self.user_data.mark_clean('daily_calories', 'daily_proteins', 'daily_fats', 'daily_carbs', 'meals')
+
+    def flush(self):
+        """Applique les écritures en attente en une seule transaction"""
+        if not self._pending_meals and not self._pending_message_count:
+            return
+
+        apply_user_writes(
+            self.phone_number,
+            message_count_increment=self._pending_message_count,
+            meals=self._pending_meals
+        )
+        self._pending_meals = []
+        self._pending_message_count = 0
+
+    def discard(self):
+        """Abandonne les écritures en attente (message rejoué plus tard)"""
+        self._pending_meals = []
+        self._pending_message_count = 0
+
+    def close(self):
+        """Flush final et log du nombre d'appels DB pour ce message"""
+        try:
+            self.flush()
+        finally:
+            db_calls = self.db_calls
+            with _stats_lock:
+                _stats['messages'] += 1
+                _stats['db_calls'] += db_calls
+                _stats['max_db_calls'] = max(_stats['max_db_calls'], db_calls)
+            logger.info(f"🗄️ {db_calls} requêtes DB pour le message de {self.phone_number}")
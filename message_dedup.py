@@ -0,0 +1,108 @@
+"""
+Déduplication des webhooks par identifiant de message (message_id Meta, MessageSid Twilio).
+Meta et Twilio rejouent une livraison lente ou non acquittée : sans ce filtre, chaque
+rejeu relance l'analyse GPT et enregistre le repas une seconde fois.
+
+Un LRU en mémoire absorbe la fenêtre chaude des rejeux sans requête ; la table
+processed_messages garde les identifiants pendant DEDUP_TTL_SECONDS, entre redémarrages
+et entre processus.
+"""
+
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+from database import get_connection, DATABASE
+
+logger = logging.getLogger(__name__)
+
+# Purge des identifiants expirés au plus une fois par intervalle
+PURGE_INTERVAL_SECONDS = 3600
+
+class MessageDeduplicator:
+    """Filtre « premier passage » par identifiant de message"""
+
+    def __init__(self, cache_size=10000, ttl_seconds=7 * 24 * 3600, db_path=DATABASE):
+        self.cache_size = cache_size
+        self.ttl_seconds = ttl_seconds
+        self.db_path = db_path
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self._last_purge = 0
+        self._stats = {'new': 0, 'duplicates_memory': 0, 'duplicates_db': 0, 'purged': 0}
+
+    def first_seen(self, message_id):
+        """
+        Enregistre l'identifiant et retourne True au premier passage, False pour un rejeu.
+        Un message sans identifiant est toujours traité.
+        """
+        if not message_id:
+            return True
+
+        now = time.time()
+
+        with self._lock:
+            seen_at = self._cache.get(message_id)
+            if seen_at is not None and now - seen_at < self.ttl_seconds:
+                self._cache.move_to_end(message_id)
+                self._stats['duplicates_memory'] += 1
+                return False
+
+        # Insertion, ou réutilisation d'un identifiant expiré ; rowcount 0 = déjà vu
+        conn = get_connection(self.db_path)
+        with conn:
+            cursor = conn.execute('''
+                INSERT INTO processed_messages (message_id, seen_at) VALUES (?, ?)
+                ON CONFLICT(message_id) DO UPDATE SET seen_at = excluded.seen_at
+                WHERE processed_messages.seen_at < ?
+            ''', (message_id, now, now - self.ttl_seconds))
+        is_new = cursor.rowcount == 1
+
+        with self._lock:
+            self._remember(message_id, now)
+            self._stats['new' if is_new else 'duplicates_db'] += 1
+
+        self._purge_if_due(now)
+        return is_new
+
+    def forget(self, message_id):
+        """Oublie un identifiant (message non mis en file) pour accepter le prochain rejeu"""
+        if not message_id:
+            return
+
+        with self._lock:
+            self._cache.pop(message_id, None)
+
+        conn = get_connection(self.db_path)
+        with conn:
+            conn.execute('DELETE FROM processed_messages WHERE message_id = ?', (message_id,))
+
+    def _remember(self, message_id, seen_at):
+        self._cache[message_id] = seen_at
+        self._cache.move_to_end(message_id)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    def _purge_if_due(self, now):
+        with self._lock:
+            if now - self._last_purge < PURGE_INTERVAL_SECONDS:
+                return
+            self._last_purge = now
+
+        try:
+            conn = get_connection(self.db_path)
+            with conn:
+                cursor = conn.execute(
+                    'DELETE FROM processed_messages WHERE seen_at < ?',
+                    (now - self.ttl_seconds,)
+                )
+            with self._lock:
+                self._stats['purged'] += cursor.rowcount
+        except Exception as e:
+            logger.error(f"❌ Erreur purge déduplication: {e}")
+
+    def stats(self):
+        """Messages nouveaux, rejeux filtrés (mémoire / base) et taille du cache"""
+        with self._lock:
+            return dict(self._stats, cached=len(self._cache))
@@ -0,0 +1,315 @@
+"""
+Pool de workers pour traiter les messages WhatsApp en arrière-plan.
+Le webhook enregistre le message dans une file SQLite persistante (inbound_jobs)
+et répond 200 immédiatement ; les workers réclament les jobs, les traitent
+(DB, OpenAI, envoi de la réponse) et les rejouent avec backoff en cas d'erreur.
+Un job dont le worker a disparu (crash, redémarrage) est repris à l'expiration de son bail.
+
+Les messages d'un même numéro sont traités strictement dans l'ordre d'arrivée (un seul job
+en cours par numéro, les suivants attendent), ceux de numéros différents en parallèle.
+"""
+
+import json
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+from database import get_connection, DATABASE
+
+logger = logging.getLogger(__name__)
+
+# Délai max entre deux tentatives (backoff exponentiel plafonné)
+MAX_RETRY_DELAY_SECONDS = 900
+
+# ===== FILE PERSISTANTE =====
+
+def enqueue_job(phone_number, payload, db_path=DATABASE):
+    """Enregistre un message à traiter et retourne l'id du job"""
+    conn = get_connection(db_path)
+
+    with conn:
+        cursor = conn.execute('''
+            INSERT INTO inbound_jobs (phone_number, payload, next_run_at)
+            VALUES (?, ?, ?)
+        ''', (phone_number, json.dumps(payload), time.time()))
+
+    return cursor.lastrowid
+
+def claim_job(lease_seconds, db_path=DATABASE):
+    """
+    Réclame atomiquement le prochain job exécutable : en attente et arrivé à échéance,
+    ou en cours avec un bail expiré (worker disparu). Un job n'est éligible que si aucun
+    job plus ancien du même numéro n'est encore en attente ou en cours : l'ordre par
+    utilisateur est garanti même avec plusieurs workers ou processus. Retourne un dict ou None.
+    """
+    conn = get_connection(db_path)
+    now = time.time()
+
+    with conn:
+        row = conn.execute('''
+            UPDATE inbound_jobs
+            SET status = 'running', attempts = attempts + 1, lease_expires_at = :lease
+            WHERE id = (
+                SELECT job.id FROM inbound_jobs AS job
+                WHERE ((job.status = 'pending' AND job.next_run_at <= :now)
+                    OR (job.status = 'running' AND job.lease_expires_at < :now))
+                  AND NOT EXISTS (
+                      SELECT 1 FROM inbound_jobs AS previous
+                      WHERE previous.phone_number = job.phone_number
+                        AND previous.status IN ('pending', 'running')
+                        AND previous.id < job.id
+                  )
+                ORDER BY job.id
+                LIMIT 1
+            )
+            RETURNING id, phone_number, payload, attempts
+        ''', {'now': now, 'lease': now + lease_seconds}).fetchone()
+
+    if not row:
+        return None
+
+    return {
+        'id': row['id'],
+        'phone_number': row['phone_number'],
+        'payload': json.loads(row['payload']),
+        'attempts': row['attempts']
+    }
+
+def update_job_payload(job_id, fields, db_path=DATABASE):
+    """
+    Enregistre l'avancement d'un job dans son payload (réponses envoyées, accusé de lecture) :
+    une nouvelle tentative le relit et ne refait pas ce qui a déjà été fait.
+    """
+    paths = ', '.join('?, json(?)' for _ in fields)
+    params = [value for key, field_value in fields.items() for value in (f'$.{key}', json.dumps(field_value))]
+    conn = get_connection(db_path)
+
+    with conn:
+        conn.execute(f'UPDATE inbound_jobs SET payload = json_set(payload, {paths}) WHERE id = ?', (*params, job_id))
+
+def complete_job(job_id, db_path=DATABASE):
+    """Supprime un job traité avec succès"""
+    conn = get_connection(db_path)
+
+    with conn:
+        conn.execute('DELETE FROM inbound_jobs WHERE id = ?', (job_id,))
+
+def retry_job(job_id, attempts, error, retry_delay, db_path=DATABASE):
+    """Replanifie un job en échec avec un backoff exponentiel"""
+    delay = min(retry_delay * 2 ** (attempts - 1), MAX_RETRY_DELAY_SECONDS)
+    conn = get_connection(db_path)
+
+    with conn:
+        conn.execute('''
+            UPDATE inbound_jobs
+            SET status = 'pending', next_run_at = ?, lease_expires_at = NULL, last_error = ?
+            WHERE id = ?
+        ''', (time.time() + delay, error, job_id))
+
+    return delay
+
+def fail_job(job_id, error, db_path=DATABASE):
+    """Marque un job comme définitivement en échec (conservé pour analyse)"""
+    conn = get_connection(db_path)
+
+    with conn:
+        conn.execute('''
+            UPDATE inbound_jobs
+            SET status = 'failed', lease_expires_at = NULL, last_error = ?
+            WHERE id = ?
+        ''', (error, job_id))
+
+def get_queue_stats(db_path=DATABASE):
+    """Nombre de jobs par statut et âge du plus ancien job en attente"""
+    conn = get_connection(db_path)
+
+    rows = conn.execute('''
+        SELECT status, COUNT(*) AS count, MIN(next_run_at) AS oldest
+        FROM inbound_jobs
+        GROUP BY status
+    ''').fetchall()
+
+    stats = {'pending': 0, 'running': 0, 'failed': 0, 'oldest_pending_seconds': 0}
+    for row in rows:
+        stats[row['status']] = row['count']
+        if row['status'] == 'pending' and row['oldest']:
+            stats['oldest_pending_seconds'] = max(0, round(time.time() - row['oldest'], 1))
+
+    stats.update(get_queue_depth_by_phone(db_path=db_path))
+    return stats
+
+def _mask_phone(phone_number):
+    """Numéro masqué pour les métriques exposées (4 derniers chiffres)"""
+    return f"…{phone_number[-4:]}" if phone_number else ''
+
+def get_queue_depth_by_phone(limit=10, db_path=DATABASE):
+    """Profondeur de file par numéro : nombre de numéros en attente, maximum et numéros les plus chargés"""
+    conn = get_connection(db_path)
+
+    rows = conn.execute('''
+        SELECT phone_number, COUNT(*) AS depth
+        FROM inbound_jobs
+        WHERE status IN ('pending', 'running')
+        GROUP BY phone_number
+        ORDER BY depth DESC
+    ''').fetchall()
+
+    return {
+        'active_keys': len(rows),
+        'max_depth_per_key': rows[0]['depth'] if rows else 0,
+        'top_keys': [{'key': _mask_phone(row['phone_number']), 'depth': row['depth']} for row in rows[:limit]]
+    }
+
+# ===== VERROUS PAR NUMÉRO =====
+
+class KeyedLocks:
+    """Un verrou par clé (numéro), libéré de la mémoire quand plus personne ne l'attend"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._locks = {}
+
+    @contextmanager
+    def hold(self, key):
+        """Exécute le bloc seul pour cette clé ; les autres clés restent parallèles"""
+        with self._lock:
+            entry = self._locks.setdefault(key, [threading.Lock(), 0])
+            entry[1] += 1
+        try:
+            with entry[0]:
+                yield
+        finally:
+            with self._lock:
+                entry[1] -= 1
+                if not entry[1]:
+                    del self._locks[key]
+
+    def waiting(self):
+        """Nombre de traitements en cours ou en attente par clé"""
+        with self._lock:
+            return {key: entry[1] for key, entry in self._locks.items()}
+
+# ===== WORKERS =====
+
+class WorkerPool:
+    """Nombre fixe de threads qui consomment la file persistante"""
+
+    def __init__(self, handler, size=4, name='lea-worker', on_give_up=None,
+                 max_attempts=5, lease_seconds=300, retry_delay=5, poll_interval=1.0,
+                 db_path=DATABASE):
+        self.handler = handler
+        self.on_give_up = on_give_up
+        self.size = max(1, int(size))
+        self.name = name
+        self.max_attempts = max_attempts
+        self.lease_seconds = lease_seconds
+        self.retry_delay = retry_delay
+        self.poll_interval = poll_interval
+        self.db_path = db_path
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._threads = []
+        self._lock = threading.Lock()
+        self._stats = {
+            'submitted': 0, 'processed': 0, 'retried': 0, 'failed': 0,
+            'busy': 0, 'total_seconds': 0.0
+        }
+
+    def start(self):
+        """Démarre les threads (idempotent) ; les jobs laissés par un arrêt précédent sont repris"""
+        with self._lock:
+            if self._threads:
+                return
+            self._stopping.clear()
+            for i in range(self.size):
+                thread = threading.Thread(target=self._run, name=f"{self.name}-{i}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+        logger.info(f"👷 {self.size} workers démarrés")
+
+    def submit(self, job):
+        """Enregistre un message dans la file persistante et réveille un worker"""
+        job_id = enqueue_job(job.get('from_number', ''), job, self.db_path)
+        with self._lock:
+            self._stats['submitted'] += 1
+        self._wakeup.set()
+        return job_id
+
+    def stop(self, timeout=None):
+        """Arrête les workers après leur job en cours (les jobs en attente restent en base)"""
+        self._stopping.set()
+        self._wakeup.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+    def _run(self):
+        while not self._stopping.is_set():
+            try:
+                job = claim_job(self.lease_seconds, self.db_path)
+            except Exception as e:
+                logger.error(f"❌ Erreur lecture file: {e}")
+                job = None
+
+            if not job:
+                # Rien d'exécutable : attendre un nouveau message ou la prochaine échéance
+                self._wakeup.wait(self.poll_interval)
+                self._wakeup.clear()
+                continue
+
+            self._execute(job)
+
+    def _execute(self, job):
+        with self._lock:
+            self._stats['busy'] += 1
+        start = time.time()
+        outcome = 'failed'
+        try:
+            if job['attempts'] > self.max_attempts:
+                # Bail expiré sur la dernière tentative : le worker précédent a disparu
+                raise RuntimeError("bail expiré, tentatives épuisées")
+
+            # job_id transmis au handler pour update_job_payload
+            self.handler(dict(job['payload'], job_id=job['id']))
+            complete_job(job['id'], self.db_path)
+            outcome = 'processed'
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+            outcome = self._handle_failure(job, error)
+        finally:
+            with self._lock:
+                self._stats['busy'] -= 1
+                self._stats[outcome] += 1
+                self._stats['total_seconds'] += time.time() - start
+
+    def _handle_failure(self, job, error):
+        try:
+            if job['attempts'] < self.max_attempts:
+                delay = retry_job(job['id'], job['attempts'], error, self.retry_delay, self.db_path)
+                logger.warning(f"⚠️ Job {job['id']} en échec ({error}), nouvelle tentative dans {delay}s")
+                return 'retried'
+
+            fail_job(job['id'], error, self.db_path)
+            logger.error(f"❌ Job {job['id']} abandonné après {job['attempts']} tentatives: {error}")
+            if self.on_give_up:
+                self.on_give_up(job['payload'], error)
+        except Exception as e:
+            logger.error(f"❌ Erreur gestion échec job {job['id']}: {e}")
+        return 'failed'
+
+    def stats(self):
+        """État de la file persistante et compteurs des workers de ce processus"""
+        with self._lock:
+            done = self._stats['processed'] + self._stats['failed'] + self._stats['retried']
+            stats = {
+                'workers': self.size,
+                'busy': self._stats['busy'],
+                'submitted': self._stats['submitted'],
+                'processed': self._stats['processed'],
+                'retried': self._stats['retried'],
+                'failed': self._stats['failed'],
+                'avg_seconds': round(self._stats['total_seconds'] / done, 2) if done else 0
+            }
+        stats['queue'] = get_queue_stats(self.db_path)
+        return stats
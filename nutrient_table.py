@@ -0,0 +1,213 @@
+#!/usr/bin/env python3
+"""
+Table nutritionnelle compilée, lue par mmap.
+Des centaines de milliers d'aliments en dicts Python coûteraient des centaines de Mo
+par worker ; ce fichier binaire est projeté en mémoire en lecture seule, les pages sont
+partagées entre processus gunicorn et l'ouverture est instantanée.
+
+Format (little-endian) :
+    en-tête   : magic b'LEANUT01', version (u32), nombre d'entrées N (u32), champs F (u32)
+    valeurs   : N x F float32 (cal, prot, fat, carb pour 100g), dans l'ordre des noms
+    offsets   : N + 1 u32, début de chaque nom dans la table de chaînes
+    chaînes   : noms normalisés UTF-8, triés (recherche dichotomique)
+
+Construction :
+    python nutrient_table.py build                          # depuis nutrition_database.py
+    python nutrient_table.py build --from-store food_store.db -o nutrients.bin
+"""
+
+import argparse
+import logging
+import mmap
+import os
+import struct
+import sys
+
+logger = logging.getLogger(__name__)
+
+NUTRIENT_TABLE_PATH = os.getenv('NUTRIENT_TABLE_PATH', 'nutrients.bin')
+
+MAGIC = b'LEANUT01'
+VERSION = 1
+FIELDS = ('cal', 'prot', 'fat', 'carb')
+HEADER = struct.Struct('<8sIII')
+
+# ===== CONSTRUCTION =====
+
+def build_table(entries, path=NUTRIENT_TABLE_PATH):
+    """
+    Écrit la table à partir d'un itérable (nom normalisé, {'cal', 'prot', 'fat', 'carb'}).
+    À nom égal, la première entrée est gardée. Retourne le nombre d'entrées écrites.
+    """
+    rows = {}
+    for name, values in entries:
+        key = name.encode('utf-8')
+        if key and key not in rows:
+            rows[key] = [float(values[field] or 0) for field in FIELDS]
+
+    names = sorted(rows)
+    offsets = [0]
+    for key in names:
+        offsets.append(offsets[-1] + len(key))
+
+    # Écriture dans un fichier temporaire puis remplacement atomique (workers en cours de lecture)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, VERSION, len(names), len(FIELDS)))
+        value_format = struct.Struct(f'<{len(FIELDS)}f')
+        for key in names:
+            f.write(value_format.pack(*rows[key]))
+        f.write(struct.pack(f'<{len(offsets)}I', *offsets))
+        for key in names:
+            f.write(key)
+    os.replace(tmp_path, path)
+
+    return len(names)
+
+def entries_from_nutrition_database():
+    """Clés et synonymes de NUTRITION_DATABASE (noms normalisés)"""
+    from nutrition_database import FOOD_INDEX, NUTRITION_DATABASE
+    for name, key in FOOD_INDEX['exact'].items():
+        yield name, NUTRITION_DATABASE[key]
+
+def entries_from_food_store(db_path):
+    """Aliments du store SQLite (CIQUAL d'abord à nom égal), lus en flux"""
+    from database import get_connection
+    conn = get_connection(db_path)
+    cursor = conn.execute('''
+        SELECT name_norm, cal, prot, fat, carb FROM foods
+        ORDER BY CASE source WHEN 'ciqual' THEN 0 ELSE 1 END, id
+    ''')
+    for row in cursor:
+        yield row['name_norm'], row
+
+# ===== LECTURE =====
+
+class NutrientTable:
+    """Table projetée en mémoire ; get(nom normalisé) en O(log N) sans rien charger"""
+
+    def __init__(self, path=NUTRIENT_TABLE_PATH):
+        self.path = path
+        with open(path, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        try:
+            self._map_sections(path)
+        except (struct.error, TypeError, ValueError):
+            self._mmap.close()
+            raise
+
+    def _map_sections(self, path):
+        """Vérifie l'en-tête et la taille du fichier puis découpe les sections"""
+        size = len(self._mmap)
+        if size < HEADER.size:
+            raise ValueError(f"Table nutritionnelle tronquée (en-tête incomplet): {path}")
+
+        magic, version, count, n_fields = HEADER.unpack_from(self._mmap, 0)
+        if magic != MAGIC or version != VERSION or n_fields != len(FIELDS):
+            raise ValueError(f"Fichier de table nutritionnelle invalide: {path}")
+
+        self._count = count
+        values_start = HEADER.size
+        offsets_start = values_start + count * n_fields * 4
+        self._strings_start = offsets_start + (count + 1) * 4
+
+        # Fichier tronqué ou périmé : les offsets annoncés doivent tenir dans le fichier
+        if self._strings_start > size:
+            raise ValueError(f"Table nutritionnelle tronquée ({size} octets pour {count} entrées): {path}")
+        strings_end = self._strings_start + struct.unpack_from('<I', self._mmap, self._strings_start - 4)[0]
+        if strings_end != size:
+            raise ValueError(f"Table nutritionnelle tronquée ou corrompue ({size} octets, {strings_end} attendus): {path}")
+
+        view = memoryview(self._mmap)
+        self._values = view[values_start:offsets_start].cast('f')
+        self._offsets = view[offsets_start:self._strings_start].cast('I')
+
+    def __len__(self):
+        return self._count
+
+    def _name_at(self, index):
+        start = self._strings_start + self._offsets[index]
+        end = self._strings_start + self._offsets[index + 1]
+        return self._mmap[start:end]
+
+    def _find(self, name):
+        key = name.encode('utf-8')
+        low, high = 0, self._count
+        while low < high:
+            middle = (low + high) // 2
+            if self._name_at(middle) < key:
+                low = middle + 1
+            else:
+                high = middle
+        if low < self._count and self._name_at(low) == key:
+            return low
+        return None
+
+    def __contains__(self, name):
+        return self._find(name) is not None
+
+    def get(self, name):
+        """{'cal', 'prot', 'fat', 'carb'} pour 100g, ou None (name déjà normalisé)"""
+        index = self._find(name)
+        if index is None:
+            return None
+        start = index * len(FIELDS)
+        return {field: round(self._values[start + i], 2) for i, field in enumerate(FIELDS)}
+
+    def names(self):
+        """Noms de la table, dans l'ordre trié"""
+        for index in range(self._count):
+            yield self._name_at(index).decode('utf-8')
+
+    def close(self):
+        self._values.release()
+        self._offsets.release()
+        self._mmap.close()
+
+_table = None
+_table_loaded = False
+
+def get_nutrient_table():
+    """Table globale (ouverte au premier appel), ou None si NUTRIENT_TABLE_PATH n'existe pas"""
+    global _table, _table_loaded
+
+    if not _table_loaded:
+        _table_loaded = True
+        if os.path.exists(NUTRIENT_TABLE_PATH):
+            try:
+                _table = NutrientTable(NUTRIENT_TABLE_PATH)
+                logger.info(f"✅ Table nutritionnelle chargée: {len(_table)} aliments ({NUTRIENT_TABLE_PATH})")
+            except (OSError, ValueError, struct.error, TypeError) as e:
+                # Repli sur NUTRITION_DATABASE (resolve_food ignore une table absente)
+                logger.error(f"❌ Table nutritionnelle illisible: {e}")
+
+    return _table
+
+def main():
+    parser = argparse.ArgumentParser(description="Table nutritionnelle compilée (mmap)")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    build_parser = commands.add_parser('build', help="compiler la table")
+    build_parser.add_argument('-o', '--output', default=NUTRIENT_TABLE_PATH)
+    build_parser.add_argument('--from-store', metavar='DB', help="store SQLite importé par food_store.py")
+
+    lookup_parser = commands.add_parser('get', help="lire un aliment")
+    lookup_parser.add_argument('name')
+    lookup_parser.add_argument('-i', '--input', default=NUTRIENT_TABLE_PATH)
+
+    args = parser.parse_args()
+
+    if args.command == 'build':
+        entries = entries_from_food_store(args.from_store) if args.from_store else entries_from_nutrition_database()
+        count = build_table(entries, args.output)
+        print(f"✅ {count} aliments -> {args.output} ({os.path.getsize(args.output)} octets)")
+    else:
+        from nutrition_database import normalize_food_name
+        values = NutrientTable(args.input).get(normalize_food_name(args.name))
+        print(values if values else "❌ Aliment absent de la table")
+        if values is None:
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,5 @@
 import os
-import requests
+from llm_client import llm_client
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -147,11 +147,6 @@ def chat_with_lea_natural(message, user_data):
         recent_exchanges = len(conversation_history)
         should_encourage_tracking = (recent_exchanges > 0 and recent_exchanges % 4 == 0)  # 1 fois sur 4
         
-        headers = {
-            "Content-Type": "application/json",
-            "Authorization": f"Bearer {api_key}"
-        }
-        
         system_prompt = f"""Tu es Léa, une coach nutrition sympa et naturelle. Tu discutes comme une amie bienveillante.
 
 CONTEXTE UTILISATEUR:
@@ -199,8 +194,7 @@ INCITATION AU TRACKING: {"Ajoute une incitation SUBTILE au tracking à la fin" i
             "temperature": 0.8
         }
         
-        response = requests.post("https://api.openai.com/v1/chat/completions", 
-                               headers=headers, json=payload, timeout=15)
+        response = llm_client.chat_completion(payload, api_key, timeout=15)
         
         if response.status_code == 200:
             answer = response.json()['choices'][0]['message']['content']
@@ -226,11 +220,6 @@ def chat_with_nutrition_expert(question, user_data):
         # Construire le contexte utilisateur
         user_context = build_user_context(user_data)
         
-        headers = {
-            "Content-Type": "application/json",
-            "Authorization": f"Bearer {api_key}"
-        }
-        
         system_prompt = f"""Tu es Léa, experte en nutrition. Tu réponds à une question nutrition spécifique.
 
 CONTEXTE UTILISATEUR:
@@ -258,8 +247,7 @@ EXEMPLES:
             "temperature": 0.7
         }
         
-        response = requests.post("https://api.openai.com/v1/chat/completions", 
-                               headers=headers, json=payload, timeout=15)
+        response = llm_client.chat_completion(payload, api_key, timeout=15)
         
         if response.status_code == 200:
             answer = response.json()['choices'][0]['message']['content']
@@ -318,13 +306,12 @@ def build_user_context(user_data):
 
 def get_conversation_history(phone_number):
     """Récupère l'historique de conversation pour maintenir le contexte"""
-    import sqlite3
     from datetime import date
-    
+    from database import get_connection
+
     try:
-        conn = sqlite3.connect('lea_nutrition.db')
-        conn.row_factory = sqlite3.Row
-        
+        conn = get_connection()
+
         # Récupérer les conversations du jour
         today = date.today().isoformat()
         
@@ -333,9 +320,7 @@ def get_conversation_history(phone_number):
             WHERE phone_number = ? AND date = ? 
             ORDER BY timestamp ASC
         ''', (phone_number, today)).fetchall()
-        
-        conn.close()
-        
+
         return [{'question': conv['question'], 'answer': conv['answer']} for conv in conversations]
         
     except Exception as e:
@@ -344,37 +329,24 @@ def get_conversation_history(phone_number):
 
 def save_conversation_exchange(phone_number, question, answer):
     """Sauvegarde un échange de conversation"""
-    import sqlite3
     from datetime import date, datetime
-    
+    from database import get_connection
+
     try:
-        conn = sqlite3.connect('lea_nutrition.db')
-        
-        # Créer la table si elle n'existe pas
-        conn.execute('''
-            CREATE TABLE IF NOT EXISTS conversation_history (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                phone_number TEXT,
-                date DATE,
-                timestamp DATETIME,
-                question TEXT,
-                answer TEXT
-            )
-        ''')
-        
+        conn = get_connection()
+
         # Insérer l'échange
         today = date.today().isoformat()
         now = datetime.now().isoformat()
-        
-        conn.execute('''
-            INSERT INTO conversation_history 
-            (phone_number, date, timestamp, question, answer)
-            VALUES (?, ?, ?, ?, ?)
-        ''', (phone_number, today, now, question, answer))
-        
-        conn.commit()
-        conn.close()
-        
+
+        # Table créée par les migrations (database.init_db)
+        with conn:
+            conn.execute('''
+                INSERT INTO conversation_history
+                (phone_number, date, timestamp, question, answer)
+                VALUES (?, ?, ?, ?, ?)
+            ''', (phone_number, today, now, question, answer))
+
         print(f"💾 Conversation sauvegardée pour {phone_number}")
         
     except Exception as e:
@@ -3,6 +3,21 @@ Base de données nutritionnelle complète pour améliorer la reconnaissance d'al
 Valeurs pour 100g sauf indication contraire
 """
 
+import os
+import re
+import unicodedata
+
+from food_matcher import FoodMatcher, content_words, words_covered
+from food_store import food_store
+from nutrient_table import get_nutrient_table
+
+# Score minimal (similarité de trigrammes, 0-1) pour accepter un aliment approchant
+FOOD_MATCH_MIN_SCORE = float(os.getenv('FOOD_MATCH_MIN_SCORE', 0.7))
+# Candidats examinés sous ce score minimal : acceptés seulement si tous leurs mots
+# figurent tels quels dans le nom cherché ("oeufs brouilles" -> "oeufs")
+FOOD_MATCH_CANDIDATE_SCORE = 0.4
+FOOD_MATCH_CANDIDATES = 5
+
 # Base de données nutritionnelle étendue
 NUTRITION_DATABASE = {
     # === LÉGUMES ===
@@ -449,57 +464,188 @@ FOOD_SYNONYMS = {
     'pre workout': ['pre-workout', 'booster'],
 }
 
+# Poids moyen d'une pièce / portion (g), pour "une pomme", "2 œufs", "une tranche de pain"
+PIECE_WEIGHTS = {
+    'amande': 1,
+    'amandes': 1,
+    'noix': 5,
+    'noisette': 1,
+    'noisettes': 1,
+    'œuf': 60,
+    'œufs': 60,
+    'oeuf': 60,
+    'oeufs': 60,
+    'tranche': 25,  # pain
+    'tranches': 25,
+    'tranche de pain': 25,
+    'tranche de pain complet': 30,
+    'tranche de pain de mie': 25,
+    'tranche de jambon': 40,
+    'tranche de jambon blanc': 40,
+    'tranche de saumon fumé': 25,
+    'tranche de fromage': 20,
+    'pomme': 180,
+    'pommes': 180,
+    'poire': 170,
+    'poires': 170,
+    'banane': 120,
+    'bananes': 120,
+    'orange': 150,
+    'oranges': 150,
+    'mandarine': 60,
+    'mandarines': 60,
+    'clémentine': 60,
+    'clementine': 60,
+    'kiwi': 75,
+    'kiwis': 75,
+    'avocat': 150,
+    'avocats': 150,
+    'tomate': 120,
+    'tomates': 120,
+    'carotte': 80,
+    'carottes': 80,
+    'yaourt': 125,
+    'yaourt nature': 125,
+    'yaourt grec': 150,
+    'skyr': 150,
+    'steak haché': 100,
+    'steak hache': 100,
+    'escalope de poulet': 120,
+    'blanc de poulet': 120,
+    'baguette': 250,
+    'galette de riz': 9,
+    'galettes de riz': 9,
+    'barre protéinée': 60,
+    'barre proteinee': 60,
+    'protein bar': 60,
+    'pain burger': 60,
+    'bun burger': 60,
+    'tortilla': 40,
+}
+
+def normalize_food_name(food_name):
+    """Minuscules, sans accents, apostrophes et espaces normalisés ("Œufs brouillés" -> "oeufs brouilles")"""
+    text = food_name.lower().replace('œ', 'oe').replace('’', "'")
+    text = unicodedata.normalize('NFKD', text)
+    text = ''.join(c for c in text if not unicodedata.combining(c))
+    return re.sub(r'\s+', ' ', text).strip()
+
+def _build_food_index():
+    """
+    Index construit une fois à l'import :
+    - exact : nom normalisé (clé ou synonyme) -> clé de NUTRITION_DATABASE
+    - matcher : trigrammes de ces mêmes noms, pour les noms approchants ou mal orthographiés
+    """
+    exact = {}
+    
+    for db_food in NUTRITION_DATABASE:
+        exact.setdefault(normalize_food_name(db_food), db_food)
+    
+    # Les synonymes ne masquent jamais une clé existante
+    for main_food, synonyms in FOOD_SYNONYMS.items():
+        if main_food.lower() not in NUTRITION_DATABASE:
+            continue
+        for synonym in synonyms:
+            exact.setdefault(normalize_food_name(synonym), main_food.lower())
+    
+    return {
+        'exact': exact,
+        'matcher': FoodMatcher(exact.items(), min_score=FOOD_MATCH_CANDIDATE_SCORE)
+    }
+
+FOOD_INDEX = _build_food_index()
+
+def _lookup_exact(food_name):
+    """Clé de NUTRITION_DATABASE pour une correspondance exacte (clé ou synonyme, accents ignorés)"""
+    food_lower = food_name.lower().strip()
+    if food_lower in NUTRITION_DATABASE:
+        return food_lower
+    return FOOD_INDEX['exact'].get(normalize_food_name(food_name))
+
+def is_known_food(food_name):
+    """Vrai si le nom correspond exactement à un aliment de la base (ou à un synonyme)"""
+    return _lookup_exact(food_name) is not None
+
+def match_food(food_name):
+    """
+    (clé de NUTRITION_DATABASE, score) du meilleur candidat, ou (None, 0.0).
+    Score 1.0 pour une correspondance exacte (clé ou synonyme), sinon similarité de
+    trigrammes : "pommes de terre sautées" -> "pommes de terre", "carote" -> "carotte".
+    Un candidat n'est retenu que si chacun de ses mots se retrouve dans le nom cherché :
+    "burger" ne donne pas "bun burger", "compote" ne donne pas "comté".
+    """
+    key = _lookup_exact(food_name)
+    if key:
+        return key, 1.0
+    
+    query = normalize_food_name(food_name)
+    for key, score, name in FOOD_INDEX['matcher'].best_matches(query, limit=FOOD_MATCH_CANDIDATES):
+        covered, exact = words_covered(content_words(name), query)
+        if covered and (score >= FOOD_MATCH_MIN_SCORE or exact):
+            return key, score
+    return None, 0.0
+
+def find_food_key(food_name):
+    """Clé de NUTRITION_DATABASE la plus proche du nom donné, ou None"""
+    return match_food(food_name)[0]
+
 def find_food_in_database(food_name):
     """
     Recherche intelligente d'un aliment dans la base de données
     Retourne les valeurs nutritionnelles pour 100g ou None si non trouvé
     """
-    food_lower = food_name.lower().strip()
+    key = find_food_key(food_name)
+    return NUTRITION_DATABASE[key] if key else None
+
+# Valeurs par défaut si aliment non trouvé (légume générique), pour 100g
+DEFAULT_NUTRITION = {'cal': 25, 'prot': 1.5, 'fat': 0.3, 'carb': 5}
+
+def resolve_food(ingredient):
+    """
+    (clé de NUTRITION_DATABASE ou None, valeurs pour 100g ou None).
+    Base étendue d'abord, puis la table compilée (nom exact) et le store
+    CIQUAL / OpenFoodFacts si l'aliment n'y est pas exactement.
+    """
+    key, score = match_food(ingredient)
+    nutrition_data = NUTRITION_DATABASE[key] if key else None
     
-    # 1. Recherche exacte
-    if food_lower in NUTRITION_DATABASE:
-        return NUTRITION_DATABASE[food_lower]
+    nutrient_table = get_nutrient_table() if score < 1.0 else None
+    if nutrient_table is not None:
+        compiled = nutrient_table.get(normalize_food_name(ingredient))
+        if compiled:
+            key, nutrition_data, score = None, compiled, 1.0
     
-    # 2. Recherche dans les synonymes
-    for main_food, synonyms in FOOD_SYNONYMS.items():
-        if food_lower in [s.lower() for s in synonyms]:
-            return NUTRITION_DATABASE.get(main_food.lower())
-    
-    # 3. Recherche partielle (contient)
-    for db_food, values in NUTRITION_DATABASE.items():
-        if food_lower in db_food or db_food in food_lower:
-            return values
-    
-    # 4. Recherche par mots-clés
-    food_words = food_lower.split()
-    for db_food, values in NUTRITION_DATABASE.items():
-        db_words = db_food.split()
-        if any(word in db_words for word in food_words):
-            return values
-    
-    return None
+    if score < 1.0:
+        stored = food_store.lookup(ingredient)
+        if stored and stored['score'] >= score:
+            key, nutrition_data = None, stored
+    
+    return key, nutrition_data
 
 def get_nutrition_for_ingredient(ingredient, grams):
     """
     Fonction améliorée pour obtenir les valeurs nutritionnelles
-    Utilise la nouvelle base de données étendue
+    Utilise la nouvelle base de données étendue (voir resolve_food)
     """
-    nutrition_data = find_food_in_database(ingredient)
-    
-    if nutrition_data:
-        ratio = grams / 100.0
-        return {
-            'calories': nutrition_data['cal'] * ratio,
-            'proteins': nutrition_data['prot'] * ratio,
-            'fats': nutrition_data['fat'] * ratio,
-            'carbs': nutrition_data['carb'] * ratio
-        }
-    
-    # Valeur par défaut si aliment non trouvé (légume générique)
-    print(f"⚠️ Aliment '{ingredient}' non trouvé dans la base, utilisation valeurs par défaut")
+    _, nutrition_data = resolve_food(ingredient)
+    
+    if not nutrition_data:
+        print(f"⚠️ Aliment '{ingredient}' non trouvé dans la base, utilisation valeurs par défaut")
+        nutrition_data = DEFAULT_NUTRITION
+    
+    ratio = grams / 100.0
     return {
-        'calories': 25 * grams / 100, 
-        'proteins': 1.5 * grams / 100, 
-        'fats': 0.3 * grams / 100, 
-        'carbs': 5 * grams / 100
+        'calories': nutrition_data['cal'] * ratio,
+        'proteins': nutrition_data['prot'] * ratio,
+        'fats': nutrition_data['fat'] * ratio,
+        'carbs': nutrition_data['carb'] * ratio
     }
+
+def ingredient_macros(names, grams):
+    """
+    Macros de plusieurs ingrédients : (liste de dicts par ingrédient, dict des totaux).
+    Mêmes valeurs que get_nutrition_for_ingredient, totaux du repas calculés au passage.
+    """
+    macros = [get_nutrition_for_ingredient(name, weight) for name, weight in zip(names, grams)]
+    totals = {key: sum(nutrition[key] for nutrition in macros) for key in ('calories', 'proteins', 'fats', 'carbs')}
+    return macros, totals
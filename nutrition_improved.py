@@ -1,13 +1,58 @@
-import requests
-import base64
+import http_client
+from llm_client import llm_client, ATTACHMENT_PLACEHOLDER
+from food_parse_cache import food_parse_cache
+from food_text_parser import parse_food_text, LOCAL_PARSE_MIN_CONFIDENCE
+from nutrition_database import PIECE_WEIGHTS, get_nutrition_for_ingredient as get_nutrition_enhanced, ingredient_macros
+from image_preprocessing import prepare_image
+from image_cache import dhash, image_cache
+from media_resolver import media_resolver, parse_media_reference
 import re
 import os
 import json
+import hashlib
 from datetime import datetime
 from dotenv import load_dotenv
 
 load_dotenv()
 
+# Prompt de parsing GPT ; toute modification change FOOD_PARSE_PROMPT_VERSION (cache invalidé)
+FOOD_PARSE_MODEL = "gpt-4o-mini"
+FOOD_PARSE_TEMPERATURE = 0.1
+FOOD_PARSE_SYSTEM_PROMPT = """Tu es un expert en nutrition qui parse les descriptions d'aliments.
+
+RÈGLE ABSOLUE : Retourne TOUJOURS un JSON avec la structure {"aliments": [...]} même pour un seul aliment.
+
+FORMAT UNIQUE À UTILISER :
+{
+  "aliments": [
+    {"aliment": "nom", "quantite": nombre, "unite": "g/ml/pieces", "poids_estime": nombre_en_grammes}
+  ]
+}
+
+EXEMPLES :
+- "50g de poulet" → {"aliments": [{"aliment": "poulet", "quantite": 50, "unite": "g", "poids_estime": 50}]}
+- "50g de poulet et 80g d'orange" → {"aliments": [{"aliment": "poulet", "quantite": 50, "unite": "g", "poids_estime": 50}, {"aliment": "orange", "quantite": 80, "unite": "g", "poids_estime": 80}]}
+- "une pomme et deux bananes" → {"aliments": [{"aliment": "pomme", "quantite": 1, "unite": "pieces", "poids_estime": 180}, {"aliment": "banane", "quantite": 2, "unite": "pieces", "poids_estime": 240}]}
+- "150ml de lait" → {"aliments": [{"aliment": "lait", "quantite": 150, "unite": "ml", "poids_estime": 150}]}
+
+CONVERSIONS :
+- 1 pomme = 180g
+- 1 banane = 120g
+- 1 orange = 150g
+- 1 œuf = 60g
+- 1ml de liquide = 1g
+- 1 cuillère à soupe = 15g
+- 1 cuillère à café = 5g
+
+IMPORTANT : 
+- N'utilise QUE des guillemets doubles (")
+- Pas d'apostrophes dans les noms d'aliments
+- Retourne UNIQUEMENT le JSON, rien d'autre"""
+
+FOOD_PARSE_PROMPT_VERSION = hashlib.sha1(
+    f"{FOOD_PARSE_MODEL}|{FOOD_PARSE_TEMPERATURE}|{FOOD_PARSE_SYSTEM_PROMPT}".encode('utf-8')
+).hexdigest()[:12]
+
 def analyze_food_request(text_content, media_url, debug_callback=None):
     """Point d'entrée principal pour l'analyse nutritionnelle"""
     try:
@@ -24,6 +69,8 @@ def analyze_food_request(text_content, media_url, debug_callback=None):
             return analyze_text_improved(text_content, debug_callback)
         else:
             return None
+    except http_client.MediaRejectedError:
+        raise
     except Exception as e:
         # Utiliser logging au lieu de print
         import logging
@@ -66,6 +113,12 @@ def parse_food_text_with_gpt(text, debug_callback=None):
     logger.debug(f"🔍 DEBUG GPT: Début parsing pour '{text}'")
     
     try:
+        # Même texte (normalisé) et même prompt déjà parsés : pas d'appel OpenAI
+        cached = food_parse_cache.get(text, FOOD_PARSE_PROMPT_VERSION)
+        if cached:
+            logger.debug(f"⚡ DEBUG GPT: Résultat en cache pour '{text}'")
+            return cached
+        
         api_key = os.getenv('OPENAI_API_KEY')
         if not api_key:
             logger.error("❌ DEBUG GPT: Clé API manquante")
@@ -73,58 +126,23 @@ def parse_food_text_with_gpt(text, debug_callback=None):
                 debug_callback("❌ DEBUG GPT: Clé API manquante")
             return None
         
-        headers = {
-            "Content-Type": "application/json",
-            "Authorization": f"Bearer {api_key}"
-        }
-        
         # Prompt amélioré pour éviter les ambiguïtés
         payload = {
-            "model": "gpt-4o-mini",
+            "model": FOOD_PARSE_MODEL,
             "messages": [
                 {
                     "role": "system",
-                    "content": """Tu es un expert en nutrition qui parse les descriptions d'aliments.
-
-RÈGLE ABSOLUE : Retourne TOUJOURS un JSON avec la structure {"aliments": [...]} même pour un seul aliment.
-
-FORMAT UNIQUE À UTILISER :
-{
-  "aliments": [
-    {"aliment": "nom", "quantite": nombre, "unite": "g/ml/pieces", "poids_estime": nombre_en_grammes}
-  ]
-}
-
-EXEMPLES :
-- "50g de poulet" → {"aliments": [{"aliment": "poulet", "quantite": 50, "unite": "g", "poids_estime": 50}]}
-- "50g de poulet et 80g d'orange" → {"aliments": [{"aliment": "poulet", "quantite": 50, "unite": "g", "poids_estime": 50}, {"aliment": "orange", "quantite": 80, "unite": "g", "poids_estime": 80}]}
-- "une pomme et deux bananes" → {"aliments": [{"aliment": "pomme", "quantite": 1, "unite": "pieces", "poids_estime": 180}, {"aliment": "banane", "quantite": 2, "unite": "pieces", "poids_estime": 240}]}
-- "150ml de lait" → {"aliments": [{"aliment": "lait", "quantite": 150, "unite": "ml", "poids_estime": 150}]}
-
-CONVERSIONS :
-- 1 pomme = 180g
-- 1 banane = 120g
-- 1 orange = 150g
-- 1 œuf = 60g
-- 1ml de liquide = 1g
-- 1 cuillère à soupe = 15g
-- 1 cuillère à café = 5g
-
-IMPORTANT : 
-- N'utilise QUE des guillemets doubles (")
-- Pas d'apostrophes dans les noms d'aliments
-- Retourne UNIQUEMENT le JSON, rien d'autre"""
+                    "content": FOOD_PARSE_SYSTEM_PROMPT
                 },
                 {"role": "user", "content": f"Parse: {text}"}
             ],
             "max_tokens": 200,
-            "temperature": 0.1
+            "temperature": FOOD_PARSE_TEMPERATURE
         }
         
         logger.debug(f"🌐 DEBUG GPT: Envoi requête à OpenAI...")
         
-        response = requests.post("https://api.openai.com/v1/chat/completions", 
-                               headers=headers, json=payload, timeout=15)
+        response = llm_client.chat_completion(payload, api_key, timeout=15)
         
         logger.debug(f"📡 DEBUG GPT: Status code: {response.status_code}")
         
@@ -152,6 +170,9 @@ IMPORTANT :
                         }]
                     }
                 
+                if parsed_json.get('aliments'):
+                    food_parse_cache.set(text, FOOD_PARSE_PROMPT_VERSION, parsed_json)
+                
                 return parsed_json
                 
             except json.JSONDecodeError as e:
@@ -269,13 +290,27 @@ def basic_text_parsing(text):
     
     return {'aliments': aliments} if aliments else None
 
+# Répartition des analyses de texte : parser local vs GPT
+text_parse_stats = {'local': 0, 'gpt': 0}
+
 def analyze_text_improved(text, debug_callback=None):
     """Analyse améliorée du texte avec GPT pour comprendre les quantités"""
     import logging
     logger = logging.getLogger(__name__)
     logger.debug(f"🔍 Analyse texte améliorée: {text}")
     
-    # Essayer d'abord avec GPT
+    # Cas simples ("2 œufs", "150g de riz") : parser local, sans appel GPT
+    local_data = parse_food_text(text)
+    if local_data and local_data['confidence'] >= LOCAL_PARSE_MIN_CONFIDENCE:
+        logger.debug(f"⚡ Parser local: {len(local_data['aliments'])} aliment(s), confiance {local_data['confidence']}")
+        text_parse_stats['local'] += 1
+        result = process_multiple_foods(local_data['aliments'], text)
+        result['source'] = 'Parser local + Base nutritionnelle'
+        result['detected_by'] = 'local'
+        return result
+    
+    # Sinon GPT
+    text_parse_stats['gpt'] += 1
     parsed_data = parse_food_text_with_gpt(text, debug_callback)
     
     if parsed_data and 'aliments' in parsed_data:
@@ -290,11 +325,8 @@ def analyze_text_improved(text, debug_callback=None):
 
 def process_multiple_foods(aliments_list, original_text):
     """Traite une liste d'aliments et retourne un résumé nutritionnel"""
-    ingredients = []
-    total_calories = 0
-    total_proteins = 0
-    total_fats = 0
-    total_carbs = 0
+    names = []
+    weights = []
     
     for aliment_data in aliments_list:
         aliment = aliment_data.get('aliment', 'Aliment')
@@ -303,23 +335,15 @@ def process_multiple_foods(aliments_list, original_text):
         unite = aliment_data.get('unite', '')
         
         print(f"  → {aliment}: {poids}g ({quantite} {unite})")
-        
-        # Obtenir les données nutritionnelles
-        nutrition = get_nutrition_for_ingredient(aliment, poids)
-        
-        ingredients.append({
-            'name': aliment,
-            'grams': poids,
-            'calories': nutrition['calories'],
-            'proteins': nutrition['proteins'],
-            'fats': nutrition['fats'],
-            'carbs': nutrition['carbs']
-        })
-        
-        total_calories += nutrition['calories']
-        total_proteins += nutrition['proteins']
-        total_fats += nutrition['fats']
-        total_carbs += nutrition['carbs']
+        names.append(aliment)
+        weights.append(poids)
+    
+    # Données nutritionnelles de tous les aliments en un calcul
+    macros, totals = ingredient_macros(names, weights)
+    ingredients = [
+        {'name': name, 'grams': poids, **nutrition}
+        for name, poids, nutrition in zip(names, weights, macros)
+    ]
     
     # Créer un nom descriptif
     if len(ingredients) == 1:
@@ -335,10 +359,10 @@ def process_multiple_foods(aliments_list, original_text):
     
     return {
         'name': name,
-        'calories': total_calories,
-        'proteines': total_proteins,
-        'lipides': total_fats,
-        'glucides': total_carbs,
+        'calories': totals['calories'],
+        'proteines': totals['proteins'],
+        'lipides': totals['fats'],
+        'glucides': totals['carbs'],
         'source': 'GPT-4o-mini + Base nutritionnelle',
         'detected_by': 'GPT',
         'total_weight': total_weight,
@@ -350,8 +374,8 @@ def analyze_text_fallback(text):
     """Méthode de fallback pour l'analyse de texte"""
     print(f"🔄 Fallback analyse texte: {text}")
     
-    # Utiliser le parsing basique
-    parsed = basic_text_parsing(text)
+    # Parser local même peu confiant (meilleur que le parsing basique), sinon parsing basique
+    parsed = parse_food_text(text) or basic_text_parsing(text)
     if parsed and 'aliments' in parsed:
         return process_multiple_foods(parsed['aliments'], text)
     
@@ -369,50 +393,68 @@ def analyze_text_fallback(text):
 
 def get_piece_weight(food_type):
     """Retourne le poids d'une pièce d'aliment"""
-    weights = {
-        'amande': 1,
-        'amandes': 1,
-        'noix': 5,
-        'œuf': 60,
-        'œufs': 60,
-        'oeuf': 60,
-        'oeufs': 60,
-        'tranche': 25,  # pain
-        'tranches': 25,
-        'pomme': 180,
-        'pommes': 180,
-        'banane': 120,
-        'bananes': 120,
-        'orange': 150,
-        'oranges': 150
-    }
-    return weights.get(food_type.lower(), 100)  # 100g par défaut
+    return PIECE_WEIGHTS.get(food_type.lower(), 100)  # 100g par défaut
 
 def get_default_piece_weight(food_name):
     """Retourne le poids par défaut pour un aliment"""
     return get_piece_weight(food_name)
 
 def download_twilio_media(media_url, account_sid, auth_token):
-    """Télécharge le média depuis Twilio"""
+    """
+    Télécharge le média depuis Twilio (en flux, taille et type de contenu vérifiés).
+    Un média trop gros ou d'un autre type lève MediaRejectedError.
+    """
     try:
-        response = requests.get(media_url, auth=(account_sid, auth_token), timeout=30)
-        if response.status_code == 200 and len(response.content) > 1000:
-            return response.content
+        image_bytes = http_client.download(media_url, auth=(account_sid, auth_token), timeout=30)
+        if len(image_bytes) > 1000:
+            return image_bytes
+        return None
+    except http_client.MediaRejectedError:
+        raise
+    except http_client.MediaDownloadError as e:
+        print(f"⚠️ Média indisponible: {e}")
         return None
     except Exception as e:
         print(f"❌ Erreur téléchargement: {e}")
         return None
 
+def download_media(media_url, account_sid, auth_token):
+    """
+    Octets du média : media_id WhatsApp Business (Graph API, souvent déjà préchargé) ou URL Twilio.
+    Même comportement pour les deux : MediaRejectedError si le média est refusé, None si indisponible.
+    """
+    media_id = parse_media_reference(media_url)
+    if not media_id:
+        return download_twilio_media(media_url, account_sid, auth_token)
+
+    try:
+        return media_resolver.fetch(media_id)
+    except http_client.MediaRejectedError:
+        raise
+    except Exception as e:
+        print(f"❌ Erreur téléchargement média {media_id}: {e}")
+        return None
+
 def analyze_image_openai(image_url, account_sid, auth_token, api_key):
     """Analyse une image avec OpenAI Vision - Version améliorée"""
     try:
         # Télécharger l'image
-        image_bytes = download_twilio_media(image_url, account_sid, auth_token)
+        image_bytes = download_media(image_url, account_sid, auth_token)
         if not image_bytes:
             return None
+        
+        # Même photo (ou quasi identique) déjà analysée : pas d'appel Vision
+        image_hash = dhash(image_bytes)
+        cached_aliments = image_cache.get(image_hash)
+        if cached_aliments:
+            result = parse_vision_response_improved(json.dumps({'aliments': cached_aliments}))
+            if result:
+                result['source'] = 'OpenAI Vision Pro (photo déjà analysée)'
+                return result
             
-        # Encoder en base64
-        image_base64 = base64.b64encode(image_bytes).decode('utf-8')
+        # Réduire / réencoder avant l'envoi ; l'original n'est plus nécessaire
+        image = prepare_image(image_bytes)
+        del image_bytes
         
         prompt = """IMPORTANT: Tu DOIS analyser cette image et retourner EXACTEMENT dans ce format JSON:
 
@@ -446,11 +488,6 @@ EXEMPLES:
 
 Analyse cette image:"""
         
-        headers = {
-            "Content-Type": "application/json",
-            "Authorization": f"Bearer {api_key}"
-        }
-        
         payload = {
             "model": "gpt-4o",
             "messages": [
@@ -462,22 +499,31 @@ Analyse cette image:"""
                     "role": "user",
                     "content": [
                         {"type": "text", "text": prompt},
-                        {"type": "image_url", "image_url": {"url": f"data:image/jpeg;base64,{image_base64}"}}
+                        {"type": "image_url", "image_url": {"url": f"data:{image['mime']};base64,{ATTACHMENT_PLACEHOLDER}", "detail": image['detail']}}
                     ]
                 }
             ],
             "max_tokens": 500
         }
         
-        response = requests.post("https://api.openai.com/v1/chat/completions", 
-                               headers=headers, json=payload, timeout=30)
+        # Image encodée en base64 directement dans le corps de la requête, par blocs
+        response = llm_client.chat_completion(payload, api_key, timeout=30, attachment=image['data'])
         
         if response.status_code == 200:
             content = response.json()['choices'][0]['message']['content']
-            return parse_vision_response_improved(content)
+            result = parse_vision_response_improved(content)
+            if result:
+                image_cache.set(image_hash, [
+                    {'nom': ing['name'], 'poids': ing['grams'], 'description': ing['description']}
+                    for ing in result['ingredients']
+                ])
+            return result
             
         return None
             
+    except http_client.MediaRejectedError:
+        # Remonté jusqu'à l'appelant, qui explique à l'utilisateur pourquoi la photo est refusée
+        raise
     except Exception as e:
         print(f"❌ Erreur Vision: {e}")
         return None
@@ -498,11 +544,9 @@ def parse_vision_response_improved(content):
             print("⚠️ Aucun aliment détecté dans le JSON")
             return None
         
-        ingredients = []
-        total_calories = 0
-        total_proteins = 0
-        total_fats = 0
-        total_carbs = 0
+        names = []
+        weights = []
+        descriptions = []
         
         for aliment in aliments:
             nom = aliment.get('nom', 'Aliment inconnu')
@@ -510,24 +554,16 @@ def parse_vision_response_improved(content):
             description = aliment.get('description', '')
             
             print(f"  → {nom}: {poids}g ({description})")
-            
-            # Obtenir les données nutritionnelles
-            nutrition = get_nutrition_for_ingredient(nom, poids)
-            
-            ingredients.append({
-                'name': nom,
-                'grams': poids,
-                'description': description,
-                'calories': nutrition['calories'],
-                'proteins': nutrition['proteins'],
-                'fats': nutrition['fats'],
-                'carbs': nutrition['carbs']
-            })
-            
-            total_calories += nutrition['calories']
-            total_proteins += nutrition['proteins']
-            total_fats += nutrition['fats']
-            total_carbs += nutrition['carbs']
+            names.append(nom)
+            weights.append(poids)
+            descriptions.append(description)
+        
+        # Données nutritionnelles de tous les aliments en un calcul
+        macros, totals = ingredient_macros(names, weights)
+        ingredients = [
+            {'name': nom, 'grams': poids, 'description': description, **nutrition}
+            for nom, poids, description, nutrition in zip(names, weights, descriptions, macros)
+        ]
         
         # Créer un résumé global
         ingredients_names = [ing['name'] for ing in ingredients]
@@ -535,10 +571,10 @@ def parse_vision_response_improved(content):
         
         return {
             'name': f"Repas ({', '.join(ingredients_names[:3])}{'...' if len(ingredients_names) > 3 else ''})",
-            'calories': total_calories,
-            'proteines': total_proteins,
-            'lipides': total_fats,
-            'glucides': total_carbs,
+            'calories': totals['calories'],
+            'proteines': totals['proteins'],
+            'lipides': totals['fats'],
+            'glucides': totals['carbs'],
             'source': 'OpenAI Vision Pro',
             'detected_by': 'OpenAI',
             'total_weight': total_weight,
@@ -559,8 +595,4 @@ def get_nutrition_for_ingredient(ingredient, grams):
     """
     Fonction améliorée utilisant la base de données nutritionnelle étendue
     """
-    # Importer la nouvelle base de données
-    from nutrition_database import get_nutrition_for_ingredient as get_nutrition_enhanced
-    
-    # Utiliser la fonction améliorée
     return get_nutrition_enhanced(ingredient, grams)
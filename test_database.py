@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+Script de test pour les connexions SQLite par thread (database.get_connection)
+Vérifie qu'une connexion est réutilisée dans son thread et fermée à la fin du thread
+"""
+
+import os
+import sys
+import shutil
+import tempfile
+import threading
+
+# Ajouter le répertoire courant au path pour les imports
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+def test_reuse_in_thread(db_path):
+    """Même thread, même fichier : même connexion ; autre thread : autre connexion"""
+    print("🔁 Test réutilisation dans le thread...")
+
+    from database import get_connection
+
+    conn = get_connection(db_path)
+    other = []
+    thread = threading.Thread(target=lambda: other.append(get_connection(db_path)))
+    thread.start()
+    thread.join()
+
+    if get_connection(db_path) is not conn or other[0] is conn:
+        print("❌ Connexion partagée entre threads ou rouverte dans le même thread")
+        return False
+
+    print("✅ Une connexion par thread")
+    return True
+
+def test_closed_on_thread_exit(db_path):
+    """Un thread par requête (app.run threaded) : aucune connexion gardée après la fin des threads"""
+    print("\n🧵 Test fermeture à la fin des threads...")
+
+    import sqlite3
+    from database import get_connection, open_connection_count
+
+    opened = []
+
+    def request():
+        conn = get_connection(db_path)
+        conn.execute("SELECT 1")
+        opened.append(conn)
+
+    before = open_connection_count()
+    for _ in range(5):
+        threads = [threading.Thread(target=request) for _ in range(50)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    leaked = open_connection_count() - before
+    try:
+        opened[0].execute("SELECT 1")
+        closed = False
+    except sqlite3.ProgrammingError:
+        closed = True
+
+    if leaked or not closed:
+        print(f"❌ {leaked} connexions encore ouvertes après 250 threads (fermée: {closed})")
+        return False
+
+    print(f"✅ {len(opened)} connexions ouvertes puis fermées avec leur thread")
+    return True
+
+def main():
+    """Fonction principale de test"""
+    print("🧪 TEST CONNEXIONS SQLITE")
+    print("=" * 50)
+
+    tests_results = []
+
+    def run(name, test):
+        tmp_dir = tempfile.mkdtemp(prefix="lea-database-test-")
+        try:
+            tests_results.append((name, test(os.path.join(tmp_dir, "test.db"))))
+        finally:
+            from database import close_connections
+            close_connections()
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    run("Réutilisation", test_reuse_in_thread)
+    run("Fin des threads", test_closed_on_thread_exit)
+
+    # Résumé des tests
+    print("\n" + "=" * 50)
+    print("📊 RÉSUMÉ DES TESTS")
+    print("=" * 50)
+
+    passed = 0
+    total = len(tests_results)
+
+    for test_name, result in tests_results:
+        status = "✅ PASS" if result else "❌ FAIL"
+        print(f"{test_name:<25} {status}")
+        if result:
+            passed += 1
+
+    print(f"\n🎯 Résultat: {passed}/{total} tests réussis")
+    return passed == total
+
+if __name__ == "__main__":
+    success = main()
+    sys.exit(0 if success else 1)
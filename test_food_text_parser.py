@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""
+Script de test pour le parser local des descriptions de repas (food_text_parser)
+Vérifie quantités, unités, confiance et normalisation partagée avec le cache de parsing
+"""
+
+import os
+import sys
+
+# Ajouter le répertoire courant au path pour les imports
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+def summary(result):
+    return [(a["aliment"], a["unite"], a["poids_estime"]) for a in result["aliments"]]
+
+def test_quantities_and_units():
+    """Pièces, grammes, kilos avec virgule décimale, cuillères"""
+    print("⚖️ Test quantités et unités...")
+
+    from food_text_parser import parse_food_text
+
+    expected = {
+        "2 œufs et 100g de riz": [("oeufs", "pieces", 120), ("riz", "g", 100)],
+        "1,5 kg de pommes de terre": [("pommes de terre", "kg", 1500)],
+        "une banane": [("banane", "pieces", 120)],
+        "3 cuillères à soupe d'huile d'olive": [("huile d'olive", "c. à soupe", 45)],
+    }
+    for text, foods in expected.items():
+        result = parse_food_text(text)
+        if summary(result) != foods:
+            print(f"❌ {text!r} -> {summary(result)}")
+            return False
+
+    print(f"✅ {len(expected)} descriptions parsées")
+    return True
+
+def test_confidence():
+    """Aliments connus : au-dessus du seuil ; aliment inconnu ou sans quantité : GPT"""
+    print("\n🎯 Test confiance...")
+
+    from food_text_parser import parse_food_text, LOCAL_PARSE_MIN_CONFIDENCE
+
+    confident = parse_food_text("150 g poulet, 1 yaourt")["confidence"]
+    unknown = parse_food_text("un truc bizarre")["confidence"]
+    partial = parse_food_text("200g de blanc de poulet + salade")["confidence"]
+
+    if confident < LOCAL_PARSE_MIN_CONFIDENCE or unknown >= LOCAL_PARSE_MIN_CONFIDENCE or partial >= LOCAL_PARSE_MIN_CONFIDENCE:
+        print(f"❌ Confiances inattendues: {confident}, {unknown}, {partial}")
+        return False
+
+    print(f"✅ connu {confident}, inconnu {unknown}, sans quantité {partial}")
+    return True
+
+def test_shared_normalization():
+    """œ, accents, apostrophes et espaces : même forme pour la base, le parser et le cache"""
+    print("\n🔤 Test normalisation partagée...")
+
+    from nutrition_database import normalize_food_name
+    from food_parse_cache import FoodParseCache
+
+    variants = ["Œufs  brouillés", "oeufs brouilles", "ŒUFS BROUILLÉS "]
+    names = {normalize_food_name(text) for text in variants}
+    keys = {FoodParseCache.make_key(text, "v1") for text in variants}
+
+    if names != {"oeufs brouilles"} or len(keys) != 1:
+        print(f"❌ Formes différentes: {names}, {keys}")
+        return False
+
+    if normalize_food_name("jus d’orange") != "jus d'orange":
+        print("❌ Apostrophe typographique non unifiée")
+        return False
+
+    print("✅ Une seule forme normalisée")
+    return True
+
+def main():
+    """Fonction principale de test"""
+    print("🧪 TEST PARSER LOCAL DES REPAS")
+    print("=" * 50)
+
+    tests_results = [
+        ("Quantités et unités", test_quantities_and_units()),
+        ("Confiance", test_confidence()),
+        ("Normalisation partagée", test_shared_normalization()),
+    ]
+
+    # Résumé des tests
+    print("\n" + "=" * 50)
+    print("📊 RÉSUMÉ DES TESTS")
+    print("=" * 50)
+
+    passed = 0
+    total = len(tests_results)
+
+    for test_name, result in tests_results:
+        status = "✅ PASS" if result else "❌ FAIL"
+        print(f"{test_name:<25} {status}")
+        if result:
+            passed += 1
+
+    print(f"\n🎯 Résultat: {passed}/{total} tests réussis")
+    return passed == total
+
+if __name__ == "__main__":
+    success = main()
+    sys.exit(0 if success else 1)
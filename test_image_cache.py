@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+"""
+Script de test pour le cache des analyses de photos (hash perceptuel)
+Vérifie qu'une photo n'hérite jamais des aliments d'une autre photo sans rapport
+"""
+
+import os
+import io
+import sys
+import shutil
+import tempfile
+
+from PIL import Image
+
+# Ajouter le répertoire courant au path pour les imports
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+def make_image(color=None, size=(800, 600)):
+    """Photo unie (color) ou dégradé en damier (photo « normale »)"""
+    if color:
+        image = Image.new("RGB", size, color)
+    else:
+        image = Image.new("RGB", (8, 6))
+        image.putdata([((x * 37 + y * 91) % 256, (x * 53) % 256, (y * 71) % 256) for y in range(6) for x in range(8)])
+        image = image.resize(size, Image.BICUBIC)
+    output = io.BytesIO()
+    image.save(output, format="JPEG", quality=90)
+    return output.getvalue()
+
+def make_cache(db_path):
+    from database import init_db
+    from image_cache import ImageAnalysisCache
+
+    init_db(db_path)
+    return ImageAnalysisCache(db_path=db_path)
+
+def test_uniform_images(db_path):
+    """Deux photos unies différentes : pas de hash, rien en cache, aucun hit"""
+    print("⬛ Test photos unies (sombre / surexposée)...")
+
+    from image_cache import dhash
+
+    cache = make_cache(db_path)
+    dark, white = make_image((12, 12, 12)), make_image((250, 250, 250))
+    dark_hash, white_hash = dhash(dark), dhash(white)
+
+    cache.set(dark_hash, [{"nom": "steak", "poids": 150, "description": ""}])
+    cached = cache.get(white_hash)
+
+    if dark_hash is not None or white_hash is not None or cached is not None:
+        print(f"❌ Photos unies mises en cache: {dark_hash}, {white_hash}, {cached}")
+        return False
+
+    stats = cache.stats()
+    if stats["stores"] or stats["hits"] or stats["near_hits"]:
+        print(f"❌ Statistiques inattendues: {stats}")
+        return False
+
+    print("✅ Aucun hash, aucune entrée, aucun hit")
+    return True
+
+def test_degenerate_hashes(db_path):
+    """Hash à 0, tout à 1 ou presque vides : ni stockés ni cherchés ; peu informatifs : exact seulement"""
+    print("\n🔢 Test hash dégénérés...")
+
+    cache = make_cache(db_path)
+    aliments = [{"nom": "riz", "poids": 100, "description": ""}]
+
+    for image_hash in (0, (1 << 64) - 1, 0b111):
+        cache.set(image_hash, aliments)
+        if cache.get(image_hash) is not None:
+            print(f"❌ Hash dégénéré en cache: {image_hash:#x}")
+            return False
+
+    # 10 bits à 1 : correspondance exacte acceptée, voisin à 1 bit refusé
+    low_entropy = 0b1111111111
+    cache.set(low_entropy, aliments)
+    if cache.get(low_entropy) is None or cache.get(low_entropy | 1 << 40) is not None:
+        print("❌ Hash peu informatif mal traité")
+        return False
+
+    print("✅ Hash dégénérés ignorés, hash peu informatif en exact uniquement")
+    return True
+
+def test_normal_image(db_path):
+    """Photo normale : hit sur la même photo réencodée"""
+    print("\n🍽️ Test photo normale...")
+
+    from image_cache import dhash
+
+    cache = make_cache(db_path)
+    image = make_image()
+    image_hash = dhash(image)
+    cache.set(image_hash, [{"nom": "poulet", "poids": 120, "description": ""}])
+
+    reencoded = io.BytesIO()
+    Image.open(io.BytesIO(image)).save(reencoded, format="JPEG", quality=60)
+    cached = cache.get(dhash(reencoded.getvalue()))
+
+    if not cached or cached[0]["nom"] != "poulet":
+        print(f"❌ Photo réencodée non retrouvée (hash {image_hash})")
+        return False
+
+    print(f"✅ Photo retrouvée ({image_hash.bit_count()} bits à 1)")
+    return True
+
+def main():
+    """Fonction principale de test"""
+    print("🧪 TEST CACHE DES PHOTOS")
+    print("=" * 50)
+
+    tests_results = []
+
+    def run(name, test):
+        # Base vide pour chaque test
+        tmp_dir = tempfile.mkdtemp(prefix="lea-image-cache-test-")
+        try:
+            tests_results.append((name, test(os.path.join(tmp_dir, "test.db"))))
+        finally:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    run("Photos unies", test_uniform_images)
+    run("Hash dégénérés", test_degenerate_hashes)
+    run("Photo normale", test_normal_image)
+
+    # Résumé des tests
+    print("\n" + "=" * 50)
+    print("📊 RÉSUMÉ DES TESTS")
+    print("=" * 50)
+
+    passed = 0
+    total = len(tests_results)
+
+    for test_name, result in tests_results:
+        status = "✅ PASS" if result else "❌ FAIL"
+        print(f"{test_name:<25} {status}")
+        if result:
+            passed += 1
+
+    print(f"\n🎯 Résultat: {passed}/{total} tests réussis")
+    return passed == total
+
+if __name__ == "__main__":
+    success = main()
+    sys.exit(0 if success else 1)
@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+"""
+Script de test pour le client OpenAI asynchrone (llm_client)
+Teste contre un faux serveur /chat/completions local : aucun appel à OpenAI
+"""
+
+import os
+import sys
+import json
+import base64
+import asyncio
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Ajouter le répertoire courant au path pour les imports
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+class FakeOpenAI(BaseHTTPRequestHandler):
+    """POST /chat/completions -> renvoie le modèle et la taille de l'image reçue"""
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        payload = json.loads(self.rfile.read(length))
+        content = {"model": payload.get("model")}
+        for message in payload.get("messages", []):
+            for part in message.get("content", []) if isinstance(message.get("content"), list) else []:
+                if part.get("type") == "image_url":
+                    data = part["image_url"]["url"].split(",", 1)[1]
+                    content["image_bytes"] = len(base64.b64decode(data))
+
+        body = json.dumps({"choices": [{"message": {"content": json.dumps(content)}}]}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+def start_server():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FakeOpenAI)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+def content_of(response):
+    return json.loads(response.json()["choices"][0]["message"]["content"])
+
+def test_await_from_caller_loop(base_url):
+    """await chat_completion_async depuis la boucle de l'appelant (client jamais démarré)"""
+    print("⏳ Test await depuis une autre boucle asyncio...")
+
+    from llm_client import AsyncLLMClient
+
+    client = AsyncLLMClient(base_url=base_url)
+
+    async def run():
+        payloads = [{"model": "gpt-4o-mini", "messages": [{"role": "user", "content": str(i)}]} for i in range(10)]
+        return await asyncio.gather(*(client.chat_completion_async(p, "test-key") for p in payloads))
+
+    try:
+        responses = asyncio.run(run())
+    except Exception as e:
+        print(f"❌ Erreur: {type(e).__name__}: {e}")
+        return False
+
+    if [r.status_code for r in responses] != [200] * 10 or client.stats()["calls"] != 10:
+        print(f"❌ Réponses inattendues: {client.stats()}")
+        return False
+
+    print("✅ 10 appels concurrents awaités depuis la boucle de l'appelant")
+    return True
+
+def test_sync_wrapper_with_attachment(base_url):
+    """Wrapper synchrone + pièce jointe encodée en base64 en flux"""
+    print("\n📎 Test wrapper synchrone avec pièce jointe...")
+
+    from llm_client import AsyncLLMClient, ATTACHMENT_PLACEHOLDER
+
+    client = AsyncLLMClient(base_url=base_url)
+    image = os.urandom(200 * 1024 + 1)
+    payload = {
+        "model": "gpt-4o",
+        "messages": [{"role": "user", "content": [
+            {"type": "image_url", "image_url": {"url": f"data:image/jpeg;base64,{ATTACHMENT_PLACEHOLDER}"}}
+        ]}]
+    }
+
+    response = client.chat_completion(payload, "test-key", attachment=image)
+    if response.status_code != 200 or content_of(response).get("image_bytes") != len(image):
+        print(f"❌ Pièce jointe mal transmise: {response.status_code}")
+        return False
+
+    print(f"✅ {len(image)} octets transmis et décodés côté serveur")
+    return True
+
+def main():
+    """Fonction principale de test"""
+    print("🧪 TEST CLIENT LLM ASYNCHRONE")
+    print("=" * 50)
+
+    server, base_url = start_server()
+    tests_results = [
+        ("Await autre boucle", test_await_from_caller_loop(base_url)),
+        ("Wrapper synchrone", test_sync_wrapper_with_attachment(base_url)),
+    ]
+    server.shutdown()
+
+    # Résumé des tests
+    print("\n" + "=" * 50)
+    print("📊 RÉSUMÉ DES TESTS")
+    print("=" * 50)
+
+    passed = 0
+    total = len(tests_results)
+
+    for test_name, result in tests_results:
+        status = "✅ PASS" if result else "❌ FAIL"
+        print(f"{test_name:<25} {status}")
+        if result:
+            passed += 1
+
+    print(f"\n🎯 Résultat: {passed}/{total} tests réussis")
+    return passed == total
+
+if __name__ == "__main__":
+    success = main()
+    sys.exit(0 if success else 1)
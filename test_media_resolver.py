@@ -0,0 +1,244 @@
+#!/usr/bin/env python3
+"""
+Script de test pour la résolution des médias WhatsApp Business (media_id -> URL -> octets)
+Teste contre un faux serveur Graph API local : aucun appel à Meta
+"""
+
+import os
+import sys
+import json
+import shutil
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Ajouter le répertoire courant au path pour les imports
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+TOKEN = "test-token"
+MEDIA = {
+    "1001": b"\xff\xd8" + b"photo-repas-1" * 200,
+    "1002": b"\xff\xd8" + b"photo-repas-2" * 200,
+    "1003": b"\xff\xd8" + b"photo-repas-3" * 200,
+}
+
+class FakeGraphAPI(BaseHTTPRequestHandler):
+    """GET /{media_id} -> {'url', 'mime_type'} ; GET /download/{media_id} -> octets (après un délai)"""
+    requests_count = {}
+    delay = 0.3
+
+    def do_GET(self):
+        FakeGraphAPI.requests_count[self.path] = FakeGraphAPI.requests_count.get(self.path, 0) + 1
+        if self.headers.get("Authorization") != f"Bearer {TOKEN}":
+            self._send(401, b'{"error": "unauthorized"}', "application/json")
+            return
+
+        if self.path.startswith("/download/"):
+            media_id = self.path.rsplit("/", 1)[-1]
+            time.sleep(FakeGraphAPI.delay)
+            self._send(200, MEDIA[media_id], "image/jpeg")
+            return
+
+        media_id = self.path.strip("/")
+        if media_id not in MEDIA:
+            self._send(404, b'{"error": "not found"}', "application/json")
+            return
+
+        host, port = self.server.server_address
+        body = json.dumps({
+            "id": media_id,
+            "url": f"http://{host}:{port}/download/{media_id}",
+            "mime_type": "image/jpeg",
+            "file_size": len(MEDIA[media_id])
+        }).encode()
+        self._send(200, body, "application/json")
+
+    def _send(self, status, body, content_type):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+def start_server():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FakeGraphAPI)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+def make_resolver(base_url, cache_dir, **kwargs):
+    from media_resolver import MediaResolver
+    return MediaResolver(access_token=TOKEN, base_url=base_url, cache_dir=cache_dir, **kwargs)
+
+def test_webhook_parser():
+    """Le parser webhook transporte le media_id (Meta n'envoie pas de lien)"""
+    print("🔗 Test du parser webhook (image)...")
+
+    from whatsapp_business_api import parse_whatsapp_business_webhook
+    from media_resolver import parse_media_reference
+
+    payload = {"entry": [{"changes": [{"value": {
+        "contacts": [{"wa_id": "41774184918", "profile": {"name": "Test"}}],
+        "messages": [{
+            "id": "wamid.test", "from": "41774184918", "timestamp": "1700000000", "type": "image",
+            "image": {"id": "1001", "mime_type": "image/jpeg", "sha256": "x"}
+        }]
+    }}]}]}
+
+    message = parse_whatsapp_business_webhook(payload)
+    media_id = parse_media_reference(message.get("media_url"))
+    if media_id != "1001":
+        print(f"❌ media_url inattendue: {message.get('media_url')}")
+        return False
+
+    print(f"✅ media_url = {message['media_url']}")
+    return True
+
+def test_resolve_and_cache(base_url, cache_dir):
+    """Résolution media_id -> URL -> octets, puis lecture depuis le cache disque"""
+    print("\n📥 Test résolution + cache disque...")
+
+    resolver = make_resolver(base_url, cache_dir)
+    FakeGraphAPI.requests_count.clear()
+
+    data = resolver.get("1001")
+    if data != MEDIA["1001"]:
+        print("❌ Octets différents du média servi")
+        return False
+
+    # Nouvelle instance (= redémarrage) : le média doit venir du disque
+    resolver = make_resolver(base_url, cache_dir)
+    data = resolver.get("1001")
+    downloads = FakeGraphAPI.requests_count.get("/download/1001", 0)
+    stats = resolver.stats()
+    resolver.shutdown()
+
+    if data != MEDIA["1001"] or downloads != 1 or stats["hits"] != 1:
+        print(f"❌ Cache disque non utilisé (téléchargements: {downloads}, stats: {stats})")
+        return False
+
+    print(f"✅ 1 téléchargement pour 2 lectures, {stats['cache_bytes']} octets en cache")
+    return True
+
+def test_prefetch_concurrent(base_url, cache_dir):
+    """Le prefetch tourne pendant le reste du traitement et n'est pas dupliqué"""
+    print("\n⚡ Test prefetch concurrent...")
+
+    resolver = make_resolver(base_url, cache_dir)
+    FakeGraphAPI.requests_count.clear()
+
+    start = time.time()
+    resolver.prefetch("1002")
+    resolver.prefetch("1002")
+    # Simule le chargement utilisateur et la classification pendant le téléchargement
+    time.sleep(FakeGraphAPI.delay)
+    data = resolver.get("1002")
+    elapsed = time.time() - start
+    resolver.shutdown()
+
+    downloads = FakeGraphAPI.requests_count.get("/download/1002", 0)
+    if data != MEDIA["1002"] or downloads != 1:
+        print(f"❌ Prefetch incorrect (téléchargements: {downloads})")
+        return False
+
+    # Séquentiel : délai simulé + téléchargement ; en parallèle : à peine plus que le plus long des deux
+    if elapsed > FakeGraphAPI.delay * 1.8:
+        print(f"❌ Téléchargement non parallélisé ({elapsed * 1000:.0f} ms)")
+        return False
+
+    print(f"✅ 1 téléchargement pour 2 prefetch + 1 lecture, {elapsed * 1000:.0f} ms au total")
+    return True
+
+def test_errors(base_url, cache_dir):
+    """media_id inconnu ou token refusé : None, sans exception"""
+    print("\n🚫 Test des erreurs...")
+
+    from media_resolver import MediaResolver
+
+    resolver = make_resolver(base_url, cache_dir)
+    unknown = resolver.get("9999")
+    bad_token = MediaResolver(access_token="mauvais", base_url=base_url, cache_dir=cache_dir).get("1003")
+    errors = resolver.stats()["errors"]
+    resolver.shutdown()
+
+    if unknown is not None or bad_token is not None or errors != 1:
+        print("❌ Une erreur n'a pas été gérée")
+        return False
+
+    print("✅ Média inconnu et token refusé -> None")
+    return True
+
+def test_lru_eviction(base_url, cache_dir):
+    """Le cache disque reste sous sa taille max en supprimant le moins récemment utilisé"""
+    print("\n🧹 Test éviction LRU...")
+
+    size = len(MEDIA["1001"])
+    resolver = make_resolver(base_url, cache_dir, max_bytes=int(size * 2.5))
+
+    resolver.get("1001")
+    time.sleep(0.05)
+    resolver.get("1002")
+    time.sleep(0.05)
+    # Relire 1001 : 1002 devient le moins récemment utilisé
+    resolver.get("1001")
+    time.sleep(0.05)
+    resolver.get("1003")
+
+    cached = {media_id for media_id in MEDIA if os.path.exists(resolver._cache_path(media_id))}
+    stats = resolver.stats()
+    resolver.shutdown()
+
+    if cached != {"1001", "1003"} or stats["cache_bytes"] > resolver.max_bytes:
+        print(f"❌ Éviction incorrecte: {sorted(cached)} ({stats['cache_bytes']} octets)")
+        return False
+
+    print(f"✅ 1002 évincé, {stats['cache_bytes']}/{resolver.max_bytes} octets")
+    return True
+
+def main():
+    """Fonction principale de test"""
+    print("🧪 TEST RÉSOLUTION DES MÉDIAS WHATSAPP BUSINESS")
+    print("=" * 50)
+
+    server, base_url = start_server()
+    tests_results = []
+
+    def run(name, test, *args):
+        # Cache disque vide pour chaque test
+        cache_dir = tempfile.mkdtemp(prefix="lea-media-test-")
+        try:
+            tests_results.append((name, test(*args, cache_dir) if args else test()))
+        finally:
+            shutil.rmtree(cache_dir, ignore_errors=True)
+
+    run("Parser webhook", test_webhook_parser)
+    run("Résolution + cache", test_resolve_and_cache, base_url)
+    run("Prefetch concurrent", test_prefetch_concurrent, base_url)
+    run("Erreurs", test_errors, base_url)
+    run("Éviction LRU", test_lru_eviction, base_url)
+
+    server.shutdown()
+
+    # Résumé des tests
+    print("\n" + "=" * 50)
+    print("📊 RÉSUMÉ DES TESTS")
+    print("=" * 50)
+
+    passed = 0
+    total = len(tests_results)
+
+    for test_name, result in tests_results:
+        status = "✅ PASS" if result else "❌ FAIL"
+        print(f"{test_name:<25} {status}")
+        if result:
+            passed += 1
+
+    print(f"\n🎯 Résultat: {passed}/{total} tests réussis")
+    return passed == total
+
+if __name__ == "__main__":
+    success = main()
+    sys.exit(0 if success else 1)
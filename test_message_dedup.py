@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""
+Script de test pour la déduplication des webhooks (message_dedup)
+Vérifie qu'un rejeu est filtré, y compris après un redémarrage du processus
+"""
+
+import os
+import sys
+import shutil
+import tempfile
+
+# Ajouter le répertoire courant au path pour les imports
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+def make_deduplicator(db_path, **kwargs):
+    from database import init_db
+    from message_dedup import MessageDeduplicator
+
+    init_db(db_path)
+    return MessageDeduplicator(db_path=db_path, **kwargs)
+
+def test_duplicate_after_restart(db_path):
+    """Même identifiant : filtré en mémoire, puis par la base après redémarrage (nouvelle instance)"""
+    print("🔁 Test rejeu après redémarrage...")
+
+    dedup = make_deduplicator(db_path)
+    first, replay = dedup.first_seen("wamid.1"), dedup.first_seen("wamid.1")
+
+    restarted = make_deduplicator(db_path)
+    after_restart = restarted.first_seen("wamid.1")
+    other = restarted.first_seen("wamid.2")
+
+    if (first, replay, after_restart, other) != (True, False, False, True):
+        print(f"❌ Résultats inattendus: {first}, {replay}, {after_restart}, {other}")
+        return False
+
+    if restarted.stats()["duplicates_db"] != 1:
+        print(f"❌ Rejeu non filtré par la base: {restarted.stats()}")
+        return False
+
+    print("✅ Rejeu filtré avant et après redémarrage")
+    return True
+
+def test_forget_and_expiry(db_path):
+    """Identifiant oublié (message non mis en file) ou expiré : le rejeu est de nouveau accepté"""
+    print("\n🗑️ Test oubli et expiration...")
+
+    dedup = make_deduplicator(db_path)
+    dedup.first_seen("wamid.1")
+    dedup.forget("wamid.1")
+    forgotten = dedup.first_seen("wamid.1")
+
+    expiring = make_deduplicator(db_path, ttl_seconds=-1)
+    expiring.first_seen("wamid.2")
+    expired = make_deduplicator(db_path, ttl_seconds=-1).first_seen("wamid.2")
+
+    if not forgotten or not expired:
+        print(f"❌ Rejeu refusé: oublié={forgotten}, expiré={expired}")
+        return False
+
+    print("✅ Identifiants oubliés ou expirés de nouveau acceptés")
+    return True
+
+def main():
+    """Fonction principale de test"""
+    print("🧪 TEST DÉDUPLICATION DES WEBHOOKS")
+    print("=" * 50)
+
+    tests_results = []
+
+    def run(name, test):
+        # Base vide pour chaque test
+        tmp_dir = tempfile.mkdtemp(prefix="lea-dedup-test-")
+        try:
+            tests_results.append((name, test(os.path.join(tmp_dir, "test.db"))))
+        finally:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    run("Rejeu après redémarrage", test_duplicate_after_restart)
+    run("Oubli et expiration", test_forget_and_expiry)
+
+    # Résumé des tests
+    print("\n" + "=" * 50)
+    print("📊 RÉSUMÉ DES TESTS")
+    print("=" * 50)
+
+    passed = 0
+    total = len(tests_results)
+
+    for test_name, result in tests_results:
+        status = "✅ PASS" if result else "❌ FAIL"
+        print(f"{test_name:<25} {status}")
+        if result:
+            passed += 1
+
+    print(f"\n🎯 Résultat: {passed}/{total} tests réussis")
+    return passed == total
+
+if __name__ == "__main__":
+    success = main()
+    sys.exit(0 if success else 1)
@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+"""
+Script de test pour la file persistante des messages entrants (message_workers)
+Vérifie l'ordre par utilisateur, la reprise des jobs abandonnés et les réponses déjà envoyées
+"""
+
+import os
+import sys
+import time
+import shutil
+import tempfile
+
+# Ajouter le répertoire courant au path pour les imports
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+PHONE = "+41774184918"
+OTHER_PHONE = "+41790000000"
+
+def make_queue(db_path):
+    from database import init_db
+    init_db(db_path)
+
+def test_per_phone_order(db_path):
+    """Un job plus ancien du même numéro, en attente ou en cours, bloque le suivant"""
+    print("📬 Test ordre par utilisateur...")
+
+    from message_workers import enqueue_job, claim_job, complete_job, retry_job
+
+    make_queue(db_path)
+    first = enqueue_job(PHONE, {"body": "1"}, db_path=db_path)
+    second = enqueue_job(PHONE, {"body": "2"}, db_path=db_path)
+    other = enqueue_job(OTHER_PHONE, {"body": "autre"}, db_path=db_path)
+
+    claimed = [claim_job(60, db_path=db_path)["id"], claim_job(60, db_path=db_path)["id"]]
+    if claimed != [first, other] or claim_job(60, db_path=db_path) is not None:
+        print(f"❌ Jobs réclamés: {claimed} (attendu {[first, other]}, puis rien)")
+        return False
+
+    # Le premier job replanifié (en attente) bloque toujours le second
+    retry_job(first, 1, "erreur", 3600, db_path=db_path)
+    if claim_job(60, db_path=db_path) is not None:
+        print("❌ Job plus récent réclamé alors que le précédent est replanifié")
+        return False
+
+    complete_job(first, db_path=db_path)
+    job = claim_job(60, db_path=db_path)
+    if not job or job["id"] != second:
+        print(f"❌ Second job non réclamé après le premier: {job}")
+        return False
+
+    print("✅ Messages d'un même numéro traités dans l'ordre, autres numéros en parallèle")
+    return True
+
+def test_expired_lease(db_path):
+    """Worker disparu : le job est repris après expiration du bail, pas avant"""
+    print("\n⏱️ Test reprise après bail expiré...")
+
+    from message_workers import enqueue_job, claim_job
+
+    make_queue(db_path)
+    job_id = enqueue_job(PHONE, {"body": "photo"}, db_path=db_path)
+
+    claim_job(0.2, db_path=db_path)
+    if claim_job(0.2, db_path=db_path) is not None:
+        print("❌ Job repris alors que son bail est valide")
+        return False
+
+    time.sleep(0.3)
+    job = claim_job(60, db_path=db_path)
+    if not job or job["id"] != job_id or job["attempts"] != 2:
+        print(f"❌ Job non repris après expiration: {job}")
+        return False
+
+    print(f"✅ Job {job_id} repris (tentative {job['attempts']})")
+    return True
+
+def test_retry_skips_sent_replies(db_path):
+    """Nouvelle tentative : les réponses déjà envoyées ne repartent pas, une réponse nouvelle si"""
+    print("\n↩️ Test réponses déjà envoyées...")
+
+    import utils
+    from message_workers import enqueue_job, claim_job, update_job_payload
+
+    make_queue(db_path)
+    job_id = enqueue_job(PHONE, {"body": "2 oeufs"}, db_path=db_path)
+    sent = []
+    send = utils._send_whatsapp_reply
+    utils._send_whatsapp_reply = lambda to, message, *args: sent.append(message)
+
+    def attempt(replies):
+        # Bail déjà expiré : la tentative suivante reprend le job (worker disparu)
+        job = claim_job(-1, db_path=db_path)
+        record = lambda keys: update_job_payload(job_id, {"replies_sent": keys}, db_path=db_path)
+        with utils.reply_journal(job["payload"].get("replies_sent") or (), record):
+            for reply in replies:
+                utils.send_whatsapp_reply(PHONE, reply)
+
+    try:
+        attempt(["⏳ Analyse en cours...", "✅ Repas enregistré"])
+        # Autre chemin à la seconde tentative : "Analyse" répété, puis une réponse nouvelle
+        attempt(["⏳ Analyse en cours...", "⏳ Analyse en cours...", "✅ Repas enregistré", "📊 Total du jour"])
+    finally:
+        utils._send_whatsapp_reply = send
+
+    expected = ["⏳ Analyse en cours...", "✅ Repas enregistré", "⏳ Analyse en cours...", "📊 Total du jour"]
+    if sent != expected:
+        print(f"❌ Réponses envoyées: {sent}")
+        return False
+
+    print(f"✅ {len(sent)} réponses envoyées pour 6 demandées sur 2 tentatives")
+    return True
+
+def main():
+    """Fonction principale de test"""
+    print("🧪 TEST FILE DES MESSAGES ENTRANTS")
+    print("=" * 50)
+
+    tests_results = []
+
+    def run(name, test):
+        # Base vide pour chaque test
+        tmp_dir = tempfile.mkdtemp(prefix="lea-queue-test-")
+        try:
+            tests_results.append((name, test(os.path.join(tmp_dir, "test.db"))))
+        finally:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    run("Ordre par utilisateur", test_per_phone_order)
+    run("Bail expiré", test_expired_lease)
+    run("Réponses déjà envoyées", test_retry_skips_sent_replies)
+
+    # Résumé des tests
+    print("\n" + "=" * 50)
+    print("📊 RÉSUMÉ DES TESTS")
+    print("=" * 50)
+
+    passed = 0
+    total = len(tests_results)
+
+    for test_name, result in tests_results:
+        status = "✅ PASS" if result else "❌ FAIL"
+        print(f"{test_name:<25} {status}")
+        if result:
+            passed += 1
+
+    print(f"\n🎯 Résultat: {passed}/{total} tests réussis")
+    return passed == total
+
+if __name__ == "__main__":
+    success = main()
+    sys.exit(0 if success else 1)
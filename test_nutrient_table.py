@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+"""
+Script de test pour la table nutritionnelle compilée (nutrients.bin)
+Vérifie qu'un fichier tronqué ou corrompu est refusé et que l'analyse continue sans la table
+"""
+
+import os
+import sys
+import shutil
+import tempfile
+
+# Ajouter le répertoire courant au path pour les imports
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+ENTRIES = [
+    ("quinoa cuit", {"cal": 120, "prot": 4.4, "fat": 1.9, "carb": 21.3}),
+    ("tofu", {"cal": 76, "prot": 8, "fat": 4.8, "carb": 1.9}),
+    ("lentilles corail", {"cal": 116, "prot": 9, "fat": 0.4, "carb": 20}),
+]
+
+def test_valid_table(tmp_dir):
+    """Table complète : lecture normale"""
+    print("📦 Test table valide...")
+
+    from nutrient_table import build_table, NutrientTable
+
+    path = os.path.join(tmp_dir, "nutrients.bin")
+    build_table(ENTRIES, path)
+    table = NutrientTable(path)
+    values = table.get("tofu")
+    table.close()
+
+    if not values or values["prot"] != 8:
+        print(f"❌ Valeurs inattendues: {values}")
+        return False
+
+    print(f"✅ tofu = {values}")
+    return True
+
+def test_truncated_tables(tmp_dir):
+    """Fichier coupé à toutes les longueurs possibles : ValueError, jamais struct.error / TypeError"""
+    print("\n✂️ Test tables tronquées...")
+
+    from nutrient_table import build_table, NutrientTable
+
+    path = os.path.join(tmp_dir, "nutrients.bin")
+    build_table(ENTRIES, path)
+    with open(path, "rb") as f:
+        data = f.read()
+
+    truncated = os.path.join(tmp_dir, "truncated.bin")
+    for length in range(1, len(data)):
+        with open(truncated, "wb") as f:
+            f.write(data[:length])
+        try:
+            NutrientTable(truncated)
+        except ValueError:
+            continue
+        except Exception as e:
+            print(f"❌ {length} octets: {type(e).__name__}: {e}")
+            return False
+        print(f"❌ {length} octets: fichier tronqué accepté")
+        return False
+
+    print(f"✅ {len(data) - 1} longueurs tronquées refusées proprement")
+    return True
+
+def test_fallback_without_table(tmp_dir):
+    """get_nutrient_table sur un fichier tronqué : None, et resolve_food continue avec la base en mémoire"""
+    print("\n🛟 Test repli sans table...")
+
+    import nutrient_table
+    from nutrient_table import build_table
+    from nutrition_database import resolve_food
+
+    path = os.path.join(tmp_dir, "nutrients.bin")
+    build_table(ENTRIES, path)
+    with open(path, "rb") as f:
+        data = f.read()
+    with open(path, "wb") as f:
+        f.write(data[:len(data) // 2])
+
+    nutrient_table.NUTRIENT_TABLE_PATH = path
+    nutrient_table._table, nutrient_table._table_loaded = None, False
+
+    try:
+        table = nutrient_table.get_nutrient_table()
+        key, values = resolve_food("poulet")
+    except Exception as e:
+        print(f"❌ Erreur non gérée: {type(e).__name__}: {e}")
+        return False
+
+    if table is not None or key is None:
+        print(f"❌ Repli incorrect: table={table}, poulet -> {key}")
+        return False
+
+    print(f"✅ Table ignorée, poulet -> {key}")
+    return True
+
+def main():
+    """Fonction principale de test"""
+    print("🧪 TEST TABLE NUTRITIONNELLE COMPILÉE")
+    print("=" * 50)
+
+    tests_results = []
+
+    def run(name, test):
+        tmp_dir = tempfile.mkdtemp(prefix="lea-nutrient-table-test-")
+        try:
+            tests_results.append((name, test(tmp_dir)))
+        finally:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    run("Table valide", test_valid_table)
+    run("Tables tronquées", test_truncated_tables)
+    run("Repli sans table", test_fallback_without_table)
+
+    # Résumé des tests
+    print("\n" + "=" * 50)
+    print("📊 RÉSUMÉ DES TESTS")
+    print("=" * 50)
+
+    passed = 0
+    total = len(tests_results)
+
+    for test_name, result in tests_results:
+        status = "✅ PASS" if result else "❌ FAIL"
+        print(f"{test_name:<25} {status}")
+        if result:
+            passed += 1
+
+    print(f"\n🎯 Résultat: {passed}/{total} tests réussis")
+    return passed == total
+
+if __name__ == "__main__":
+    success = main()
+    sys.exit(0 if success else 1)
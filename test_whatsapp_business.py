@@ -101,6 +101,59 @@ def test_webhook_parser():
         print(f"❌ Erreur parser webhook: {e}")
         return False
 
+def test_webhook_parser_batch():
+    """Teste le parsing d'un lot Meta (plusieurs entries, changes et messages)"""
+    print("\n📦 Test du parser webhook (lot de messages)...")
+    
+    def text_message(message_id, from_number, body):
+        return {"id": message_id, "from": from_number, "timestamp": "1704722400", "type": "text", "text": {"body": body}}
+    
+    test_payload = {
+        "entry": [
+            {"changes": [
+                {"value": {
+                    "messages": [
+                        text_message("wamid.1", "41770000001", "100g riz"),
+                        text_message("wamid.2", "41770000002", "Une pomme")
+                    ],
+                    "contacts": [
+                        {"wa_id": "41770000001", "profile": {"name": "Alice"}},
+                        {"wa_id": "41770000002", "profile": {"name": "Bob"}}
+                    ]
+                }},
+                {"value": {"statuses": [{"id": "wamid.0", "status": "delivered"}]}}
+            ]},
+            {"changes": [
+                {"value": {"messages": [text_message("wamid.3", "41770000001", "150g poulet")]}}
+            ]}
+        ]
+    }
+    
+    try:
+        from whatsapp_business_api import iter_whatsapp_business_messages, parse_whatsapp_business_webhook
+        
+        messages = list(iter_whatsapp_business_messages(test_payload))
+        ids = [message.get('message_id') for message in messages]
+        
+        if ids != ["wamid.1", "wamid.2", "wamid.3"]:
+            print(f"❌ Messages du lot incorrects: {ids}")
+            return False
+        
+        if messages[1].get('profile_name') != "Bob":
+            print(f"❌ Contact mal associé: {messages[1].get('profile_name')}")
+            return False
+        
+        if parse_whatsapp_business_webhook(test_payload).get('message_id') != "wamid.1":
+            print("❌ parse_whatsapp_business_webhook ne retourne pas le premier message")
+            return False
+        
+        print(f"✅ {len(messages)} messages extraits dans l'ordre: {', '.join(ids)}")
+        return True
+        
+    except Exception as e:
+        print(f"❌ Erreur parser webhook (lot): {e}")
+        return False
+
 def test_send_message(client, test_number=None):
     """Teste l'envoi d'un message"""
     print("\n📤 Test d'envoi de message...")
@@ -193,6 +246,7 @@ def main():
     
     # Test 3: Parser webhook
     tests_results.append(("Parser webhook", test_webhook_parser()))
+    tests_results.append(("Parser webhook (lot)", test_webhook_parser_batch()))
     
     # Test 4: Fonction hybride
     tests_results.append(("Fonction hybride", test_hybrid_function()))
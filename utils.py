@@ -1,19 +1,30 @@
-import requests
+import http_client
+from llm_client import llm_client
 import tempfile
+import hashlib
 import os
+import threading
+from contextlib import contextmanager
 from datetime import date, datetime
 
+# Réponses du message en cours de traitement (job de la file persistante)
+_reply_journal = threading.local()
+
 def transcribe_audio(audio_url, account_sid, auth_token, api_key):
     """Transcrit un message audio avec Whisper"""
     try:
-        # Télécharger l'audio
-        response = requests.get(audio_url, auth=(account_sid, auth_token))
-        if response.status_code != 200:
+        # Télécharger l'audio (en flux, taille et type de contenu vérifiés)
+        try:
+            audio_bytes = http_client.download(
+                audio_url, content_types=('audio/', 'application/ogg'), auth=(account_sid, auth_token)
+            )
+        except http_client.MediaDownloadError as e:
+            print(f"⚠️ Audio refusé: {e}")
             return None
         
         # Sauvegarder temporairement
         with tempfile.NamedTemporaryFile(suffix='.ogg', delete=False) as tmp_file:
-            tmp_file.write(response.content)
+            tmp_file.write(audio_bytes)
             tmp_path = tmp_file.name
         
         # Transcrire
@@ -26,7 +37,7 @@ def transcribe_audio(audio_url, account_sid, auth_token, api_key):
                 'language': (None, 'fr')
             }
             
-            response = requests.post(
+            response = http_client.post(
                 "https://api.openai.com/v1/audio/transcriptions",
                 headers=headers, files=files
             )
@@ -42,6 +53,26 @@ def transcribe_audio(audio_url, account_sid, auth_token, api_key):
         print(f"❌ Erreur transcription: {e}")
         return None
 
+def reply_key(to, message, occurrence=1):
+    """Clé d'une réponse : destinataire + contenu (hash), et rang si le même texte part plusieurs fois"""
+    digest = hashlib.sha1(f"{to}\n{message}".encode('utf-8')).hexdigest()[:16]
+    return f"{digest}:{occurrence}"
+
+@contextmanager
+def reply_journal(already_sent=(), on_sent=None):
+    """
+    Pendant le bloc, chaque réponse envoyée dans ce thread est identifiée par reply_key.
+    Une réponse dont la clé est dans already_sent (envoyée par une tentative précédente du
+    même job) n'est pas renvoyée ; une réponse différente part normalement, même si la
+    nouvelle tentative a pris un autre chemin. on_sent(liste des clés envoyées) est appelé
+    après chaque nouvel envoi.
+    """
+    _reply_journal.current = {'sent': list(already_sent), 'occurrences': {}, 'on_sent': on_sent}
+    try:
+        yield
+    finally:
+        _reply_journal.current = None
+
 def send_whatsapp_reply(to, message, twilio_client=None, twilio_phone_number=None):
     """
     Envoie un message WhatsApp via Twilio ou WhatsApp Business API selon la configuration
@@ -52,6 +83,23 @@ def send_whatsapp_reply(to, message, twilio_client=None, twilio_phone_number=Non
         twilio_client: Client Twilio (optionnel, pour compatibilité)
         twilio_phone_number: Numéro Twilio (optionnel, pour compatibilité)
     """
+    journal = getattr(_reply_journal, 'current', None)
+    if journal is None:
+        return _send_whatsapp_reply(to, message, twilio_client, twilio_phone_number)
+    
+    occurrence = journal['occurrences'][(to, message)] = journal['occurrences'].get((to, message), 0) + 1
+    key = reply_key(to, message, occurrence)
+    if key in journal['sent']:
+        # Nouvelle tentative d'un job : cette réponse est déjà partie
+        print(f"↩️ Réponse déjà envoyée, non renvoyée ({key})")
+        return
+    
+    _send_whatsapp_reply(to, message, twilio_client, twilio_phone_number)
+    journal['sent'].append(key)
+    if journal['on_sent']:
+        journal['on_sent'](list(journal['sent']))
+
+def _send_whatsapp_reply(to, message, twilio_client=None, twilio_phone_number=None):
     from config import current_config
     
     # Vérifier si WhatsApp Business API est activé
@@ -119,11 +167,6 @@ def chat_with_lea(question, user, api_key):
     try:
         context = f"Utilisateur nutrition"
         
-        headers = {
-            "Content-Type": "application/json",
-            "Authorization": f"Bearer {api_key}"
-        }
-        
         payload = {
             "model": "gpt-4o-mini",
             "messages": [
@@ -137,8 +180,7 @@ def chat_with_lea(question, user, api_key):
             "temperature": 0.7
         }
         
-        response = requests.post("https://api.openai.com/v1/chat/completions", 
-                               headers=headers, json=payload)
+        response = llm_client.chat_completion(payload, api_key)
         
         if response.status_code == 200:
             return response.json()['choices'][0]['message']['content']
@@ -1,8 +1,9 @@
-import requests
+import http_client
 import json
 import logging
-from typing import Dict, Any, Optional
+from typing import Dict, Any, Iterator, List, Optional
 from config import current_config
+from media_resolver import media_reference
 
 logger = logging.getLogger(__name__)
 
@@ -47,7 +48,7 @@ class WhatsAppBusinessAPI:
             }
             
             # Envoyer la requête
-            response = requests.post(
+            response = http_client.post(
                 f"{self.base_url}/messages",
                 headers=self.headers,
                 json=payload,
@@ -97,7 +98,7 @@ class WhatsAppBusinessAPI:
             if caption and media_type in ["image", "video", "document"]:
                 payload[media_type]["caption"] = caption
             
-            response = requests.post(
+            response = http_client.post(
                 f"{self.base_url}/messages",
                 headers=self.headers,
                 json=payload,
@@ -134,7 +135,7 @@ class WhatsAppBusinessAPI:
                 "message_id": message_id
             }
             
-            response = requests.post(
+            response = http_client.post(
                 f"{self.base_url}/messages",
                 headers=self.headers,
                 json=payload,
@@ -147,6 +148,82 @@ class WhatsAppBusinessAPI:
             logger.error(f"❌ Erreur marquage lu: {e}")
             return False
 
+def _parse_message(message: Dict[str, Any], contacts: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Extrait les informations d'un message Meta (et du contact qui l'a envoyé)"""
+    # Contact correspondant à l'expéditeur (wa_id), sinon le premier du lot
+    contact = next(
+        (c for c in contacts if c.get("wa_id") == message.get("from")),
+        contacts[0] if contacts else {}
+    )
+    
+    # Extraire les informations du message
+    message_data = {
+        "message_id": message.get("id"),
+        "from_number": message.get("from"),
+        "timestamp": message.get("timestamp"),
+        "type": message.get("type"),
+        "profile_name": contact.get("profile", {}).get("name", ""),
+    }
+    
+    # Contenu selon le type de message
+    # (les médias n'ont pas de lien, seulement un media_id résolu par media_resolver via la Graph API)
+    if message["type"] == "text":
+        message_data["text"] = message.get("text", {}).get("body", "")
+    
+    elif message["type"] == "image":
+        image = message.get("image", {})
+        message_data["media_id"] = image.get("id")
+        message_data["media_url"] = media_reference(image.get("id"))
+        message_data["caption"] = image.get("caption", "")
+        message_data["mime_type"] = image.get("mime_type")
+    
+    elif message["type"] == "audio":
+        audio = message.get("audio", {})
+        message_data["media_id"] = audio.get("id")
+        message_data["media_url"] = media_reference(audio.get("id"))
+        message_data["mime_type"] = audio.get("mime_type")
+    
+    elif message["type"] == "video":
+        video = message.get("video", {})
+        message_data["media_id"] = video.get("id")
+        message_data["media_url"] = media_reference(video.get("id"))
+        message_data["caption"] = video.get("caption", "")
+        message_data["mime_type"] = video.get("mime_type")
+    
+    elif message["type"] == "document":
+        document = message.get("document", {})
+        message_data["media_id"] = document.get("id")
+        message_data["media_url"] = media_reference(document.get("id"))
+        message_data["filename"] = document.get("filename")
+        message_data["mime_type"] = document.get("mime_type")
+    
+    return message_data
+
+def iter_whatsapp_business_messages(payload: Dict[str, Any]) -> Iterator[Dict[str, Any]]:
+    """
+    Parcourt tous les messages d'un payload webhook WhatsApp Business API
+    
+    Meta regroupe plusieurs messages (et plusieurs entries/changes) dans un même POST
+    quand le trafic est élevé : chaque message est produit dans l'ordre du payload.
+    Un message mal formé est ignoré sans interrompre les suivants.
+    
+    Args:
+        payload: Payload JSON du webhook Meta
+        
+    Yields:
+        Dict avec les informations de chaque message
+    """
+    for entry in payload.get("entry") or []:
+        for change in entry.get("changes") or []:
+            value = change.get("value") or {}
+            contacts = value.get("contacts") or []
+            
+            for message in value.get("messages") or []:
+                try:
+                    yield _parse_message(message, contacts)
+                except Exception as e:
+                    logger.error(f"❌ Erreur parsing message WhatsApp Business: {e}")
+
 def parse_whatsapp_business_webhook(payload: Dict[str, Any]) -> Optional[Dict[str, Any]]:
     """
     Parse le payload webhook de WhatsApp Business API
@@ -155,69 +232,11 @@ def parse_whatsapp_business_webhook(payload: Dict[str, Any]) -> Optional[Dict[st
         payload: Payload JSON du webhook Meta
         
     Returns:
-        Dict avec les informations du message ou None si pas un message
+        Dict avec les informations du premier message ou None si pas un message
+        (voir iter_whatsapp_business_messages pour tous les messages du lot)
     """
     try:
-        # Structure du webhook Meta WhatsApp Business
-        entry = payload.get("entry", [])
-        if not entry:
-            return None
-        
-        changes = entry[0].get("changes", [])
-        if not changes:
-            return None
-        
-        value = changes[0].get("value", {})
-        messages = value.get("messages", [])
-        
-        if not messages:
-            return None
-        
-        message = messages[0]
-        contacts = value.get("contacts", [{}])
-        contact = contacts[0] if contacts else {}
-        
-        # Extraire les informations du message
-        message_data = {
-            "message_id": message.get("id"),
-            "from_number": message.get("from"),
-            "timestamp": message.get("timestamp"),
-            "type": message.get("type"),
-            "profile_name": contact.get("profile", {}).get("name", ""),
-        }
-        
-        # Contenu selon le type de message
-        if message["type"] == "text":
-            message_data["text"] = message.get("text", {}).get("body", "")
-        
-        elif message["type"] == "image":
-            image = message.get("image", {})
-            message_data["media_id"] = image.get("id")
-            message_data["media_url"] = image.get("link")
-            message_data["caption"] = image.get("caption", "")
-            message_data["mime_type"] = image.get("mime_type")
-        
-        elif message["type"] == "audio":
-            audio = message.get("audio", {})
-            message_data["media_id"] = audio.get("id")
-            message_data["media_url"] = audio.get("link")
-            message_data["mime_type"] = audio.get("mime_type")
-        
-        elif message["type"] == "video":
-            video = message.get("video", {})
-            message_data["media_id"] = video.get("id")
-            message_data["media_url"] = video.get("link")
-            message_data["caption"] = video.get("caption", "")
-            message_data["mime_type"] = video.get("mime_type")
-        
-        elif message["type"] == "document":
-            document = message.get("document", {})
-            message_data["media_id"] = document.get("id")
-            message_data["media_url"] = document.get("link")
-            message_data["filename"] = document.get("filename")
-            message_data["mime_type"] = document.get("mime_type")
-        
-        return message_data
+        return next(iter_whatsapp_business_messages(payload), None)
         
     except Exception as e:
         logger.error(f"❌ Erreur parsing webhook WhatsApp Business: {e}")
@@ -268,8 +287,8 @@ def send_whatsapp_business_reply(to: str, message: str) -> bool:
         bool: True si envoyé avec succès
     """
     try:
-        api = WhatsAppBusinessAPI()
-        return api.send_text_message(to, message)
+        # Client partagé : même session HTTP keep-alive pour tous les envois
+        return whatsapp_business_client.send_text_message(to, message)
     except Exception as e:
         logger.error(f"❌ Erreur envoi WhatsApp Business reply: {e}")
         return False